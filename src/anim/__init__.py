@@ -3,11 +3,34 @@
 from importlib import metadata
 
 from anim import log  # noqa: F401
-from anim.anim import animate  # noqa: F401
-from anim.tools import video2gif  # noqa: F401
 
 __version__ = metadata.version(__package__)
 __author__ = """LudwigVonKoopa"""
 __email__ = "49512274+ludwigVonKoopa@users.noreply.github.com"
 
 del metadata
+
+# heavy modules (dask, matplotlib, xarray, ...) are only imported when first used,
+# so `import anim` and `anim --help` stay fast
+_lazy_attributes = {
+    "animate": "anim.anim",
+    "animate_async": "anim.anim",
+    "video2gif": "anim.tools",
+    "figure": "anim.render",
+    "subplots": "anim.render",
+    "mark_static": "anim.layers",
+}
+
+
+def __getattr__(name):
+    if name in _lazy_attributes:
+        import importlib
+
+        value = getattr(importlib.import_module(_lazy_attributes[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_attributes))
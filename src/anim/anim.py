@@ -1,37 +1,76 @@
+import asyncio
+import contextlib
+import inspect
 import logging
 import multiprocessing
 import os
+import shutil
+import threading
+import time
 import warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import matplotlib
 import matplotlib.pyplot as plt
-from dask.distributed import Client, LocalCluster, as_completed
-
-from anim.data import AnimationInfo, Stats, StatStorage, dump_data, load_data
-from anim.tools import Timing, _sanitize_inputs, image_patern, images2video
+import numpy as np
+from dask.distributed import Client, LocalCluster, UploadFile, WorkerPlugin, as_completed
+
+from anim.compute_cache import ComputeCache
+from anim.data import AnimationInfo, Progress, RecyclingPolicy, Stats, StatStorage, load_data, load_frame_costs
+from anim.layers import has_static_layer, render_layers, save_layers, supported_savefig_kwargs
+from anim.render import is_pyplot_figure, to_rgba
+from anim.segments import segments2video
+from anim.source import DataSource, Selection
+from anim.store import FrameStore, store2video, store_preview
+from anim.tools import (
+    Prefetch,
+    Timing,
+    _sanitize_inputs,
+    image_patern,
+    images2video,
+    preview_video,
+    rss,
+    stratum,
+    worker_address,
+)
+from anim.transport import CacheTransport, DeltaTransport, KeyframeTransport, SourceTransport, build_transport
+from anim.tuning import calibration_size, choose_layout
 
 logger = logging.getLogger(__name__)
 
 
+class WorkerSetup(WorkerPlugin):
+    """setup of the process of each worker, once, as warnings filters are shared by all threads of a worker"""
+
+    def setup(self, worker):
+        # figures are built outside of the main thread of workers
+        warnings.filterwarnings(
+            action="ignore", message="Starting a Matplotlib GUI outside of the main thread will likely fail"
+        )
+
+
 def process(i, data, f_plot, animationInfo: AnimationInfo):
     """function started on every worker, for each image"""
 
-    img_name = animationInfo.imagePatern % i
+    i_image = i // animationInfo.stride
+    img_name = animationInfo.imagePatern % i_image
     stats = Stats(img_name=img_name)
+    frameStore = animationInfo.frameStore
     if animationInfo.checkIfImageExist:
-        if os.path.exists(img_name):
-            return stats
+        if frameStore.is_done(i_image) if frameStore is not None else os.path.exists(img_name):
+            return None, stats
+
+    stats.worker = worker_address()
+    stats.rss_before = rss()
 
     ds, stat = load_data(data)
     stats |= stat
 
-    with warnings.catch_warnings():
-        warnings.filterwarnings(
-            action="ignore", message="Starting a Matplotlib GUI outside of the main thread will likely fail"
-        )
-        with Timing() as timer:
-            fig = f_plot(i, ds)
+    with Timing() as timer:
+        fig = f_plot(i, ds)
     stats.img_building = timer.dt
+    stats.pyplot_figure = float(is_pyplot_figure(fig)) if isinstance(fig, matplotlib.figure.Figure) else np.nan
 
     if fig is None:
         raise Exception("plot function did not return anything. It should return a matplotlib Figure")
@@ -39,12 +78,32 @@ def process(i, data, f_plot, animationInfo: AnimationInfo):
     if not isinstance(fig, matplotlib.figure.Figure):
         raise Exception(f"plot function did not return a matplotlib.figure.Figure, but  '{type(fig)}'")
 
+    if animationInfo.threads > 1 and is_pyplot_figure(fig):
+        _warn_pyplot_threads()
+
     if animationInfo.onlyCompute:
         return fig, stats
 
+    use_layers = has_static_layer(fig)
+    if use_layers and not set(animationInfo.savefig_kwargs).issubset(supported_savefig_kwargs):
+        _warn_layers_savefig_kwargs(animationInfo.savefig_kwargs)
+        use_layers = False
+
     try:
         with Timing() as timer:
-            fig.savefig(img_name, **animationInfo.savefig_kwargs)  # enregistre l'image
+            if frameStore is not None:
+                dpi = animationInfo.savefig_kwargs.get("dpi", "figure")
+                if use_layers:
+                    img, hit = render_layers(fig, animationInfo.layer_cache, dpi)
+                    stats.static_layer_hit = float(hit)
+                else:
+                    img = to_rgba(fig, dpi)
+                frameStore.write(i_image, img)
+            elif use_layers:
+                hit = save_layers(fig, img_name, animationInfo.layer_cache, **animationInfo.savefig_kwargs)
+                stats.static_layer_hit = float(hit)
+            else:
+                fig.savefig(img_name, **animationInfo.savefig_kwargs)  # enregistre l'image
     except FileNotFoundError as err:
         logger.error(f"problem when saving {img_name}")
         raise err
@@ -67,15 +126,260 @@ def process(i, data, f_plot, animationInfo: AnimationInfo):
     except Exception:
         pass
 
-    # delete matplotlib figure
-    plt.close(fig)
+    # delete matplotlib figure (figures built without pyplot are just garbage collected)
+    if is_pyplot_figure(fig):
+        plt.close(fig)
+    stats.rss_after = rss()
     return None, stats
 
 
+_pyplot_threads_warned = False
+
+
+def _warn_pyplot_threads():
+    global _pyplot_threads_warned
+    if not _pyplot_threads_warned:
+        _pyplot_threads_warned = True
+        logger.warning(
+            "plot function returned a pyplot figure while using several threads by worker. "
+            "pyplot is not thread safe : please build figures with `anim.figure` or `anim.subplots`"
+        )
+
+
+_layers_savefig_kwargs_warned = False
+
+
+def _warn_layers_savefig_kwargs(savefig_kwargs):
+    global _layers_savefig_kwargs_warned
+    if not _layers_savefig_kwargs_warned:
+        _layers_savefig_kwargs_warned = True
+        unsupported = sorted(set(savefig_kwargs) - set(supported_savefig_kwargs))
+        logger.warning(
+            f"static artists are ignored : savefig options {unsupported} are not supported by layers rendering, "
+            f"only {list(supported_savefig_kwargs)}"
+        )
+
+
+def recycle_worker(client, worker):
+    """restart a worker through its nanny
+
+    Its running and queued tasks are rescheduled on other workers (dask logs them as lost or recomputed),
+    and data scattered only to it are lost.
+    """
+
+    if len(client.scheduler_info()["workers"]) < 2:
+        logger.warning("only one worker, it won't be restarted")
+        return
+
+    try:
+        with Timing() as dt:
+            client.restart_workers([worker])
+        logger.debug(f"worker {worker} restarted ({dt})")
+    except Exception as err:
+        logger.warning(f"cannot restart worker {worker} : {err}")
+
+
+orders = ("cost", "stratified", "sequential")
+
+
+def frame_priorities(statsFile, order="cost", stride=1):
+    """build the function giving the dask priority of each frame (higher is built first)
+
+    Parameters
+    ----------
+    statsFile : str
+        stats saved by previous runs
+    order : str, optional
+        * "cost" : the most expensive frames of previous runs are built first (frames never built
+          have the median cost), so the last frames don't leave workers idle.
+        * "stratified" : coarse-to-fine order, one image every 64 first, then every 32, ... (see
+          :func:`anim.tools.stratum`), so a preview of the whole animation is available early
+        * "sequential" : frames are built in order
+    stride : int, optional
+        only frames multiple of `stride` are built, by default 1
+
+    Returns
+    -------
+    callable
+        function frame -> priority
+    """
+
+    if order == "sequential":
+        return lambda i: 0
+
+    if order == "stratified":
+        return lambda i: stratum(i // stride)
+
+    if order != "cost":
+        raise ValueError(f"order should be one of {orders}, not '{order}'")
+
+    costs = load_frame_costs(statsFile)
+    if len(costs) == 0:
+        return lambda i: 0
+
+    logger.info(f"using build time of {len(costs)} frames from previous runs to order frames")
+    default = np.median(list(costs.values()))
+    return lambda i: int(costs.get(i, default) * 1e3)
+
+
+def compute_cache_folder(workFolder, compute_cache):
+    """folder of the compute cache, `compute_cache` being False, True or a key chosen by the user"""
+    if not compute_cache:
+        return None
+    folder = os.path.join(workFolder, "compute_cache")
+    return folder if compute_cache is True else os.path.join(folder, str(compute_cache))
+
+
+def cached_compute(compute, compute_cache=None, source=None):
+    """`compute` reading datasets from `compute_cache` folder if specified (see :mod:`anim.compute_cache`)"""
+    if compute_cache is None or compute is None:
+        return compute
+    if source is not None:
+        logger.warning("compute cache is not used with `source` : workers read data from the source")
+        return compute
+
+    cache = ComputeCache(compute, compute_cache)
+    logger.info(f"datasets of frames are cached in {cache.folder}")
+    return cache
+
+
+def _cancel_tasks(client, cancel, finished, dict_futures):
+    """cancel tasks not done yet as soon as `cancel` is set, until `finished` is set"""
+    while not finished.is_set():
+        if cancel.wait(0.05):
+            while True:
+                try:
+                    remaining = list(dict_futures)
+                    break
+                except RuntimeError:
+                    # results received meanwhile
+                    pass
+            client.cancel(remaining)
+            return
+
+
+def _report(progress, stage, **kwargs):
+    if progress is not None:
+        progress(Progress(stage, **kwargs))
+
+
+def build_client(client=None, nprocess=0, threads=1):
+    """dask client used to build images
+
+    Parameters
+    ----------
+    client : dask.Client or callable, optional
+        client, or function returning a client. By default None, a local cluster is started
+    nprocess : int, optional
+        number of workers of the local cluster, by default 0 (all cpus but one)
+    threads : int, optional
+        number of threads by worker of the local cluster, by default 1
+
+    Returns
+    -------
+    tuple
+        (client, True if the client was built here and should be closed)
+    """
+    if client is None:
+        logger.info("building dask local client..")
+        n_workers = nprocess if nprocess > 0 else max(1, multiprocessing.cpu_count() - 1)
+
+        cluster = LocalCluster(processes=True, n_workers=n_workers, threads_per_worker=threads)
+        return Client(cluster), True
+
+    # if its a function, execute it
+    if hasattr(client, "__call__"):
+        logger.info("building dask custom client..")
+        return client(), True
+
+    logger.info("no need to build dask client (given by parameter)")
+    return client, False
+
+
+def _sanitize_frames(frames):
+    """frames to build, as a slice with start and stop defined, and the set of frames if `frames` is a list"""
+    if frames is None:
+        frames = slice(None)
+    if not isinstance(frames, slice):
+        selected = {int(i) for i in frames}
+        return slice(min(selected, default=0), max(selected, default=-1) + 1), selected
+    start = 0 if frames.start is None else frames.start
+    stop = np.inf if frames.stop is None else frames.stop
+    return slice(start, stop), None
+
+
 def get_imagePatern(imageFolder, max_frames):
     return os.path.join(imageFolder, image_patern(max_frames))
 
 
+def image_exists(image_name, i_image, frameStore=None):
+    if frameStore is not None:
+        return frameStore.is_done(i_image)
+    return os.path.exists(image_name)
+
+
+def calibration_frames(imageFolder, max_frames, n, stride=1, frames=None, frameStore=None):
+    """first `n` frames of `frames` whose images are not built yet, so the calibration measures real images"""
+    imageNames = get_imagePatern(imageFolder, max_frames)
+    start = 0 if frames is None or frames.start is None else frames.start
+    stop = max_frames if max_frames is not None and max_frames > 0 else np.inf
+    if frames is not None and frames.stop is not None:
+        stop = min(stop, frames.stop)
+
+    calibration = []
+    # only one frame every `stride` frames has an image
+    i_image = -(-start // stride) * stride
+    while len(calibration) < n and i_image < stop:
+        if not image_exists(imageNames % (i_image // stride), i_image // stride, frameStore):
+            calibration.append(i_image)
+        i_image += stride
+    return calibration
+
+
+def sample_folder(workFolder):
+    """new folder for sample images, published as `workFolder/sample/imgs` by :func:`publish_sample` once built"""
+    return os.path.join(workFolder, "sample", f"v{time.time_ns()}", "imgs")
+
+
+def publish_sample(imageFolder):
+    """point `sample/imgs` to `imageFolder` at once, so sample images of different renders are never mixed
+
+    Returns
+    -------
+    str
+        published folder
+    """
+    sample, version = os.path.split(os.path.dirname(imageFolder))
+    published = os.path.join(sample, "imgs")
+    previous = os.readlink(published) if os.path.islink(published) else None
+    if os.path.isdir(published) and previous is None:
+        shutil.rmtree(published)
+
+    tmp = f"{published}.{os.getpid()}"
+    os.symlink(os.path.join(version, "imgs"), tmp)
+    os.replace(tmp, published)
+    if previous is not None and os.path.dirname(previous) != version:
+        shutil.rmtree(os.path.join(sample, os.path.dirname(previous)), ignore_errors=True)
+    return published
+
+
+def clear_images(imageFolder, frameStore=None):
+    """delete all images already built"""
+    if frameStore is not None:
+        frameStore.clear()
+    else:
+        os.system(f"rm -rf {imageFolder}")
+        os.system(f"mkdir -p {imageFolder}")
+
+
+def get_frameStore(imageFolder, max_frames, stride=1):
+    """frame store used instead of png images, next to `imageFolder`"""
+    if max_frames is None or max_frames <= 0:
+        raise ValueError("the frame store needs the number of frames : please specify `max_frames`")
+    folder = os.path.join(os.path.dirname(os.path.normpath(imageFolder)), "frames")
+    return FrameStore(folder, n_images=int(np.ceil(max_frames / stride)))
+
+
 def simple_building(
     f_plot,
     compute=None,
@@ -83,37 +387,45 @@ def simple_building(
     indices=[],  # only
     savefig_kwargs=dict(),
     show=None,
+    source=None,
+    compute_cache=None,
+    keyframes=None,
 ):
-    max_frames, iter_compute = _sanitize_inputs(max_frames, compute)
+    if source is not None:
+        source = DataSource.build(source)
+        compute = source.compute if compute is None else compute
+    if keyframes is not None:
+        compute = keyframes.compute if compute is None else compute
+    max_frames, iter_compute = _sanitize_inputs(max_frames, cached_compute(compute, compute_cache, source))
 
     if len(indices) == 0:
         indices = [0]
     logger.info(f"we will build only images : {indices}")
 
-    _i = -1
-    while len(indices) > 0:
-        _i += 1
-
+    for _i in sorted(set(indices)):
         try:
+            iter_compute.seek(_i)
             ds = next(iter_compute)
         except StopIteration:
             break
 
-        if _i in indices:
-            indices.remove(_i)
-            logger.info(f"processing image i={_i}")
-            if show is not False:
-                fig = f_plot(_i, ds)
-
-                if show is None:
-                    plt.show()
-                else:
-                    name = show.format(i=_i)
-                    fig.savefig(name, **savefig_kwargs)
-                    logger.info(f"figure i={_i} saved in '{name}'")
+        logger.info(f"processing image i={_i}")
+        if source is not None:
+            ds = Selection(source, ds).load()
+        if keyframes is not None:
+            ds = keyframes.interp(ds)
+        if show is not False:
+            fig = f_plot(_i, ds)
 
+            if show is None:
+                plt.show()
             else:
-                f_plot(_i, ds)
+                name = show.format(i=_i)
+                fig.savefig(name, **savefig_kwargs)
+                logger.info(f"figure i={_i} saved in '{name}'")
+
+        else:
+            f_plot(_i, ds)
     return
 
 
@@ -127,94 +439,201 @@ def build_images(
     savefig_kwargs=dict(),
     client=None,
     max_memory_ds=1e6,
+    stride=1,
+    script=None,
+    codec=None,
+    transport=None,
+    source=None,
+    worker_max_frames=None,
+    worker_max_memory=None,
+    threads=1,
+    frames=None,
+    order="cost",
+    layer_cache=None,
+    frame_store=False,
+    compute_cache=None,
+    keyframes=None,
+    prefetch=2,
+    progress=None,
+    cancel=None,
 ):
-    max_frames, iter_compute = _sanitize_inputs(max_frames, compute)
+    if source is not None and keyframes is not None:
+        raise ValueError("`source` and `keyframes` cannot be used together")
+    if source is not None:
+        source = DataSource.build(source)
+        if compute is None:
+            compute = source.compute
+            max_frames = source.size if max_frames is None else max_frames
+        if transport is not None:
+            raise ValueError("`transport` cannot be used with `source` : only selectors are sent to workers")
+        transport = SourceTransport(source)
+    if keyframes is not None:
+        if compute is None:
+            compute = keyframes.compute
+            max_frames = keyframes.size if max_frames is None else max_frames
+        if transport is not None:
+            raise ValueError("`transport` cannot be used with `keyframes` : frames are interpolated by workers")
+        transport = KeyframeTransport(keyframes)
+    max_frames, iter_compute = _sanitize_inputs(max_frames, cached_compute(compute, compute_cache, source))
+    frames_all = frames is None
+    frames, selected = _sanitize_frames(frames)
 
-    os.makedirs(imageFolder, exist_ok=True)
     imageNames = get_imagePatern(imageFolder, max_frames)
-    logger.info(f"image will be saved under : {imageNames}")
+    frameStore = None
+    if frame_store:
+        unsupported = set(savefig_kwargs) - {"dpi"}
+        if unsupported:
+            raise ValueError(f"savefig options {sorted(unsupported)} cannot be used with the frame store, only 'dpi'")
+        frameStore = get_frameStore(imageFolder, max_frames, stride)
+        logger.info(f"images will be saved in the frame store : {frameStore.folder}")
+    else:
+        os.makedirs(imageFolder, exist_ok=True)
+        logger.info(f"image will be saved under : {imageNames}")
+
+    # stats of each frame are kept between runs, to build the most expensive frames first
+    statsFile = os.path.join(os.path.dirname(os.path.normpath(imageFolder)), "stats.csv")
+    priorities = frame_priorities(statsFile, order, stride)
 
     animationInfo = AnimationInfo(
         imagePatern=imageNames,
         checkIfImageExist=not force,
         savefig_kwargs=savefig_kwargs,  # onlyCompute=only
+        stride=stride,
+        threads=threads,
+        layer_cache=layer_cache,
+        frameStore=frameStore,
     )
 
-    # this wrap function is needed to pass the f_plot function
-    def _process(i, data):
-        return process(i, data, f_plot, animationInfo)
-
     statStorage = StatStorage()
-    need_delete_client = False
-
-    if force:
-        os.system(f"rm -rf {os.path.dirname(imageNames)}")
-        os.system(f"mkdir -p {os.path.dirname(imageNames)}")
+    transport = build_transport(transport, max_size=max_memory_ds, codec=codec)
 
-    if client is None:
-        logger.info("building dask local client..")
-        need_delete_client = True
-        n_workers = nprocess if nprocess > 0 else multiprocessing.cpu_count() - 1
-
-        cluster = LocalCluster(processes=True, n_workers=n_workers, threads_per_worker=1)
-        client = Client(cluster)
+    # with a slice of frames, other images may be built by other shards : only images of the slice are rebuilt
+    if force and frames_all:
+        clear_images(imageFolder, frameStore)
 
-    # if its a function, execute it
-    elif hasattr(client, "__call__"):
-        logger.info("building dask custom client..")
-        client = client()
-        need_delete_client = True
-
-    else:
-        logger.info("no need to build dask client (given by parameter)")
+    client, need_delete_client = build_client(client, nprocess, threads)
 
     dask_info = client.scheduler_info()
     logger.info(
-        f"dask client built. nbr workers : {len(dask_info['workers'])}, dashboard : {dask_info["services"]["dashboard"]}"
+        f"dask client built. nbr workers : {len(dask_info['workers'])}, dashboard : {dask_info['services']['dashboard']}"
     )
 
-    futures = []
-    dict_futures = {}
-
-    i_image = -1
-    str_max_frames = max_frames if max_frames > 0 else "???"
+    # the script is imported once per worker, so functions defined inside are pickled by reference.
+    # As a named plugin, restarted workers get it too, and a new version replaces the previous one on the server
+    client.register_plugin(WorkerSetup(), name="anim-worker-setup")
+    if script is not None:
+        client.register_plugin(UploadFile(script), name=f"anim-script-{os.path.basename(script)}")
 
-    while i_image != max_frames:
-        i_image += 1
+    # arguments shared by all images are sent once to each worker, only indice and data are sent by task
+    f_plot_future, animationInfo_future = client.scatter([f_plot, animationInfo], broadcast=True, hash=False)
+    transport.setup(client, max_frames)
 
-        image_name = imageNames % i_image
+    recycling = RecyclingPolicy(max_frames=worker_max_frames, max_memory=worker_max_memory)
+    if recycling.active and isinstance(transport, (DeltaTransport, CacheTransport)):
+        logger.warning("data kept on workers by the transport may be lost when restarting workers")
 
-        try:
-            with Timing() as timer:
-                ds = next(iter_compute)
-        except StopIteration:
-            break
+    futures = []
+    dict_futures = {}
 
-        stat = Stats(img_name=image_name, time_data_computation=timer.dt, size_data_uncompressed=ds.nbytes)
-        statStorage(stat)
+    def cancelled():
+        return cancel is not None and cancel.is_set()
 
-        if animationInfo.checkIfImageExist and os.path.exists(image_name):
-            logger.debug(f"img {i_image+1:03d}/{str_max_frames} already exist")
-            continue
+    str_max_frames = max_frames if max_frames > 0 else "???"
 
-        data, stat2 = dump_data(ds)
+    def frames_to_build():
+        """yield (i_image, ds, stat) of each image to build. Images already built are only added to stats"""
+        i_image = -1
+        while i_image != max_frames:
+            i_image += 1
+
+            if i_image >= frames.stop:
+                break
+
+            # in draft mode, data of intermediate frames are not needed
+            if i_image % stride != 0 or i_image < frames.start or (selected is not None and i_image not in selected):
+                continue
+
+            image_name = imageNames % (i_image // stride)
+            if animationInfo.checkIfImageExist and image_exists(image_name, i_image // stride, frameStore):
+                logger.debug(f"img {i_image+1:03d}/{str_max_frames} already exist")
+                statStorage(Stats(img_name=image_name, frame=i_image))
+                continue
+
+            # data of skipped frames are computed only if `compute` cannot jump to a frame (see FrameIterator)
+            try:
+                with Timing() as timer:
+                    iter_compute.seek(i_image)
+                    ds = next(iter_compute)
+            except StopIteration:
+                break
+
+            stat = Stats(
+                img_name=image_name,
+                frame=i_image,
+                time_data_computation=timer.dt,
+                size_data_uncompressed=getattr(ds, "nbytes", np.nan),
+            )
+            yield i_image, ds, stat
+
+    def submit(i_image, sent, stat):
+        data, submit_kwargs, stat2 = sent
         statStorage(stat | stat2)
 
-        r = client.submit(_process, i_image, data)
+        r = client.submit(
+            process, i_image, data, f_plot_future, animationInfo_future, priority=priorities(i_image), **submit_kwargs
+        )
         futures.append(r)
         dict_futures[r] = i_image
 
         logger.debug(f"img {i_image+1:03d}/{str_max_frames} : {statStorage[stat]}")
 
+    # pipeline : `compute` runs in a thread, frames are serialized by a pool of threads (if the transport allows
+    # it), and tasks are submitted in order. Up to `prefetch` frames are computed and serialized in advance
+    with contextlib.ExitStack() as stack:
+        frames_data = frames_to_build()
+        pool = None
+        if prefetch > 0:
+            frames_data = stack.enter_context(Prefetch(frames_data, size=prefetch))
+            if transport.parallel:
+                pool = stack.enter_context(ThreadPoolExecutor(prefetch, thread_name_prefix="anim-send"))
+
+        pending = deque()
+        for i_image, ds, stat in frames_data:
+            if cancelled():
+                break
+            if pool is None:
+                submit(i_image, transport.send(client, i_image, ds), stat)
+                continue
+
+            pending.append((i_image, pool.submit(transport.send, client, i_image, ds), stat))
+            while len(pending) > 0 and (len(pending) > prefetch or pending[0][1].done()):
+                i, sent, frame_stat = pending.popleft()
+                submit(i, sent.result(), frame_stat)
+
+        while len(pending) > 0 and not cancelled():
+            i, sent, frame_stat = pending.popleft()
+            submit(i, sent.result(), frame_stat)
+
     nbImagesAlreadyDone = statStorage.size - len(futures)
     if nbImagesAlreadyDone > 0:
         logger.info(f"{nbImagesAlreadyDone} images already computed")
     logger.info("%d images to be computed..", len(futures))
 
+    _tot = len(futures)
+    _report(progress, "images", done=0, total=_tot)
     with Timing() as dt_computation:
-        _tot = len(futures)
-        for i_future, future in enumerate(as_completed(futures)):
-            if future.status == "error":
+        completed = as_completed(futures)
+        finished = threading.Event()
+        if cancel is not None:
+            threading.Thread(target=_cancel_tasks, args=(client, cancel, finished, dict_futures), daemon=True).start()
+        # results are released from workers as soon as they are received
+        futures.clear()
+        to_recycle = set()
+        for i_future, future in enumerate(completed):
+            if future.status == "cancelled":
+                pass
+
+            elif future.status == "error":
                 import traceback
 
                 msg = f"Future [{i_future+1:03d}/{_tot}]: NOK\n"
@@ -234,6 +653,22 @@ def build_images(
 
                 logger.debug(f"fig {i_future+1:03d}/{_tot} done : {statStorage[stat]}")
 
+                if recycling(stat):
+                    to_recycle.add(stat.worker)
+                    recycling.reset(stat.worker)
+
+            del dict_futures[future], future
+            _report(progress, "images", done=i_future + 1, total=_tot)
+
+            # restart workers only when no finished result is waiting to be received. Tasks running or queued on
+            # a restarted worker are computed again by other workers, and data scattered only to it are lost
+            # (arguments shared by all images are broadcast to every worker)
+            if len(to_recycle) > 0 and not completed.has_ready():
+                for worker in to_recycle:
+                    recycle_worker(client, worker)
+                to_recycle.clear()
+        finished.set()
+
     if need_delete_client:
         import time
 
@@ -241,9 +676,13 @@ def build_images(
         client.close()
         client.cluster.close()
 
-    logger.info(
-        f"{len(futures)} images computed ({dt_computation})",
-    )
+    if cancelled():
+        logger.info(f"building images cancelled ({dt_computation})")
+    else:
+        logger.info(
+            f"{_tot} images computed ({dt_computation})",
+        )
+    statStorage.save(statsFile)
     return imageNames, statStorage.build_dataframe()
 
 
@@ -261,6 +700,27 @@ def animate(
     no_convert=False,
     max_memory_ds=1e6,
     ffmpeg_log=False,
+    draft=False,
+    draft_dpi=50,
+    script=None,
+    codec=None,
+    transport=None,
+    source=None,
+    worker_max_frames=None,
+    worker_max_memory=None,
+    threads=1,
+    order="cost",
+    preview=False,
+    layer_cache=False,
+    frame_store=False,
+    frames=None,
+    compute_cache=False,
+    keyframes=None,
+    prefetch=2,
+    progress=None,
+    sample=None,
+    cancel=None,
+    segment_size=None,
 ):
     """create images in parallel and then combine them in a video
 
@@ -287,9 +747,11 @@ def animate(
         if True, force regeneration of all images.
         if False, image already computed and saved on disk won't be computed.
         By default False
-    nprocess : int, optional
+    nprocess : int or "auto", optional
         number of cpu to use when not providing a dask.Client.
-        If not provided, use all cpus
+        If not provided, use all cpus.
+        If "auto", a few images are built first to measure time and memory by image, then the number of
+        workers and threads maximising images/s within the available memory is used
     only_convert : bool, optional
         if True, don't generate images at all. We only build the video, by default False
     no_convert : bool, optional
@@ -297,36 +759,216 @@ def animate(
     max_memory_ds : int, optional
         if data provided by `compute` exceed max_memory_ds, it will be compressed in zarr to minimise ram usage.
         By default 1e6
+    codec : str, anim.data.Codec or dict, optional
+        compressor used when data exceed `max_memory_ds` : "none", "lz4", "zstd" or "zstd:<level>[:noshuffle]".
+        Can be a dict {variable: codec}. If "auto", each codec is tried on the first frames, and the one which
+        minimise compression + transfer time is used. By default None (zarr default compressor)
+    transport : str or anim.transport.Transport, optional
+        how data are sent to workers :
+            * "dump" : full data of each frame, compressed if bigger than `max_memory_ds`
+            * "delta" : consecutive frames are rendered by the same worker, and only changes from
+              the previous frame are sent. Usefull when data are sliding windows
+            * "cache" : each distinct variable is sent once and kept on workers, next frames only send
+              a reference. Usefull when frames share coordinates or static variables
+        By default "dump"
+    source : str, xarray.Dataset or anim.source.DataSource, optional
+        zarr or netCDF dataset read directly by workers (a path, or a dataset opened lazily from a file, without
+        selection : workers open the whole file again).
+        `compute` should then yield selectors : an indice along the "time" dimension, or a dict given to
+        `ds.sel(...)`. If `compute` is not specified, one frame is built for each time step.
+        Each worker opens the dataset once, and reads only the slice of its frames. By default None
+    keyframes : anim.keyframes.Keyframes, optional
+        datasets at coarse timestamps, interpolated by workers at the time of each frame. Each keyframe is sent
+        once to the workers. `compute` should then yield the time of each frame, by default the `times` of
+        keyframes. By default None
+    prefetch : int, optional
+        number of frames computed and serialized in advance on the driver : `compute` runs in a thread, and data
+        are compressed by `prefetch` threads (only with the "dump" transport, other ones keep state between
+        frames), while previous frames are sent. 0 to compute, serialize and send each frame one after another.
+        By default 2
+    worker_max_frames : int, optional
+        restart a worker after it built `worker_max_frames` images, to bound memory growth. By default None
+    worker_max_memory : float, optional
+        restart a worker when its memory (in bytes) exceed `worker_max_memory` after an image. By default None
+    threads : int, optional
+        number of threads by worker when not providing a dask.Client. Images are built in parallel in the same
+        process, which saves memory. pyplot is not thread safe : `f_plot` should build its figure with
+        :func:`anim.figure` or :func:`anim.subplots`. By default 1
+    order : str, optional
+        order used to build images :
+            * "cost" : build time of each image is saved in `workFolder`, and the most expensive images
+              of previous runs are built first, so the last images don't leave workers idle
+            * "stratified" : coarse-to-fine order (one image every 64, then every 32, ...), a preview
+              of the whole animation can be built early with `preview`
+            * "sequential" : images are built in order
+        By default "cost"
+    layer_cache : bool, optional
+        static layers of figures (see :func:`anim.mark_static`) are also saved in `workFolder/layers`, so they
+        are rendered only once for all workers and all runs. They are deleted with `force`. By default False, they
+        are only kept in memory by each worker
+    frame_store : bool, optional
+        save all images in a single memory-mapped file `workFolder/frames` instead of one png by image
+        (see :class:`anim.store.FrameStore`), and stream them to ffmpeg. Needs `max_frames`, and only the `dpi`
+        option of `savefig_kwargs`. By default False
+    compute_cache : bool or str, optional
+        save datasets yielded by `compute` in `workFolder/compute_cache`, and read them in next runs instead of
+        computing them again, as long as the script defining `compute` is not modified
+        (see :mod:`anim.compute_cache`). A string is a key of the cache : change it to compute data again when
+        something else changes (input files, imported modules, ...). By default False
+    frames : slice, optional
+        build only these frames (see :mod:`anim.shard`), the video is not encoded. Use :func:`anim.shard.merge`
+        once all frames are built. By default None, all frames are built
+    sample : list, optional
+        only build images of these frames in `workFolder/sample/imgs`, always built again, without video. Images of
+        the animation are left untouched. Images are published once all of them are built, so a cancelled render
+        leaves the previous sample in place (see :func:`publish_sample`). By default None
+    preview : bool, optional
+        don't build images, only encode a preview video `preview.mp4` from images already saved (see
+        :func:`anim.tools.preview_video`). Can be used while images are built. By default False
+    segment_size : int, optional
+        encode the video in independent segments of `segment_size` images, joined without encoding them again
+        (see :mod:`anim.segments`). When only some images are built again, only segments containing them are
+        encoded again. Not used with `frame_store`. By default None, the whole video is encoded
     ffmpeg_log : bool, optional
         print all ffmpeg logs. If not specified, run `ffmpeg` with `-loglevel quiet
+    draft : int or False, optional
+        if specified, build a preview video using only one frame every `draft` frames, saved with `draft_dpi`.
+        Images are stored in `workFolder/draft/<draft>_<draft_dpi>`, so the full-quality images are left untouched.
+        By default False
+    draft_dpi : int, optional
+        dpi used to save images in draft mode, overwrite the one in `savefig_kwargs`. By default 50
+    script : str, optional
+        path of the python file where `f_plot` and `compute` are defined, imported as a module.
+        The file is uploaded and imported once on each worker, so functions are sent by reference and not
+        serialized with their globals for every image. By default None
+    progress : callable, optional
+        called with a :class:`anim.data.Progress` event when images are built, the video is encoded and the
+        animation is done. See :func:`animate_async`. By default None
+    cancel : threading.Event, optional
+        set it (from another thread) to stop building images : images not built yet are cancelled, and the video
+        is not encoded. By default None
 
     Returns
     -------
-    str
-        return the video name
+    str or None
+        return the video name, None if only some `frames` are built or if the video cannot be encoded
     """
 
     os.makedirs(workFolder, exist_ok=True)
     workFolder = os.path.normpath(workFolder)
     imageFolder = os.path.join(workFolder, "imgs")
+    videoName = "video.mp4"
+    stride = 1
+
+    if draft:
+        stride = int(draft)
+        # each stride and dpi has its own images, drafts with other options are not mixed
+        imageFolder = os.path.join(workFolder, "draft", f"{stride}_{draft_dpi}", "imgs")
+        videoName = "draft.mp4"
+        savefig_kwargs = {**savefig_kwargs, "dpi": draft_dpi}
+        fps = fps / stride
+        logger.info(f"draft mode : 1 image every {stride} frames, dpi={draft_dpi}, fps={fps:.2f}")
+
+    if sample is not None:
+        # sample images are always built again, in their own folder, images of the animation are left untouched
+        imageFolder = sample_folder(workFolder)
+        frames, force, no_convert, frame_store = sorted(set(sample)), True, True, False
+        nprocess = 0 if nprocess == "auto" else nprocess
+
+    if source is not None and compute is None and max_frames is None:
+        max_frames = DataSource.build(source).size
+    if keyframes is not None and compute is None and max_frames is None:
+        max_frames = keyframes.size
+
+    if preview and frame_store:
+        store = get_frameStore(imageFolder, max_frames, stride)
+        return store_preview(store, fps, os.path.join(workFolder, "preview.mp4"), ffmpeg_log=ffmpeg_log)
+    if preview:
+        imageNames = get_imagePatern(imageFolder, max_frames)
+        n_images = int(np.ceil(max_frames / stride)) if max_frames is not None and max_frames > 0 else None
+        return preview_video(
+            imageNames, fps, os.path.join(workFolder, "preview.mp4"), n_images=n_images, ffmpeg_log=ffmpeg_log
+        )
 
     if only_convert:
-        imageNames = get_imagePatern(workFolder, max_frames)
+        imageNames = get_imagePatern(imageFolder, max_frames)
     else:
-        imageNames, df = build_images(
-            f_plot,
-            imageFolder,
+        if force and layer_cache and sample is None:
+            # layers saved by previous runs may come from another version of the script
+            shutil.rmtree(os.path.join(workFolder, "layers"), ignore_errors=True)
+        build_kwargs = dict(
             compute=compute,
             max_frames=max_frames,
-            force=force,
-            nprocess=nprocess,
             savefig_kwargs=savefig_kwargs,
             client=client,
             max_memory_ds=max_memory_ds,
+            stride=stride,
+            script=script,
+            codec=codec,
+            transport=transport,
+            source=source,
+            worker_max_frames=worker_max_frames,
+            worker_max_memory=worker_max_memory,
+            order=order,
+            layer_cache=os.path.join(workFolder, "layers") if layer_cache else None,
+            frame_store=frame_store,
+            compute_cache=compute_cache_folder(workFolder, compute_cache),
+            keyframes=keyframes,
+            prefetch=prefetch,
+            progress=progress,
+            cancel=cancel,
+        )
+
+        if nprocess == "auto" and client is not None:
+            logger.warning("nprocess='auto' is ignored when a dask client is given")
+            nprocess = 0
+
+        elif nprocess == "auto":
+            if force and frames is None:
+                # calibration images are kept, they won't be built again
+                clear_images(imageFolder, get_frameStore(imageFolder, max_frames, stride) if frame_store else None)
+                force = False
+            calibration = calibration_frames(
+                imageFolder,
+                max_frames,
+                calibration_size(max_frames),
+                stride=stride,
+                frames=frames,
+                frameStore=get_frameStore(imageFolder, max_frames, stride) if frame_store else None,
+            )
+            if len(calibration) == 0:
+                logger.info("all images are already built, no calibration")
+                nprocess = 0
+            else:
+                logger.info(f"building {len(calibration)} images to choose the number of workers and threads..")
+                _, df = build_images(f_plot, imageFolder, force=force, frames=calibration, **build_kwargs)
+                nprocess, threads = choose_layout(df)
+
+        imageNames, df = build_images(
+            f_plot, imageFolder, force=force, nprocess=nprocess, threads=threads, frames=frames, **build_kwargs
         )
         logger.info("\n" + str(df.describe()))
 
-    videoName = "video.mp4"
+        if cancel is not None and cancel.is_set():
+            if sample is not None:
+                # images of a cancelled render are never published
+                shutil.rmtree(os.path.dirname(imageFolder), ignore_errors=True)
+            _report(progress, "done")
+            return None
+
+        if sample is not None:
+            imageFolder = publish_sample(imageFolder)
+            logger.info(f"sample images saved in {imageFolder}")
+            _report(progress, "done", result=os.path.join(imageFolder, os.path.basename(imageNames)))
+            return None
+
+        if frames is not None:
+            logger.info(
+                f"only frames {frames.start or 0}:{frames.stop or ''} were built. "
+                "Once all shards are done, use `anim merge` to encode the video"
+            )
+            _report(progress, "done")
+            return None
 
     pathVideo = os.path.join(workFolder, videoName)
     name, ext = os.path.splitext(pathVideo)
@@ -334,5 +976,90 @@ def animate(
         ext = ext + ".mp4"
 
     if not no_convert:
-        images2video(imageNames, fps, pathVideo, ffmpeg_log=ffmpeg_log)
+        _report(progress, "video")
+    if not no_convert and frame_store:
+        if segment_size:
+            logger.warning("`segment_size` is ignored with the frame store, the whole video is encoded")
+        pathVideo = store2video(get_frameStore(imageFolder, max_frames, stride), fps, pathVideo, ffmpeg_log=ffmpeg_log)
+    elif not no_convert and segment_size:
+        n_images = int(np.ceil(max_frames / stride)) if max_frames is not None and max_frames > 0 else None
+        pathVideo = segments2video(
+            imageNames, fps, pathVideo, n_images=n_images, segment_size=segment_size, ffmpeg_log=ffmpeg_log
+        )
+    elif not no_convert:
+        pathVideo = images2video(imageNames, fps, pathVideo, ffmpeg_log=ffmpeg_log)
+    # None if the video was not created, the error is already logged
+    _report(progress, "done", result=pathVideo)
     return pathVideo
+
+
+async def animate_async(f_plot, workFolder, fps, progress=None, **kwargs):
+    """same as :func:`animate`, awaitable, so several animations can share one dask client
+
+    The animation runs in its own thread : with the same `client`, frames of all animations are interleaved in
+    the scheduler queue.
+
+    example :
+
+    client = build_client(nprocess=8)[0]
+    videos = await asyncio.gather(
+        animate_async(plot, "out1", 24, compute=compute1, client=client, progress=print),
+        animate_async(plot, "out2", 24, compute=compute2, client=client, progress=print),
+    )
+
+    Cancelling the task stops the animation : frames not submitted yet are skipped, and tasks not started are
+    cancelled (see the `cancel` option of :func:`animate`).
+
+    Parameters
+    ----------
+    progress : callable, optional
+        called in the event loop with each :class:`anim.data.Progress` of the animation. Can be a coroutine
+        function. By default None
+    kwargs :
+        other parameters of :func:`animate`
+
+    Returns
+    -------
+    str or None
+        return the video name, None if only some `frames` are built or if the video cannot be encoded
+    """
+    loop = asyncio.get_running_loop()
+    result = loop.create_future()
+    cancel = kwargs.pop("cancel", None) or threading.Event()
+
+    def call_soon(*args):
+        try:
+            loop.call_soon_threadsafe(*args)
+        except RuntimeError:
+            # the event loop is closed : the task was cancelled and nobody waits for the animation anymore
+            pass
+
+    def report(event):
+        event.name = workFolder
+        if progress is not None:
+            call_soon(_dispatch, progress, event)
+
+    def set_result(method, value):
+        if not result.done():
+            method(value)
+
+    def run():
+        try:
+            video = animate(f_plot, workFolder, fps, progress=report, cancel=cancel, **kwargs)
+        except BaseException as error:
+            call_soon(set_result, result.set_exception, error)
+        else:
+            call_soon(set_result, result.set_result, video)
+
+    threading.Thread(target=run, name=f"anim-{os.path.basename(os.path.normpath(workFolder))}", daemon=True).start()
+    try:
+        return await result
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
+
+
+def _dispatch(progress, event):
+    res = progress(event)
+    if inspect.isawaitable(res):
+        asyncio.ensure_future(res)
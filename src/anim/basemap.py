@@ -0,0 +1,277 @@
+"""Background of a map rendered once, as a pyramid of tiles, for camera moves in PlateCarree.
+
+With a camera moving over a map (see :class:`anim.path.TimePath`), cartopy features (ocean, land, coastlines, ...)
+are usually drawn again for each frame. A :class:`BasemapCache` renders the region covered by the whole path once,
+at the resolution needed by the most zoomed-in frame, as tiles saved on disk. Coarser levels of the pyramid are
+built by downsampling the finer ones. Each frame gets its background by resampling the tiles of the level matching
+its zoom.
+
+Tiles are rendered when first needed, by any worker, so the pyramid can be built while images are built.
+Use :meth:`BasemapCache.build` to render all of them before.
+
+example :
+
+dates, extents, speed = path.compute_path(dt)
+BASEMAP = BasemapCache.from_extents("basemap", extents, shape=(400, 800))
+
+def plot(i, ds):
+    fig = anim.figure(figsize=(8, 4), dpi=100)
+    ax = fig.add_axes([0, 0, 1, 1], projection=ccrs.PlateCarree())
+    BASEMAP.plot(ax, extents[i])
+    ax.scatter(ds.lon, ds.lat, transform=ccrs.PlateCarree())
+    return fig
+"""
+
+import hashlib
+import inspect
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from anim.render import figure
+
+logger = logging.getLogger(__name__)
+
+
+def default_features(ax):
+    """ocean, land and coastlines"""
+    import cartopy.feature as cfeature
+
+    ax.add_feature(cfeature.OCEAN)
+    ax.add_feature(cfeature.LAND)
+    ax.coastlines()
+
+
+def _plate_carree():
+    import cartopy.crs as ccrs
+
+    return ccrs.PlateCarree()
+
+
+def _bilinear(img, rows, cols):
+    """sample `img` at fractional pixel positions (rows x cols grid), clipped on borders"""
+    r0 = np.clip(np.floor(rows).astype(int), 0, img.shape[0] - 2)
+    c0 = np.clip(np.floor(cols).astype(int), 0, img.shape[1] - 2)
+    fr = np.clip(rows - r0, 0, 1)[:, None, None]
+    fc = np.clip(cols - c0, 0, 1)[None, :, None]
+
+    img = img.astype(np.float32)
+    top = img[r0][:, c0] * (1 - fc) + img[r0][:, c0 + 1] * fc
+    bottom = img[r0 + 1][:, c0] * (1 - fc) + img[r0 + 1][:, c0 + 1] * fc
+    return (top * (1 - fr) + bottom * fr).round().astype(np.uint8)
+
+
+class BasemapCache:
+    """pyramid of RGBA tiles covering `region`, saved in `folder`
+
+    Parameters
+    ----------
+    folder : str
+        folder where tiles are saved. Each pyramid (region, resolution, ...) uses its own sub folder
+    region : tuple
+        (x0, x1, y0, y1) in degrees, covered by the pyramid
+    resolution : float
+        resolution of the finest level, in pixels by degree
+    draw : callable, optional
+        function `draw(ax)` adding the background to an axes, by default :func:`default_features`
+    tile_size : int, optional
+        width and height of tiles in pixels, by default 512
+    projection : str, optional
+        "PlateCarree" to draw tiles in cartopy GeoAxes, or None to use a regular matplotlib axes
+        (x and y in degrees). By default "PlateCarree"
+    max_tiles : int, optional
+        number of tiles kept in memory by each worker, by default 64
+    """
+
+    def __init__(self, folder, region, resolution, draw=None, tile_size=512, projection="PlateCarree", max_tiles=64):
+        self.region = tuple(float(v) for v in region)
+        self.resolution = float(resolution)
+        self.draw = default_features if draw is None else draw
+        self.tile_size = tile_size
+        self.projection = projection
+        self.max_tiles = max_tiles
+
+        x0, x1, y0, y1 = self.region
+        size = max(x1 - x0, y1 - y0) * self.resolution
+        self.levels = max(1, int(np.ceil(np.log2(max(size / tile_size, 1)))) + 1)
+
+        key = repr((self.region, self.resolution, tile_size, projection, self._draw_source()))
+        self.folder = os.path.join(folder, hashlib.blake2b(key.encode(), digest_size=8).hexdigest())
+
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _draw_source(self):
+        """source code of `draw`, so tiles are rendered again when it changes"""
+        try:
+            return inspect.getsource(self.draw)
+        except (OSError, TypeError):
+            return f"{getattr(self.draw, '__module__', '')}.{getattr(self.draw, '__qualname__', repr(self.draw))}"
+
+    @classmethod
+    def from_extents(cls, folder, extents, shape, **kwargs):
+        """pyramid covering all `extents`, at the resolution needed by the most zoomed-in one
+
+        Parameters
+        ----------
+        folder : str
+            folder where tiles are saved
+        extents : numpy.ndarray
+            (n, 4) array of [x0, x1, y0, y1] extents, as returned by :meth:`anim.path.TimePath.compute_path`
+        shape : tuple
+            (height, width) in pixels of the axes showing the map
+        kwargs :
+            other options of :class:`BasemapCache`
+        """
+        extents = np.asarray(extents, dtype=float).reshape(-1, 4)
+        height, width = shape
+        resolution = max(
+            (width / (extents[:, 1] - extents[:, 0])).max(), (height / (extents[:, 3] - extents[:, 2])).max()
+        )
+        region = (extents[:, 0].min(), extents[:, 1].max(), extents[:, 2].min(), extents[:, 3].max())
+        return cls(folder, region, resolution, **kwargs)
+
+    def __getstate__(self):
+        # tiles kept in memory are not sent to workers
+        state = self.__dict__.copy()
+        state["_tiles"], state["_lock"] = OrderedDict(), None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def level_resolution(self, level):
+        return self.resolution / 2**level
+
+    def tile_extent(self, level, ix, iy):
+        """(x0, x1, y0, y1) of a tile, `iy` counted from the top of the region"""
+        degrees = self.tile_size / self.level_resolution(level)
+        x0, _, _, y1 = self.region
+        return (x0 + ix * degrees, x0 + (ix + 1) * degrees, y1 - (iy + 1) * degrees, y1 - iy * degrees)
+
+    def n_tiles(self, level):
+        """number of tiles (nx, ny) of a level"""
+        x0, x1, y0, y1 = self.region
+        degrees = self.tile_size / self.level_resolution(level)
+        return int(np.ceil((x1 - x0) / degrees - 1e-9)), int(np.ceil((y1 - y0) / degrees - 1e-9))
+
+    def _render(self, level, ix, iy):
+        T = self.tile_size
+        extent = self.tile_extent(level, ix, iy)
+        fig = figure(figsize=(T / 100, T / 100), dpi=100)
+        fig.patch.set_alpha(0)
+        if self.projection is None:
+            ax = fig.add_axes([0, 0, 1, 1])
+            ax.set_xlim(*extent[:2])
+            ax.set_ylim(*extent[2:])
+        else:
+            crs = _plate_carree()
+            ax = fig.add_axes([0, 0, 1, 1], projection=crs)
+            ax.set_extent(extent, crs=crs)
+        ax.set_axis_off()
+        self.draw(ax)
+        fig.canvas.draw()
+        return np.asarray(fig.canvas.buffer_rgba()).copy()
+
+    def _downsample(self, level, ix, iy):
+        T = self.tile_size
+        children = np.zeros((2 * T, 2 * T, 4), dtype=np.float32)
+        nx, ny = self.n_tiles(level - 1)
+        for dy in range(2):
+            for dx in range(2):
+                if 2 * ix + dx < nx and 2 * iy + dy < ny:
+                    children[dy * T : (dy + 1) * T, dx * T : (dx + 1) * T] = self.tile(
+                        level - 1, 2 * ix + dx, 2 * iy + dy
+                    )
+        return children.reshape(T, 2, T, 2, 4).mean(axis=(1, 3)).round().astype(np.uint8)
+
+    def tile(self, level, ix, iy):
+        """RGBA array of a tile, loaded from memory, disk, or rendered"""
+        key = (level, ix, iy)
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+
+        filename = os.path.join(self.folder, f"{level}_{ix}_{iy}.npy")
+        if os.path.exists(filename):
+            tile = np.load(filename)
+        else:
+            tile = self._render(level, ix, iy) if level == 0 else self._downsample(level, ix, iy)
+            os.makedirs(self.folder, exist_ok=True)
+            # written in a temporary file, so other workers never read a partial tile
+            tmp = f"{filename}.{os.getpid()}.{threading.get_ident()}.npy"
+            np.save(tmp, tile)
+            os.replace(tmp, filename)
+
+        with self._lock:
+            self._tiles[key] = tile
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def build(self):
+        """render all tiles of the pyramid"""
+        for level in range(self.levels):
+            nx, ny = self.n_tiles(level)
+            logger.info(f"basemap level {level} : {nx}x{ny} tiles")
+            for iy in range(ny):
+                for ix in range(nx):
+                    self.tile(level, ix, iy)
+
+    def background(self, extent, shape):
+        """RGBA image of `extent` (x0, x1, y0, y1), resampled to `shape` (height, width)"""
+        x0, x1, y0, y1 = extent
+        height, width = shape
+        needed = max(width / (x1 - x0), height / (y1 - y0))
+        level = int(np.clip(np.floor(np.log2(self.resolution / needed)), 0, self.levels - 1))
+        res = self.level_resolution(level)
+
+        # pixel centers of the output, in pixels of the level
+        rx0, _, _, ry1 = self.region
+        cols = (x0 + (np.arange(width) + 0.5) * (x1 - x0) / width - rx0) * res - 0.5
+        rows = (ry1 - (y1 - (np.arange(height) + 0.5) * (y1 - y0) / height)) * res - 0.5
+
+        T = self.tile_size
+        nx, ny = self.n_tiles(level)
+        ix = np.arange(*np.clip([cols.min() // T, cols.max() // T + 1], 0, nx).astype(int))
+        iy = np.arange(*np.clip([rows.min() // T, rows.max() // T + 1], 0, ny).astype(int))
+        if ix.size == 0 or iy.size == 0:
+            return np.zeros((height, width, 4), dtype=np.uint8)
+
+        mosaic = np.zeros((iy.size * T, ix.size * T, 4), dtype=np.uint8)
+        for j, tile_y in enumerate(iy):
+            for i, tile_x in enumerate(ix):
+                mosaic[j * T : (j + 1) * T, i * T : (i + 1) * T] = self.tile(level, tile_x, tile_y)
+        return _bilinear(mosaic, rows - iy[0] * T, cols - ix[0] * T)
+
+    def plot(self, ax, extent, **kwargs):
+        """show the background of `extent` in `ax`, at the resolution of the axes, and set its extent
+
+        Parameters
+        ----------
+        ax : matplotlib.axes.Axes
+            axes, a cartopy GeoAxes if `projection` is "PlateCarree"
+        extent : tuple
+            (x0, x1, y0, y1) in degrees
+        kwargs :
+            other options given to `ax.imshow`
+        """
+        bbox = ax.get_window_extent()
+        shape = (max(2, int(round(bbox.height))), max(2, int(round(bbox.width))))
+        img = self.background(extent, shape)
+
+        kwargs = {"origin": "upper", "interpolation": "nearest", "zorder": 0, **kwargs}
+        if self.projection is None:
+            image = ax.imshow(img, extent=extent, **kwargs)
+            ax.set_xlim(*extent[:2])
+            ax.set_ylim(*extent[2:])
+        else:
+            crs = _plate_carree()
+            image = ax.imshow(img, extent=extent, transform=crs, **kwargs)
+            ax.set_extent(extent, crs=crs)
+        return image
@@ -1,20 +1,38 @@
 import argparse
+import importlib.util
 import logging
 import multiprocessing
+import os
+import sys
 import traceback
 
 import anim
 import anim.log  # noqa: F401
-from anim.anim import simple_building
 from anim.tools import Timing
 
 logger = logging.getLogger(__name__)
 
 
-def usage():
-    parser = argparse.ArgumentParser()
+def _nprocess(value):
+    return value if value == "auto" else int(value)
 
-    parser.add_argument("pythonfile", type=str, help="python file containing functions to plot and compute date")
+
+def usage(batch=False):
+    if batch:
+        parser = argparse.ArgumentParser(
+            prog="anim batch",
+            description="build several animations at the same time, on the same dask cluster",
+        )
+        parser.add_argument("pythonfile", type=str, nargs="+", help="python files of the animations")
+    else:
+        parser = argparse.ArgumentParser(
+            epilog=(
+                "use `anim merge pythonfile [FOLDER ...]` to gather images built by shards and encode the video, "
+                "`anim batch pythonfile [pythonfile ...]` to build several animations on the same cluster, "
+                "and `anim serve` to keep warm workers for `--server`"
+            )
+        )
+        parser.add_argument("pythonfile", type=str, help="python file containing functions to plot and compute date")
 
     parser.add_argument(
         "-v",
@@ -30,9 +48,23 @@ def usage():
         "-j",
         "--nprocess",
         action="store",
-        type=int,
+        type=_nprocess,
         default=multiprocessing.cpu_count() - 1,
-        help=f"number of core to use. By default, max-1 ({multiprocessing.cpu_count()-1})",
+        help=(
+            f"number of core to use. By default, max-1 ({multiprocessing.cpu_count()-1}). "
+            "If `auto`, a few images are built first to choose the number of workers and threads"
+        ),
+    )
+    group1.add_argument(
+        "-t",
+        "--threads",
+        action="store",
+        type=int,
+        default=1,
+        help=(
+            "number of threads by worker. Several images are built in the same process, which saves memory. "
+            "The plot function should build its figure with `anim.figure` or `anim.subplots` (pyplot is not thread safe)"
+        ),
     )
     group1.add_argument(
         "--no-compute",
@@ -69,6 +101,154 @@ def usage():
         help="compute only images with specified indices, without multiprocessing. Usefull for debbuging purposes.",
     )
 
+    group1.add_argument(
+        "--draft",
+        nargs="?",
+        type=int,
+        const=10,
+        default=False,
+        help=(
+            "Build a preview video using 1 frame every K frames (10 by default), saved with a reduced dpi. "
+            "Images are stored in a separate `draft` folder, full-quality images are left untouched."
+        ),
+    )
+    group1.add_argument(
+        "--draft-dpi",
+        type=int,
+        default=50,
+        help="dpi used to save images in draft mode. By default 50",
+    )
+
+    group1.add_argument(
+        "--codec",
+        type=str,
+        default=None,
+        help=(
+            "compressor used to send big data to workers : none, lz4, zstd, zstd:<level>[:noshuffle] or auto. "
+            "Overwrite the `ANIM_CODEC` in the python script"
+        ),
+    )
+
+    group1.add_argument(
+        "--transport",
+        choices=["dump", "delta", "cache"],
+        default=None,
+        help=(
+            "how data are sent to workers. `delta` sends only changes between consecutive frames, "
+            "rendered by the same worker. `cache` sends each distinct variable only once. Overwrite the `ANIM_TRANSPORT` in the python script"
+        ),
+    )
+
+    group1.add_argument(
+        "--worker-max-frames",
+        type=int,
+        default=None,
+        help="restart a worker after it built this number of images, to bound memory growth",
+    )
+    group1.add_argument(
+        "--worker-max-memory",
+        type=float,
+        default=None,
+        help="restart a worker when its memory exceed this value (in Go) after an image",
+    )
+
+    group1.add_argument(
+        "--order",
+        choices=["cost", "stratified", "sequential"],
+        default="cost",
+        help=(
+            "order used to build images. `cost` builds first the most expensive images of previous runs, "
+            "`stratified` builds one image every 64, then every 32, ... so a preview is available early"
+        ),
+    )
+
+    group1.add_argument(
+        "--layer-cache",
+        action="store_true",
+        help="save static layers of figures (see `anim.mark_static`) in the output folder, to reuse them between runs",
+    )
+
+    group1.add_argument(
+        "--compute-cache",
+        nargs="?",
+        const=True,
+        default=False,
+        metavar="KEY",
+        help=(
+            "save datasets yielded by `compute` in the output folder, and read them in next runs (also with --only "
+            "and --show) as long as the script is not modified. Change the optional KEY to compute data again"
+        ),
+    )
+
+    group1.add_argument(
+        "--prefetch",
+        type=int,
+        default=2,
+        help=(
+            "number of frames computed and compressed in advance, while previous frames are sent to workers. "
+            "0 to compute and send frames one after another. By default 2"
+        ),
+    )
+
+    group1.add_argument(
+        "--frame-store",
+        action="store_true",
+        help="save all images in a single memory-mapped file instead of one png by image. Needs ANIM_MAX_FRAMES",
+    )
+
+    shard = group1.add_mutually_exclusive_group()
+    shard.add_argument(
+        "--shard",
+        type=str,
+        default=None,
+        help=(
+            "build only the shard `k/N` of the frames (k from 1 to N), to split an animation between machines. "
+            "The video is encoded by `anim merge`"
+        ),
+    )
+    shard.add_argument(
+        "--frames",
+        type=str,
+        default=None,
+        help="build only frames START:STOP. The video is encoded by `anim merge`",
+    )
+
+    group1.add_argument(
+        "--segments",
+        nargs="?",
+        type=int,
+        const=250,
+        default=None,
+        help=(
+            "encode the video in segments of N images (250 by default) : after building again some images, "
+            "only segments containing them are encoded again"
+        ),
+    )
+
+    group1.add_argument(
+        "--preview",
+        action="store_true",
+        help="only encode `preview.mp4` from images already saved, at a lower fps if some are missing",
+    )
+
+    group1.add_argument(
+        "--server",
+        action="store_true",
+        help=(
+            "build images on the warm workers of `anim serve` instead of starting a new cluster. "
+            "With --only, images are built in parallel in the `sample` folder"
+        ),
+    )
+
+    group1.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "build sample images again each time the script is saved, in the `sample` folder. "
+            "Frames are given by --only, by default the first, middle and last ones"
+        ),
+    )
+
     group1.add_argument(
         "--ffmpeg-log",
         action="store_true",
@@ -94,26 +274,99 @@ def usage():
         help="specify the folder where images and video will be stored. Overwrite the `ANIM_OUTPUT_FOLDER` in the python script",
     )
 
-    return parser.parse_args()
-
+    if not batch:
+        args = parser.parse_args()
+        if args.watch and args.show is not False:
+            parser.error("--show cannot be used with --watch")
+        return args
+
+    args = parser.parse_args(sys.argv[2:])
+    for option, used in (
+        ("--show", args.show is not False),
+        ("--only", len(args.only) > 0),
+        ("--folder", args.folder is not None),
+        ("--watch", args.watch),
+        ("-j auto", args.nprocess == "auto"),
+    ):
+        if used:
+            parser.error(f"{option} cannot be used with `anim batch`")
+    return args
+
+
+def merge_usage():
+    parser = argparse.ArgumentParser(
+        prog="anim merge", description="gather images built by shards, check all images are built and encode the video"
+    )
+    parser.add_argument("pythonfile", type=str, help="python file of the animation")
+    parser.add_argument(
+        "folders", nargs="*", help="work folders of shards, if they are not the output folder of the animation"
+    )
+    parser.add_argument("-v", "--verbose", choices=["ERROR", "WARNING", "INFO", "DEBUG"], default="INFO")
+    parser.add_argument("--frame-store", action="store_true", help="shards saved images in a frame store")
+    parser.add_argument("--no-convert", action="store_true", help="only gather and check images")
+    parser.add_argument("--ffmpeg-log", action="store_true", help="print all ffmpeg logs")
+    parser.add_argument(
+        "--folder",
+        type=str,
+        default=None,
+        help="output folder. Overwrite the `ANIM_OUTPUT_FOLDER` in the python script",
+    )
+    return parser.parse_args(sys.argv[2:])
 
-def execfile_(filepath, _globals):
-    """Executes a Python code defined in a file"""
-    with open(filepath, "rb") as stream:
-        source = stream.read()
 
-    code = compile(source, filepath, "exec")
-    exec(code, _globals)
+def serve_usage():
+    parser = argparse.ArgumentParser(
+        prog="anim serve", description="keep a dask cluster with warm workers running, used by `anim --server`"
+    )
+    parser.add_argument("-v", "--verbose", choices=["ERROR", "WARNING", "INFO", "DEBUG"], default="INFO")
+    parser.add_argument("-j", "--nprocess", type=int, default=0, help="number of workers. By default all cpus but one")
+    parser.add_argument("-t", "--threads", type=int, default=1, help="number of threads by worker")
+    parser.add_argument("--port", type=int, default=8786, help="port of the scheduler, on localhost. By default 8786")
+    parser.add_argument("--stop", action="store_true", help="stop the running server")
+    return parser.parse_args(sys.argv[2:])
+
+
+def import_script(filepath):
+    """Import a Python file as a module named after the file.
+
+    The module is registered in `sys.modules`, so functions defined in the script are pickled by reference
+    (module + name) instead of by value when sent to dask workers.
+    """
+    name = os.path.splitext(os.path.basename(filepath))[0]
+
+    module = sys.modules.get(name, None)
+    # `client.upload_file` may reload the module from a copy of the script : its path is kept in `_anim_script`
+    path = getattr(module, "_anim_script", None) or os.path.abspath(getattr(module, "__file__", "") or "")
+    if module is not None and path != os.path.abspath(filepath):
+        raise RuntimeError(f"The script name '{name}' shadows an already imported module. Please rename your script")
+    if module is None:
+        # workers import functions of the script by name : the name should not resolve to another module
+        try:
+            spec = importlib.util.find_spec(name)
+        except (ImportError, ValueError):
+            spec = None
+        if spec is not None and spec.origin is not None and os.path.abspath(spec.origin) != os.path.abspath(filepath):
+            raise RuntimeError(f"The script name '{name}' shadows the module {spec.origin}. Please rename your script")
+
+    spec = importlib.util.spec_from_file_location(name, filepath)
+    module = importlib.util.module_from_spec(spec)
+    module._anim_script = os.path.abspath(filepath)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
 
 
 def eval_config_file(filename: str):
     """Evaluate a config file."""
 
-    namespace = dict(__file__=filename)
     logger.info(f"loading file {filename}...")
     with Timing() as dt:
         try:
-            execfile_(filename, namespace)
+            module = import_script(filename)
         except SyntaxError as err:
             raise RuntimeError(f"There is a syntax error in your configuration file: {err}\n")
         except SystemExit:
@@ -123,73 +376,261 @@ def eval_config_file(filename: str):
                 "There is a programmable error in your configuration " f"file:\n\n{traceback.format_exc()}"
             )
     logger.info(f"loading done ! ({dt})")
-    return namespace
+    return vars(module)
+
+
+def merge_app():
+    args = merge_usage()
+    anim.log.create_logger(level=args.verbose)
+    from anim.shard import merge
+
+    namespace = eval_config_file(args.pythonfile)
+    folder = args.folder if args.folder is not None else namespace.get("ANIM_OUTPUT_FOLDER", None)
+    if folder is None:
+        raise ValueError("miss variable `ANIM_OUTPUT_FOLDER` in the python file")
+
+    merge(
+        folder,
+        fps=namespace.get("ANIM_FPS", None),
+        max_frames=namespace.get("ANIM_MAX_FRAMES", None),
+        folders=args.folders,
+        frame_store=args.frame_store,
+        no_convert=args.no_convert,
+        ffmpeg_log=args.ffmpeg_log,
+    )
+
+
+def serve_app():
+    args = serve_usage()
+    anim.log.create_logger(level=args.verbose)
+    from anim.server import serve, stop
+
+    if args.stop:
+        stop()
+    else:
+        serve(nprocess=args.nprocess, threads=args.threads, port=args.port)
+
+
+def load_animation(pythonfile, args):
+    """parameters of :func:`anim.animate` for the animation defined in `pythonfile`, and the command line `args`"""
+    namespace = eval_config_file(pythonfile)
+
+    FOLDER = namespace.get("ANIM_OUTPUT_FOLDER", None)
+    if FOLDER is None:
+        msg = "miss variable `ANIM_OUTPUT_FOLDER` in the python file"
+        logging.error(msg)
+        raise ValueError(msg)
+
+    # parameter specified in command line overwrite the script one
+    if args.folder is not None:
+        FOLDER = args.folder
+
+    func_plot = namespace.get("plot", None)
+    if func_plot is None:
+        msg = "miss function named `plot` in the python file"
+        logging.error(msg)
+        raise ValueError(msg)
+
+    fps = namespace.get("ANIM_FPS", None)
+    if fps is None:
+        msg = "miss variable `ANIM_FPS` in the python file"
+        logging.error(msg)
+        raise ValueError(msg)
+
+    max_frames = namespace.get("ANIM_MAX_FRAMES", None)
+    max_frames = args.gif * fps if args.gif is not False else max_frames
+
+    frames = None
+    if args.shard is not None or args.frames is not None:
+        from anim.shard import parse_frames, shard_frames
+
+        if args.frames is not None:
+            frames = parse_frames(args.frames)
+        else:
+            frames = shard_frames(args.shard, max_frames, stride=args.draft or 1)
+
+    return dict(
+        f_plot=func_plot,
+        workFolder=FOLDER,
+        fps=fps,
+        compute=namespace.get("compute", None),
+        max_frames=max_frames,
+        savefig_kwargs=namespace.get("ANIM_SAVEFIG_KWARGS", dict()),
+        client=namespace.get("get_dask_client", None),
+        force=args.force,
+        nprocess=args.nprocess,
+        only_convert=args.no_compute,
+        no_convert=args.no_convert,
+        ffmpeg_log=args.ffmpeg_log,
+        draft=args.draft,
+        draft_dpi=args.draft_dpi,
+        script=pythonfile,
+        max_memory_ds=namespace.get("ANIM_MAX_MEMORY_DS", 1e6),
+        codec=args.codec if args.codec is not None else namespace.get("ANIM_CODEC", None),
+        transport=args.transport if args.transport is not None else namespace.get("ANIM_TRANSPORT", None),
+        source=namespace.get("ANIM_SOURCE", None),
+        worker_max_frames=args.worker_max_frames,
+        worker_max_memory=args.worker_max_memory * 1e9 if args.worker_max_memory is not None else None,
+        threads=args.threads,
+        order=args.order,
+        preview=args.preview,
+        layer_cache=args.layer_cache,
+        frame_store=args.frame_store,
+        frames=frames,
+        compute_cache=args.compute_cache,
+        keyframes=namespace.get("ANIM_KEYFRAMES", None),
+        prefetch=args.prefetch,
+        segment_size=args.segments,
+    )
+
+
+class BatchProgress:
+    """log progress of all animations of a batch, every 10% of images"""
+
+    def __init__(self, n_animations):
+        self.n_animations = n_animations
+        self.n_done = 0
+        self.images = dict()
+        self.last = None
+
+    def __call__(self, event):
+        if event.stage == "images":
+            self.images[event.name] = (event.done, event.total)
+            done = sum(d for d, _ in self.images.values())
+            total = sum(t for _, t in self.images.values())
+            decile = 10 * done // total if total > 0 else 10
+            if decile != self.last:
+                self.last = decile
+                logger.info(f"batch : {done}/{total} images built")
+        elif event.stage == "done":
+            self.n_done += 1
+            logger.info(f"batch : [{self.n_done}/{self.n_animations}] {event.name} done")
+
+
+async def run_batch(animations, client):
+    """build all `animations` (parameters of :func:`anim.animate`) at the same time with `client`"""
+    import asyncio
+
+    from anim.anim import animate_async
+
+    progress = BatchProgress(len(animations))
+    return await asyncio.gather(
+        *(animate_async(**{**kwargs, "client": client}, progress=progress) for kwargs in animations),
+        return_exceptions=True,
+    )
+
+
+def batch_app():
+    args = usage(batch=True)
+    anim.log.create_logger(level=args.verbose)
+    import asyncio
+
+    from anim.anim import build_client
+
+    with Timing() as dt:
+        animations = [load_animation(pythonfile, args) for pythonfile in args.pythonfile]
+        folders = [os.path.normpath(kwargs["workFolder"]) for kwargs in animations]
+        if len(set(folders)) != len(folders):
+            raise ValueError("several animations of the batch use the same `ANIM_OUTPUT_FOLDER`")
+
+        # one client for all animations : the server, the one of the first script defining `get_dask_client`,
+        # or a local cluster
+        if args.server:
+            from anim.server import server_client
+
+            client, need_delete_client = server_client(), False
+        else:
+            client = next((kwargs["client"] for kwargs in animations if kwargs["client"] is not None), None)
+            client, need_delete_client = build_client(client, args.nprocess, args.threads)
+        try:
+            results = asyncio.run(run_batch(animations, client))
+        finally:
+            if need_delete_client:
+                client.close()
+                client.cluster.close()
+            elif args.server:
+                client.close()
+
+        failed = 0
+        for pythonfile, result in zip(args.pythonfile, results):
+            if isinstance(result, BaseException):
+                failed += 1
+                logger.error(f"{pythonfile} failed : {result!r}")
+            elif args.gif is not False and result is not None:
+                anim.video2gif(result, args.gif)
+
+    logger.info(f"total time for anim batch : {dt}")
+    if failed > 0:
+        raise RuntimeError(f"{failed}/{len(results)} animations failed")
+
+
+def watch_app(args):
+    from anim.anim import build_client
+    from anim.watch import watch
+
+    # workers are kept between renders : the server, or a local cluster started once
+    if args.server:
+        from anim.server import server_client
+
+        client, need_delete_client = server_client(), False
+    else:
+        nprocess = 0 if args.nprocess == "auto" else args.nprocess
+        client, need_delete_client = build_client(None, nprocess, args.threads)
+    try:
+        watch(args.pythonfile, lambda pythonfile: load_animation(pythonfile, args), client, sample=args.only)
+    finally:
+        client.close()
+        if need_delete_client:
+            client.cluster.close()
 
 
 def app():
+    if len(sys.argv) > 1 and sys.argv[1] == "merge":
+        return merge_app()
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        return batch_app()
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        return serve_app()
+
     args = usage()
     anim.log.create_logger(level=args.verbose)
+    if args.watch:
+        return watch_app(args)
+
     with Timing() as dt:
-        namespace = eval_config_file(args.pythonfile)
-
-        FOLDER = namespace.get("ANIM_OUTPUT_FOLDER", None)
-        if FOLDER is None:
-            msg = "miss variable `ANIM_OUTPUT_FOLDER` in the python file"
-            logging.error(msg)
-            raise ValueError(msg)
-
-        # parameter specified in command line overwrite the script one
-        if args.folder is not None:
-            FOLDER = args.folder
-
-        func_plot = namespace.get("plot", None)
-        if func_plot is None:
-            msg = "miss function named `plot` in the python file"
-            logging.error(msg)
-            raise ValueError(msg)
-
-        fps = namespace.get("ANIM_FPS", None)
-        if fps is None:
-            msg = "miss variable `ANIM_FPS` in the python file"
-            logging.error(msg)
-            raise ValueError(msg)
-
-        compute = namespace.get("compute", None)
-        savefig_kwargs = namespace.get("ANIM_SAVEFIG_KWARGS", dict())
-        max_frames = namespace.get("ANIM_MAX_FRAMES", None)
-        max_frames = args.gif * fps if args.gif is not False else max_frames
-
-        get_dask_client = namespace.get("get_dask_client", None)
-
-        if (args.show is not False) or len(args.only) > 0:
+        kwargs = load_animation(args.pythonfile, args)
+        if args.server:
+            from anim.server import server_client
+
+            kwargs["client"] = server_client()
+
+        if args.server and args.show is False and len(args.only) > 0:
+            anim.animate(**kwargs, sample=args.only)
+
+        elif (args.show is not False) or len(args.only) > 0:
+            from anim.anim import compute_cache_folder, simple_building
+
             simple_building(
-                f_plot=func_plot,
-                compute=compute,
-                max_frames=max_frames,
+                f_plot=kwargs["f_plot"],
+                compute=kwargs["compute"],
+                max_frames=kwargs["max_frames"],
                 indices=args.only,
-                savefig_kwargs=savefig_kwargs,
+                savefig_kwargs=kwargs["savefig_kwargs"],
                 show=args.show,
+                source=kwargs["source"],
+                compute_cache=compute_cache_folder(kwargs["workFolder"], args.compute_cache),
+                keyframes=kwargs["keyframes"],
             )
 
         else:
-            videoName = anim.animate(
-                f_plot=func_plot,
-                workFolder=FOLDER,
-                fps=fps,
-                compute=compute,
-                max_frames=max_frames,
-                savefig_kwargs=savefig_kwargs,
-                client=get_dask_client,
-                force=args.force,
-                nprocess=args.nprocess,
-                only_convert=args.no_compute,
-                no_convert=args.no_convert,
-                ffmpeg_log=args.ffmpeg_log,
-            )
+            videoName = anim.animate(**kwargs)
 
-            if args.gif is not False:
+            if args.gif is not False and videoName is not None:
                 anim.video2gif(videoName, args.gif)
 
+        if args.server:
+            kwargs["client"].close()
+
     logger.info(f"total time for anim tool : {dt}")
 
 
@@ -0,0 +1,150 @@
+"""Keep datasets yielded by `compute` on disk, to build images again without computing data.
+
+Each dataset is saved in a zarr store `<folder>/<key>/<frame>.zarr`, where `key` is a hash of the source code of
+`compute` and of the script defining it. When the script is modified, a new cache is used. Functions imported from
+other modules are not part of the key : delete the cache folder if they change.
+
+Attributes are saved with pickle next to the zarr store, as zarr only accepts json attributes. Once the end of
+`compute` is reached, the number of frames is saved in `<folder>/<key>/n_frames`, so next runs don't call
+`compute` again only to find its end.
+"""
+
+import hashlib
+import inspect
+import logging
+import os
+import pickle
+import shutil
+
+import xarray as xr
+
+from anim.tools import FrameIterator
+
+logger = logging.getLogger(__name__)
+
+
+def compute_key(compute):
+    """hash of the source code of `compute`"""
+    try:
+        source = inspect.getsource(compute)
+    except (OSError, TypeError):
+        source = f"{getattr(compute, '__module__', '')}.{getattr(compute, '__qualname__', repr(compute))}"
+    return hashlib.blake2b(source.encode(), digest_size=8).hexdigest()
+
+
+def script_key(compute):
+    """hash of the source code of `compute` and of the module defining it"""
+    module = inspect.getmodule(compute)
+    try:
+        source = inspect.getsource(module) if module is not None else ""
+    except (OSError, TypeError):
+        source = ""
+    return hashlib.blake2b(f"{compute_key(compute)}{source}".encode(), digest_size=8).hexdigest()
+
+
+class ComputeCache:
+    """`compute` function reading datasets from the cache, and computing only the missing ones
+
+    Can be used as a `compute` function, with the `compute(start=i)` protocol (see :class:`anim.tools.FrameIterator`).
+
+    Parameters
+    ----------
+    compute : callable
+        `compute` function of the animation
+    folder : str
+        folder of the cache
+    """
+
+    def __init__(self, compute, folder):
+        self.compute = compute
+        self.folder = os.path.join(folder, script_key(compute))
+
+    def filename(self, i):
+        return os.path.join(self.folder, f"{i}.zarr")
+
+    @staticmethod
+    def attrs_filename(store):
+        return os.path.join(store, "attrs.pkl")
+
+    @property
+    def n_frames_filename(self):
+        return os.path.join(self.folder, "n_frames")
+
+    @property
+    def n_frames(self):
+        """number of frames yielded by `compute`, None while the end of `compute` was not reached"""
+        try:
+            with open(self.n_frames_filename) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def save_n_frames(self, n):
+        os.makedirs(self.folder, exist_ok=True)
+        tmp = f"{self.n_frames_filename}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(n))
+        os.replace(tmp, self.n_frames_filename)
+
+    def __contains__(self, i):
+        return os.path.exists(self.filename(i))
+
+    def load(self, i):
+        with xr.open_zarr(self.filename(i)) as ds:
+            ds = ds.load()
+        with open(self.attrs_filename(self.filename(i)), "rb") as f:
+            attrs, variables = pickle.load(f)
+        ds.attrs.update(attrs)
+        for name, var_attrs in variables.items():
+            ds[name].attrs.update(var_attrs)
+        return ds
+
+    def save(self, i, ds):
+        if not isinstance(ds, xr.Dataset):
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        # written in a temporary store, so a partial dataset is never read
+        tmp = f"{self.filename(i)}.{os.getpid()}.tmp"
+        # attributes may not be json serializable (datetime64, arrays, ...) : they are pickled
+        attrs = (ds.attrs, {name: var.attrs for name, var in ds.variables.items()})
+        ds = ds.drop_encoding()
+        ds.attrs = dict()
+        for var in ds.variables.values():
+            var.attrs = dict()
+        try:
+            ds.to_zarr(tmp, mode="w")
+            with open(self.attrs_filename(tmp), "wb") as f:
+                pickle.dump(attrs, f)
+        except Exception as err:
+            logger.warning(f"dataset of frame {i} not cached : {err}")
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        try:
+            os.rename(tmp, self.filename(i))
+        except OSError:
+            # already saved by another run
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def __call__(self, start=0):
+        frames = None
+        n_frames = self.n_frames
+        i = start
+        while True:
+            if i in self:
+                yield self.load(i)
+            elif n_frames is not None and i >= n_frames:
+                # the end of compute is known : it is not started again to find it
+                return
+            else:
+                # compute is only started for the first missing frame
+                if frames is None:
+                    frames = FrameIterator(self.compute)
+                frames.seek(i)
+                try:
+                    ds = next(frames)
+                except StopIteration:
+                    self.save_n_frames(i)
+                    return
+                self.save(i, ds)
+                yield ds
+            i += 1
@@ -1,35 +1,46 @@
-from dataclasses import dataclass, field
+import logging
+import os
+from dataclasses import dataclass, field, fields
 
+import numcodecs
 import numpy as np
 import pandas
 import xarray as xr
 import zarr
 
-from anim.tools import Timing
+from anim.source import Selection
+from anim.tools import Timing, file_lock
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
 class Stats:
     img_name: str = None  # filled in `process`
+    frame: float = np.nan  # filled in `build_images`
     img_building: float = np.nan  # filled in `process`
     img_saving: float = np.nan  # filled in `process`
     time_data_compress: float = np.nan  # filled in `dump_data`
     time_data_uncompress: float = np.nan  # filled in `load_data`
+    time_data_read: float = np.nan  # filled in `load_data`
     time_data_computation: float = np.nan  # filled in `animate`
     size_data_uncompressed: float = np.nan  # filled in `dump_data`
     size_data_compressed: float = np.nan  # filled in `dump_data`
+    cache_hits: float = np.nan  # filled in `CacheTransport.send`
+    cache_misses: float = np.nan  # filled in `CacheTransport.send`
+    rss_before: float = np.nan  # filled in `process`
+    rss_after: float = np.nan  # filled in `process`
+    worker: str = None  # filled in `process`
+    pyplot_figure: float = np.nan  # filled in `process`, 1 if the figure is managed by pyplot
+    static_layer_hit: float = np.nan  # filled in `process`, 1 if the static layer was already rendered
 
     def __or__(self, other):
         stat = Stats()
-        stat.img_name = other.img_name if other.img_name is not None else self.img_name
         for k, v in other.__dict__.items():
-            if k == "img_name":
-                continue
-
-            if not np.isnan(v):
-                setattr(stat, k, v)
-            else:
+            if v is None or (isinstance(v, float) and np.isnan(v)):
                 setattr(stat, k, getattr(self, k))
+            else:
+                setattr(stat, k, v)
         return stat
 
     def to_dict(self):
@@ -58,6 +69,12 @@ class Stats:
             # msg = msg + f", compress={self.time_data_compress*1e3:.2f}ms"
             data[-1] += f"[{self.time_data_compress*1e3:6.2f}ms]"
 
+        if not np.isnan(self.time_data_read):
+            data.append(f"read={self.time_data_read*1e3:6.2f}ms")
+
+        if not np.isnan(self.cache_hits):
+            data.append(f"cache={self.cache_hits:.0f}/{self.cache_hits + self.cache_misses:.0f}")
+
         msg_data = ",".join(data)
         msg_data = f"data=({msg_data})"
         msg.append(msg_data)
@@ -68,6 +85,9 @@ class Stats:
         if not np.isnan(self.img_saving):  # is not None:
             img.append(f"save={self.img_saving*1e3:6.2f}ms")
 
+        if not np.isnan(self.rss_after):
+            img.append(f"rss={self.rss_before/1e6:.0f}->{self.rss_after/1e6:.0f}Mo")
+
         if len(img) > 0:
             msg_img = ",".join(img)
             msg_img = f"image=({msg_img})"
@@ -91,21 +111,34 @@ class StatStorage:
     def __getitem__(self, stat):
         return self.data[stat.img_name]
 
+    def _dataframe(self):
+        # columns are kept when no image was built (cancelled before the first one)
+        return pandas.DataFrame(list(x.to_dict() for x in self.data.values()), columns=[f.name for f in fields(Stats)])
+
     def build_dataframe(self):  # describe(self):
-        df = pandas.DataFrame(list(x.to_dict() for x in self.data.values()))
+        df = self._dataframe()
         del df["img_name"]
+        del df["worker"]
+        del df["frame"]
         units = {}  # "img_name": "img_name"}
         for k in "size_data_uncompressed", "size_data_compressed":
             df[k] = df[k] / 1e6
             units[k] = f"{k[5:]} (Mo)"
 
-        for k in ("time_data_compress", "time_data_uncompress", "time_data_computation"):
+        for k in "rss_before", "rss_after":
+            df[k] = df[k] / 1e6
+            units[k] = f"{k} (Mo)"
+
+        for k in ("time_data_compress", "time_data_uncompress", "time_data_read", "time_data_computation"):
             df[k] = df[k] * 1e3
             units[k] = f"{k[5:]} (ms)"
 
         for k in ("img_building", "img_saving"):
             units[k] = f"{k[4:]} (s)"
 
+        for k in ("cache_hits", "cache_misses", "pyplot_figure", "static_layer_hit"):
+            units[k] = k.replace("_", " ")
+
         df.columns = [f"{units[k]}" for k in df.columns]
         return df
 
@@ -113,6 +146,46 @@ class StatStorage:
     def size(self):
         return len(self.data)
 
+    def save(self, filename):
+        """save stats of images built, merged with stats already saved by previous runs
+
+        Shards building the same animation save their stats in the same file : the file is read and replaced under
+        a lock, and never partially written.
+        """
+        df = self._dataframe()
+        merge_stats(filename, df[df["img_building"].notna()])
+
+
+def merge_stats(filename, df):
+    """merge stats of `df` in `filename`, stats of `df` replace the ones already saved for the same frames
+
+    The file is read and replaced under a lock, and never partially written.
+    """
+    with file_lock(filename):
+        if os.path.exists(filename):
+            df = pandas.concat([pandas.read_csv(filename), df])
+        df = df.drop_duplicates("frame", keep="last").sort_values("frame")
+        tmp = f"{filename}.{os.getpid()}"
+        df.to_csv(tmp, index=False)
+        os.replace(tmp, filename)
+
+
+def load_frame_costs(filename):
+    """time needed to build each frame (in s), from stats saved by :meth:`StatStorage.save`
+
+    Returns
+    -------
+    dict
+        {frame: cost}, empty if no stats saved
+    """
+    if not os.path.exists(filename):
+        return dict()
+
+    df = pandas.read_csv(filename)
+    columns = ["img_building", "img_saving", "time_data_uncompress", "time_data_read"]
+    cost = df.reindex(columns=columns).fillna(0).sum(axis=1)
+    return dict(zip(df["frame"].astype(int), cost))
+
 
 @dataclass
 class AnimationInfo:
@@ -120,6 +193,175 @@ class AnimationInfo:
     checkIfImageExist: bool = False
     onlyCompute: bool = False
     savefig_kwargs: dict = field(default_factory=dict)
+    stride: int = 1  # only frames multiple of `stride` are saved, as image `i // stride`
+    threads: int = 1  # threads by worker
+    layer_cache: str = None  # folder where static layers are saved, see `anim.layers`
+    frameStore: object = None  # anim.store.FrameStore where images are written, instead of png files
+
+
+@dataclass
+class Progress:
+    """progress event of an animation, given to the `progress` callback of :func:`anim.anim.animate`"""
+
+    stage: str  # "images" : images are built, "video" : the video is encoded, "done" : the animation is finished
+    done: int = 0  # images built
+    total: int = 0  # images to build by this run
+    name: str = None  # work folder of the animation
+    result: object = None  # video name, once the animation is done
+
+
+@dataclass
+class Codec:
+    """compressor used to store a variable in zarr, before sending it to workers
+
+    can be built from a string with :meth:`Codec.parse` : "none", "lz4", "zstd", "zstd:3", "zstd:3:noshuffle"
+    """
+
+    name: str = "zstd"  # "none", "lz4" or "zstd"
+    level: int = 5
+    shuffle: bool = True
+
+    names = ("none", "lz4", "zstd")
+
+    def __post_init__(self):
+        if self.name not in self.names:
+            raise ValueError(f"codec should be one of {self.names}, not '{self.name}'")
+
+    @classmethod
+    def parse(cls, codec):
+        if isinstance(codec, Codec):
+            return codec
+
+        name, *options = codec.split(":")
+        kwargs = dict(name=name)
+        for option in options:
+            if option in ("shuffle", "noshuffle"):
+                kwargs["shuffle"] = option == "shuffle"
+            else:
+                kwargs["level"] = int(option)
+        return cls(**kwargs)
+
+    def compressor(self):
+        if self.name == "none":
+            return None
+
+        shuffle = numcodecs.Blosc.SHUFFLE if self.shuffle else numcodecs.Blosc.NOSHUFFLE
+        return numcodecs.Blosc(cname=self.name, clevel=self.level, shuffle=shuffle)
+
+    def __str__(self):
+        if self.name == "none":
+            return self.name
+        return f"{self.name}:{self.level}:{'shuffle' if self.shuffle else 'noshuffle'}"
+
+
+class CodecSelector:
+    """choose automatically the codec which minimise compression + transfer time
+
+    Each candidate is tried on the first frames, then the one with the lowest
+    `time_data_compress + size_data_compressed / bandwidth` (from :class:`Stats`) is always used.
+
+    Parameters
+    ----------
+    candidates : list, optional
+        codecs to try, by default ("none", "lz4", "zstd:1", "zstd:5")
+    n_trials : int, optional
+        number of frames compressed with each candidate, by default 2
+    bandwidth : float, optional
+        network bandwidth between the client and workers, in bytes/s. By default 100e6 (~ 1Gb/s)
+    """
+
+    def __init__(self, candidates=("none", "lz4", "zstd:1", "zstd:5"), n_trials=2, bandwidth=100e6):
+        self.candidates = [Codec.parse(c) for c in candidates]
+        self.n_trials = n_trials
+        self.bandwidth = bandwidth
+        self.costs = {str(c): [] for c in self.candidates}
+        self.best = None
+
+    def choose(self):
+        if self.best is not None:
+            return self.best
+
+        # next candidate which still need trials
+        return min(self.candidates, key=lambda c: len(self.costs[str(c)]))
+
+    def update(self, codec, stats: Stats):
+        if self.best is not None or np.isnan(stats.time_data_compress):
+            return
+
+        cost = stats.time_data_compress + stats.size_data_compressed / self.bandwidth
+        self.costs[str(codec)].append(cost)
+
+        if all(len(v) >= self.n_trials for v in self.costs.values()):
+            self.best = min(self.candidates, key=lambda c: np.mean(self.costs[str(c)]))
+            msg = ", ".join(f"{k}={np.mean(v)*1e3:.2f}ms" for k, v in self.costs.items())
+            logger.info(f"codec '{self.best}' selected ({msg})")
+
+
+def build_encoding(ds: xr.Dataset, codec=None, encoding: dict or None = None):
+    """build zarr encoding from codec specification
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        dataset to be encoded
+    codec : str, Codec or dict, optional
+        codec used for all variables, or a dict {variable: codec}. If None, use zarr default compressor
+    encoding : dict, optional
+        encoding given to `ds.to_zarr(...)`, which has priority over `codec`
+    """
+
+    encoding = dict() if encoding is None else encoding
+    if codec is None:
+        return encoding
+
+    if not isinstance(codec, dict):
+        codec = {var: codec for var in ds.variables}
+
+    full_encoding = {
+        var: {"compressor": Codec.parse(c).compressor()} for var, c in codec.items() if var in ds.variables
+    }
+    for var, enc in encoding.items():
+        full_encoding[var] = full_encoding.get(var, dict()) | enc
+    return full_encoding
+
+
+class RecyclingPolicy:
+    """decide when a worker should be restarted, to bound memory growth over long runs
+
+    Parameters
+    ----------
+    max_frames : int, optional
+        restart a worker after it built `max_frames` images, by default None
+    max_memory : float, optional
+        restart a worker when its memory (RSS, in bytes) exceed `max_memory` after an image, by default None
+    """
+
+    def __init__(self, max_frames=None, max_memory=None):
+        self.max_frames = max_frames
+        self.max_memory = max_memory
+        self.frames = dict()  # worker -> number of images built
+
+    @property
+    def active(self):
+        return self.max_frames is not None or self.max_memory is not None
+
+    def __call__(self, stats: Stats):
+        """record an image built, return True if its worker should be restarted"""
+        if not self.active or stats.worker is None:
+            return False
+
+        self.frames[stats.worker] = self.frames.get(stats.worker, 0) + 1
+        if self.max_frames is not None and self.frames[stats.worker] >= self.max_frames:
+            logger.info(f"worker {stats.worker} built {self.frames[stats.worker]} images, restarting it")
+            return True
+
+        if self.max_memory is not None and stats.rss_after > self.max_memory:
+            logger.info(f"worker {stats.worker} uses {stats.rss_after/1e9:.2f}Go, restarting it")
+            return True
+        return False
+
+    def reset(self, worker):
+        self.frames.pop(worker, None)
 
 
 def zarr_weight(group):
@@ -127,7 +369,12 @@ def zarr_weight(group):
     return sum(group[var].nbytes_stored for var in group.array_keys())
 
 
-def load_data(raw: xr.Dataset | zarr.hierarchy.Group):
+def load_data(raw: xr.Dataset | zarr.hierarchy.Group | Selection):
+    if isinstance(raw, Selection):
+        with Timing() as timing:
+            ds = raw.load()
+        return ds, Stats(time_data_read=timing.dt)
+
     if isinstance(raw, zarr.hierarchy.Group):
         with Timing() as timing:
             ds = xr.open_zarr(raw.store, chunks=None).load()
@@ -137,7 +384,7 @@ def load_data(raw: xr.Dataset | zarr.hierarchy.Group):
     return raw, Stats()
 
 
-def dump_data(ds: xr.Dataset or zarr.hierarchy.Group, max_size=1e6, encoding: dict() or None = None):
+def dump_data(ds: xr.Dataset or zarr.hierarchy.Group, max_size=1e6, encoding: dict() or None = None, codec=None):
     # if data is already compressed
     stats = Stats(size_data_uncompressed=ds.nbytes)
 
@@ -148,7 +395,7 @@ def dump_data(ds: xr.Dataset or zarr.hierarchy.Group, max_size=1e6, encoding: di
     elif ds.nbytes > max_size:
         zg = zarr.group()
         with Timing() as timing:
-            ds.to_zarr(zg._store, mode="w", encoding=encoding)
+            ds.to_zarr(zg._store, mode="w", encoding=build_encoding(ds, codec, encoding))
 
         stats.size_data_compressed = zarr_weight(zg)
         stats.time_data_compress = timing.dt
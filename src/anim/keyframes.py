@@ -0,0 +1,91 @@
+"""Datasets at coarse timestamps, interpolated by workers for each frame.
+
+Instead of interpolating data for each frame in `compute`, the keyframes (for example hourly model outputs) are sent
+once to the workers, and each worker interpolates the keyframes bracketing its frame (see
+:class:`anim.transport.KeyframeTransport`).
+
+example :
+
+path = TimePath(coords=(0, 0), t0=np.datetime64("2020-01-01"))
+path.move(np.timedelta64(2, "D"), coords=(10, 5))
+dates, extents, speed = path.compute_path(np.timedelta64(1, "m"))
+
+ANIM_KEYFRAMES = Keyframes(xr.open_dataset("hourly.nc"), times=dates)
+
+def plot(i, ds):
+    # ds is interpolated at dates[i]
+    ...
+"""
+
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+import xarray as xr
+
+logger = logging.getLogger(__name__)
+
+
+def interp_keyframes(keyframes, t, dim="time", method="linear"):
+    """dataset at `t`, interpolated between keyframes (datasets with a `dim` dimension of size 1)"""
+    ds = xr.concat(keyframes, dim)
+    if ds.sizes[dim] == 1:
+        return ds.isel({dim: 0})
+    if method == "cubic" and ds.sizes[dim] < 4:
+        method = "linear"
+    return ds.interp({dim: np.atleast_1d(t)}, method=method).isel({dim: 0})
+
+
+@dataclass
+class Keyframes:
+    """keyframes of an animation, interpolated at the time of each frame
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        keyframes, along dimension `dim`
+    times : numpy.ndarray
+        time of each frame, for example the dates returned by :meth:`anim.path.TimePath.compute_path`
+    dim : str, optional
+        time dimension of `ds`, by default "time"
+    method : str, optional
+        "linear" (2 keyframes by frame) or "cubic" (4 keyframes by frame), by default "linear"
+    """
+
+    ds: xr.Dataset
+    times: np.ndarray
+    dim: str = "time"
+    method: str = "linear"
+
+    methods = ("linear", "cubic")
+
+    def __post_init__(self):
+        if self.method not in self.methods:
+            raise ValueError(f"method should be one of {self.methods}, not '{self.method}'")
+
+        self.times = np.asarray(self.times)
+        self.keytimes = self.ds[self.dim].values
+        if self.times.min() < self.keytimes[0] or self.times.max() > self.keytimes[-1]:
+            logger.warning("some frames are outside of keyframes times, their data will be NaN")
+
+    @property
+    def size(self):
+        return self.times.size
+
+    def compute(self, start=0):
+        """yield the time of each frame, can be used as a `compute` function"""
+        yield from self.times[start:]
+
+    def indices(self, t):
+        """indices of the keyframes needed to interpolate at `t`"""
+        n = self.keytimes.size
+        k = int(np.clip(np.searchsorted(self.keytimes, t, side="right") - 1, 0, max(n - 2, 0)))
+        window = (k - 1, k + 3) if self.method == "cubic" else (k, k + 2)
+        return list(range(max(window[0], 0), min(window[1], n)))
+
+    def keyframe(self, k):
+        return self.ds.isel({self.dim: slice(k, k + 1)}).load()
+
+    def interp(self, t):
+        """dataset at `t`, interpolated on the driver"""
+        return interp_keyframes([self.keyframe(k) for k in self.indices(t)], t, self.dim, self.method)
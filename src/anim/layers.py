@@ -0,0 +1,221 @@
+"""Render the static background of a figure once, and only the dynamic artists for each frame.
+
+Artists marked with :func:`mark_static` (and the background of the figure and of each axes) form the static
+layer. It is rendered once for each distinct figure layout (size, dpi, axes positions, limits and projections)
+and content of the static artists (data, colors, texts), and kept in memory by the worker (and optionally on disk). For each frame, only the other artists are rendered
+on a transparent background, and composited over the static layer.
+
+The static layer is always below the dynamic one, whatever the zorder of the artists.
+
+example :
+
+def plot(i, ds):
+    fig, ax = anim.subplots(1, 1, figsize=(8, 4), dpi=120)
+    anim.mark_static(ax.imshow(topography, extent=extent))
+    ax.set_xlim(*extent[:2])
+    ax.set_ylim(*extent[2:])
+    ax.scatter(ds.lon, ds.lat)
+    return fig
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import matplotlib.image
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.collections import Collection
+from matplotlib.image import AxesImage
+from matplotlib.lines import Line2D
+from matplotlib.patches import Patch
+from matplotlib.text import Text
+
+from anim.render import to_rgba
+
+logger = logging.getLogger(__name__)
+
+# static layers rendered by this process (so by each worker), indexed by layer_key
+_static_layers = OrderedDict()
+_static_layers_lock = threading.Lock()
+max_static_layers = 16
+
+# only these savefig options are used when rendering layers, others fall back to `fig.savefig`
+supported_savefig_kwargs = ("dpi",)
+
+
+def mark_static(*artists, key=None):
+    """mark artists as static : they are rendered once and reused by next frames with the same layout
+
+    Parameters
+    ----------
+    artists : matplotlib.artist.Artist
+        artists which don't change between frames (background image, coastlines, land, gridlines, ...)
+    key : hashable, optional
+        added to the key of the static layer. Needed if static artists change in a way not seen by the key
+        (data of a cartopy feature for example). By default None
+    """
+    for artist in artists:
+        artist._anim_static = True
+        figure = artist.get_figure()
+        if figure is not None and key is not None:
+            figure._anim_static_key = key
+
+
+def has_static_layer(fig):
+    """True if some artists of the figure are marked static"""
+    return any(getattr(artist, "_anim_static", False) for artist, _ in _layer_artists(fig))
+
+
+def _layer_artists(fig):
+    """yield (artist, static) for each artist drawn by the figure. Figure and axes backgrounds are static"""
+    for child in fig.get_children():
+        if child is fig.patch:
+            yield child, True
+        elif isinstance(child, Axes):
+            for artist in child.get_children():
+                yield artist, artist is child.patch or getattr(artist, "_anim_static", False)
+        else:
+            yield child, getattr(child, "_anim_static", False)
+
+
+def _projection(ax):
+    projection = getattr(ax, "projection", None)
+    if projection is None:
+        return ax.name
+    # cartopy projections
+    return getattr(projection, "proj4_init", type(projection).__name__)
+
+
+def _hash_artist(h, artist):
+    """add what is drawn by a static artist to the hash `h` : its data and style"""
+    h.update(type(artist).__name__.encode())
+    style = [artist.get_zorder(), artist.get_alpha(), artist.get_visible()]
+    arrays = []
+    if isinstance(artist, AxesImage):
+        arrays.append(artist.get_array())
+        style += [artist.get_extent(), artist.get_cmap().name, artist.norm.vmin, artist.norm.vmax]
+    elif isinstance(artist, Line2D):
+        arrays.append(artist.get_xydata())
+        style += [artist.get_color(), artist.get_linewidth(), artist.get_linestyle(), artist.get_marker()]
+    elif isinstance(artist, Collection):
+        arrays += [artist.get_offsets(), artist.get_facecolor(), artist.get_edgecolor(), artist.get_linewidth()]
+        arrays += [path.vertices for path in artist.get_paths()]
+        if artist.get_array() is not None:
+            arrays.append(artist.get_array())
+            style += [artist.get_cmap().name, artist.norm.vmin, artist.norm.vmax]
+    elif isinstance(artist, Patch):
+        arrays.append(artist.get_path().vertices)
+        style += [artist.get_facecolor(), artist.get_edgecolor(), artist.get_linewidth()]
+    elif isinstance(artist, Text):
+        style += [artist.get_text(), artist.get_position(), artist.get_color(), artist.get_fontsize()]
+    # cartopy features
+    feature = getattr(artist, "_feature", None)
+    if feature is not None:
+        style += [type(feature).__name__, getattr(feature, "name", None), getattr(feature, "scale", None)]
+
+    h.update(repr(style).encode())
+    for array in arrays:
+        array = np.ma.getdata(array)
+        h.update(repr((array.dtype, array.shape)).encode())
+        h.update(np.ascontiguousarray(array).data)
+
+
+def layer_key(fig, dpi):
+    """key of the static layer : figure size, dpi, position, limits and projection of each axes,
+    and data and style of static artists"""
+    key = [tuple(fig.get_size_inches()), dpi, getattr(fig, "_anim_static_key", None)]
+    for ax in fig.axes:
+        key.append((tuple(ax.get_position().bounds), ax.get_xlim(), ax.get_ylim(), _projection(ax)))
+    h = hashlib.blake2b(repr(key).encode(), digest_size=16)
+    for artist, static in _layer_artists(fig):
+        if static:
+            _hash_artist(h, artist)
+    return h.hexdigest()
+
+
+def _draw(fig, dpi, static):
+    """render only the static (or dynamic) artists, as a RGBA array"""
+    artists = [(artist, artist.get_visible()) for artist, s in _layer_artists(fig) if s != static]
+    try:
+        for artist, _ in artists:
+            artist.set_visible(False)
+        return to_rgba(fig, dpi)
+    finally:
+        for artist, visible in artists:
+            artist.set_visible(visible)
+
+
+def static_layer(fig, dpi, cache_folder=None):
+    """RGBA array of the static layer, rendered only if not already in the worker memory or in `cache_folder`
+
+    Returns
+    -------
+    tuple(numpy.ndarray, bool)
+        the static layer, and True if it was already rendered
+    """
+    key = layer_key(fig, dpi)
+    with _static_layers_lock:
+        if key in _static_layers:
+            _static_layers.move_to_end(key)
+            return _static_layers[key], True
+
+    filename = None if cache_folder is None else os.path.join(cache_folder, f"{key}.npy")
+    if filename is not None and os.path.exists(filename):
+        layer, hit = np.load(filename), True
+    else:
+        layer, hit = _draw(fig, dpi, static=True), False
+        if filename is not None:
+            os.makedirs(cache_folder, exist_ok=True)
+            # written in a temporary file, so other workers never read a partial layer
+            tmp = f"{filename}.{os.getpid()}.{threading.get_ident()}.npy"
+            np.save(tmp, layer)
+            os.replace(tmp, filename)
+
+    with _static_layers_lock:
+        _static_layers[key] = layer
+        while len(_static_layers) > max_static_layers:
+            _static_layers.popitem(last=False)
+    return layer, hit
+
+
+def composite(dynamic, static):
+    """alpha-composite the dynamic layer over the static one (`over` operator, straight alpha)"""
+    src = dynamic.astype(np.float32) / 255
+    dst = static.astype(np.float32) / 255
+    src_a, dst_a = src[..., 3:], dst[..., 3:]
+
+    alpha = src_a + dst_a * (1 - src_a)
+    rgb = src[..., :3] * src_a + dst[..., :3] * dst_a * (1 - src_a)
+    rgb = np.divide(rgb, alpha, out=np.zeros_like(rgb), where=alpha > 0)
+    return (np.concatenate([rgb, alpha], axis=-1) * 255).round().astype(np.uint8)
+
+
+def render_layers(fig, cache_folder=None, dpi="figure"):
+    """render the figure as a RGBA array, reusing its static layer
+
+    Returns
+    -------
+    tuple(numpy.ndarray, bool)
+        the image, and True if the static layer was already rendered
+    """
+    dpi = fig.dpi if dpi == "figure" else dpi
+
+    static, hit = static_layer(fig, dpi, cache_folder)
+    dynamic = _draw(fig, dpi, static=False)
+    return composite(dynamic, static), hit
+
+
+def save_layers(fig, filename, cache_folder=None, **savefig_kwargs):
+    """save the figure as png, reusing its static layer
+
+    Returns
+    -------
+    bool
+        True if the static layer was already rendered
+    """
+    img, hit = render_layers(fig, cache_folder, savefig_kwargs.get("dpi", "figure"))
+    matplotlib.image.imsave(filename, img, format="png")
+    return hit
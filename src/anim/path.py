@@ -2,7 +2,6 @@ import logging
 
 import numpy as np
 import xarray as xr
-from scipy import interpolate
 
 logger = logging.getLogger(__name__)
 
@@ -93,6 +92,8 @@ class Path:
         return x, y, dxs, dys, dates, time_coords
 
     def _interp_moves(self, x, y, dxs, dys, dates, new_dates):
+        from scipy import interpolate
+
         # convert to float for interpolation
         int_new_dates = new_dates.astype(float)
         # force both dates to have the same datetime type (s, ms, ns, ...)
@@ -0,0 +1,74 @@
+"""Build figures without pyplot.
+
+Figures created with :func:`figure` or :func:`subplots` are not registered in the pyplot global state,
+and are drawn with the Agg canvas. They can be built safely by several threads of the same worker
+(see the `threads` argument of :func:`anim.animate`).
+
+example :
+
+def plot(i, ds):
+    fig, ax = anim.subplots(1, 1, figsize=(4, 4), dpi=120)
+    ax.plot(ds.x, ds.y)
+    return fig
+"""
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+def figure(**kwargs):
+    """same as `plt.figure(...)`, without pyplot
+
+    Parameters
+    ----------
+    kwargs :
+        options given to :class:`matplotlib.figure.Figure`
+
+    Returns
+    -------
+    matplotlib.figure.Figure
+    """
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def subplots(
+    nrows=1, ncols=1, *, sharex=False, sharey=False, squeeze=True, subplot_kw=None, gridspec_kw=None, **kwargs
+):
+    """same as `plt.subplots(...)`, without pyplot
+
+    Returns
+    -------
+    tuple(matplotlib.figure.Figure, matplotlib.axes.Axes or array of Axes)
+    """
+    fig = figure(**kwargs)
+    axs = fig.subplots(
+        nrows, ncols, sharex=sharex, sharey=sharey, squeeze=squeeze, subplot_kw=subplot_kw, gridspec_kw=gridspec_kw
+    )
+    return fig, axs
+
+
+def is_pyplot_figure(fig):
+    """True if the figure is managed by pyplot (created with `plt.figure`, `plt.subplots`, ...)"""
+    return fig.canvas.manager is not None
+
+
+def to_rgba(fig, dpi="figure"):
+    """render the figure with Agg, as a (height, width, 4) uint8 array
+
+    Parameters
+    ----------
+    dpi : float or "figure", optional
+        dpi used for rendering, same as the `dpi` option of `fig.savefig`. By default "figure"
+    """
+    old_dpi, old_canvas = fig.dpi, fig.canvas
+    try:
+        fig.dpi = old_dpi if dpi == "figure" else dpi
+        canvas = FigureCanvasAgg(fig)
+        canvas.draw()
+        return np.asarray(canvas.buffer_rgba()).copy()
+    finally:
+        fig.dpi = old_dpi
+        fig.set_canvas(old_canvas)
@@ -0,0 +1,262 @@
+"""Animation made of several scenes, each one with its own plot, compute and fps.
+
+Each scene is built in its own folder `<workFolder>/<name>` (images, stats, caches) and encoded in its own video.
+The final video is joined with the ffmpeg concat demuxer, without encoding scenes again (see
+:func:`anim.tools.concat_videos`). When a scene is modified, only its images are built and encoded again :
+a scene is considered modified when the source code of its `plot` or `compute`, its number of frames or an option
+of :func:`anim.anim.animate` changing images (savefig options, keyframes, source, ...) change. When only its fps
+changes, its video is encoded again from the same images.
+
+example :
+
+timeline = Timeline("output")
+timeline.add("intro", plot_globe, fps=30, max_frames=120)
+timeline.add("flight", plot_path, fps=30, compute=compute_path)
+timeline.add("zoom", plot_data, fps=30, compute=compute_data, savefig_kwargs=dict(dpi=100))
+timeline.render(nprocess=8)
+
+Scenes should have the same image size, so their videos can be joined without encoding them again.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import pickle
+from dataclasses import dataclass, field
+
+from anim.compute_cache import compute_key
+from anim.tools import concat_videos
+
+logger = logging.getLogger(__name__)
+
+# options of `animate` which don't change images of a scene. Draft images have their own folder
+not_in_key = {
+    "client",
+    "nprocess",
+    "threads",
+    "force",
+    "no_convert",
+    "ffmpeg_log",
+    "draft",
+    "draft_dpi",
+    "script",
+    "codec",
+    "transport",
+    "max_memory_ds",
+    "worker_max_frames",
+    "worker_max_memory",
+    "order",
+    "layer_cache",
+    "frame_store",
+    "compute_cache",
+    "prefetch",
+    "progress",
+    "cancel",
+    "segment_size",
+}
+
+
+def _option_key(value):
+    """stable representation of an option of `animate`"""
+    if callable(value):
+        return compute_key(value)
+    try:
+        return hashlib.blake2b(pickle.dumps(value), digest_size=8).hexdigest()
+    except Exception:
+        return repr(value)
+
+
+@dataclass
+class Scene:
+    """one part of a :class:`Timeline`
+
+    Parameters
+    ----------
+    name : str
+        name of the scene, and of its folder
+    plot : callable
+        plot function of the scene, see :func:`anim.anim.animate`
+    fps : int
+        frames per seconds of the scene
+    compute : callable, optional
+        compute function of the scene, by default None
+    max_frames : int, optional
+        number of frames of the scene, by default None
+    kwargs : dict, optional
+        other parameters of :func:`anim.anim.animate` for this scene
+    """
+
+    name: str
+    plot: callable
+    fps: int
+    compute: callable = None
+    max_frames: int = None
+    kwargs: dict = field(default_factory=dict)
+
+    def key(self, options=None):
+        """hash of what is used to build images of the scene
+
+        Parameters
+        ----------
+        options : dict, optional
+            options of :func:`anim.anim.animate` used for all scenes, overridden by the `kwargs` of the scene
+        """
+        options = {**(options or dict()), **self.kwargs}
+        key = (
+            compute_key(self.plot),
+            compute_key(self.compute) if self.compute is not None else None,
+            self.max_frames,
+            sorted((k, _option_key(v)) for k, v in options.items() if k not in not_in_key),
+        )
+        return hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+
+
+def _images_mtime(folder, draft=False):
+    """last modification of the images of a scene (png files or frame store), or of its drafts"""
+    mtime = 0
+    if draft:
+        paths = glob.glob(os.path.join(folder, "draft", "*", "imgs"))
+    else:
+        paths = [os.path.join(folder, "imgs"), os.path.join(folder, "frames")]
+    for path in paths:
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                mtime = max([mtime] + [entry.stat().st_mtime for entry in entries])
+    return mtime
+
+
+class Timeline:
+    """animation made of several :class:`Scene`, joined in one video
+
+    Parameters
+    ----------
+    workFolder : str
+        folder of the animation : each scene is built in `<workFolder>/<name>`, and the video is `<workFolder>/video.mp4`
+    scenes : list, optional
+        scenes of the animation, in order. By default ()
+    """
+
+    def __init__(self, workFolder, scenes=()):
+        self.workFolder = os.path.normpath(workFolder)
+        self.scenes = list()
+        for scene in scenes:
+            self._append(scene)
+
+    def _append(self, scene):
+        if scene.name in [s.name for s in self.scenes]:
+            raise ValueError(f"scene '{scene.name}' already exists")
+        self.scenes.append(scene)
+        return scene
+
+    def add(self, name, plot, fps, compute=None, max_frames=None, **kwargs):
+        """add a scene at the end of the timeline, `kwargs` are other parameters of :func:`anim.anim.animate`"""
+        return self._append(Scene(name, plot, fps, compute=compute, max_frames=max_frames, kwargs=kwargs))
+
+    def folder(self, scene):
+        return os.path.join(self.workFolder, scene.name)
+
+    def render_scene(self, scene, force=False, no_convert=False, **kwargs):
+        """build images of `scene` and encode its video, only if they changed
+
+        Returns
+        -------
+        str
+            video name of the scene
+        """
+        from anim.anim import animate
+
+        folder = self.folder(scene)
+        stateFile = os.path.join(folder, "scene.json")
+        try:
+            with open(stateFile) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = dict()
+
+        kwargs = {**kwargs, **scene.kwargs}
+        # given to `animate` by the timeline
+        force = kwargs.pop("force", False) or force
+        no_convert = kwargs.pop("no_convert", False) or no_convert
+        kwargs.pop("only_convert", None)
+
+        key = scene.key(kwargs)
+        modified = previous.get("key", key) != key
+        if modified:
+            logger.info(f"scene '{scene.name}' modified : its images are built again")
+
+        kwargs = dict(kwargs, compute=scene.compute, max_frames=scene.max_frames)
+        logger.info(f"building scene '{scene.name}' in {folder}")
+        animate(scene.plot, folder, scene.fps, force=force or modified, no_convert=True, **kwargs)
+
+        # fps of the last videos encoded (draft and full video)
+        videos = previous.get("videos", dict())
+        self._save_state(stateFile, key, videos)
+
+        draft = bool(kwargs.get("draft", False))
+        videoName = os.path.join(folder, "draft.mp4" if draft else "video.mp4")
+        if no_convert:
+            return videoName
+        # a new fps only needs the video to be encoded again
+        fps = videos.get(os.path.basename(videoName), scene.fps)
+        mtime = _images_mtime(folder, draft)
+        if fps == scene.fps and os.path.exists(videoName) and os.path.getmtime(videoName) >= mtime:
+            logger.info(f"scene '{scene.name}' not modified, video {videoName} is kept")
+            return videoName
+        encoded = animate(scene.plot, folder, scene.fps, only_convert=True, **kwargs)
+        videos[os.path.basename(videoName)] = scene.fps
+        self._save_state(stateFile, key, videos)
+        return encoded
+
+    @staticmethod
+    def _save_state(stateFile, key, videos):
+        os.makedirs(os.path.dirname(stateFile), exist_ok=True)
+        with open(stateFile, "w") as f:
+            json.dump(dict(key=key, videos=videos), f)
+
+    def render(self, force=False, no_convert=False, ffmpeg_log=False, client=None, nprocess=0, threads=1, **kwargs):
+        """build all scenes, and join their videos in `<workFolder>/video.mp4`
+
+        Parameters
+        ----------
+        force : bool, optional
+            build again images of all scenes, by default False
+        no_convert : bool, optional
+            only build images, by default False
+        client : dask.Client or callable, optional
+            client used by all scenes, by default None : a local cluster is started once for all scenes
+        nprocess : int, optional
+            number of workers of the local cluster, by default 0 (all cpus but one)
+        threads : int, optional
+            number of threads by worker of the local cluster, by default 1
+        kwargs :
+            other parameters of :func:`anim.anim.animate`, used by all scenes
+
+        Returns
+        -------
+        str
+            video name
+        """
+        from anim.anim import build_client
+
+        if len(self.scenes) == 0:
+            raise ValueError("no scene in the timeline")
+
+        client, need_delete_client = build_client(client, nprocess, threads)
+        try:
+            videos = [
+                self.render_scene(
+                    scene, force=force, no_convert=no_convert, ffmpeg_log=ffmpeg_log, client=client, **kwargs
+                )
+                for scene in self.scenes
+            ]
+        finally:
+            if need_delete_client:
+                client.close()
+                client.cluster.close()
+
+        videoName = os.path.join(self.workFolder, "draft.mp4" if kwargs.get("draft", False) else "video.mp4")
+        if no_convert:
+            return videoName
+        return concat_videos(videos, videoName, ffmpeg_log=ffmpeg_log)
@@ -0,0 +1,161 @@
+"""Encode a video as independent segments, so only segments whose images changed are encoded again.
+
+Images are split in segments of `segment_size` images, each one encoded in its own mp4 file, starting with a
+keyframe and without references to other segments (closed GOP). Segments are joined by stream copy with
+:func:`anim.tools.concat_videos`.
+
+Encoded segments are listed in `segments/<video>/segments.json`, with the images of each segment and the last
+modification time of these images. When some images are built again, only segments containing them are encoded
+again. Changing encoding parameters (fps, crf, ...) encodes all segments again.
+"""
+
+import json
+import logging
+import os
+
+from anim.tools import Timing, _check_video_name, _existing_images, concat_videos
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_segment(imagePatern, fps, start, n, segmentName, crf, vcodec, pix_fmt, ffmpeg_log):
+    """encode `n` images from `start` in `segmentName`, a keyframe every `n` images"""
+    _cmd = "ffmpeg " if ffmpeg_log else "ffmpeg -loglevel error "
+    cmd = (
+        f"{_cmd}"
+        f" -framerate {fps} "
+        f" -start_number {start} "
+        f" -i {imagePatern} "
+        f" -frames:v {n} "
+        f" -c:v {vcodec} "
+        f" -g {n} "
+        f" -crf {crf} "
+        f" -pix_fmt {pix_fmt} "
+        f" {segmentName} -y "
+    )
+    logger.debug("ffmpeg command : \n%s", cmd)
+    return os.system(cmd)
+
+
+def read_layout(filename):
+    """segments already encoded, as saved in `segments.json`"""
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def segments2video(
+    imagePatern,
+    fps,
+    videoName,
+    n_images=None,
+    segment_size=250,
+    crf=24,
+    vcodec="libx264",
+    pix_fmt="yuv420p",
+    ffmpeg_log=False,
+):
+    """convert images into mp4 video, encoding only segments whose images changed since the last call
+
+    Parameters
+    ----------
+    imagePatern : str
+        patern where to find images. For example '/tmp/img_%03d.png'
+    fps : int
+        frames per seconds for the video
+    videoName : str
+        video name. Segments are saved in the folder `segments` next to it
+    n_images : int, optional
+        number of images, by default None : up to the last image saved
+    segment_size : int, optional
+        number of images by segment, by default 250
+    crf, vcodec, pix_fmt, ffmpeg_log :
+        see :func:`anim.tools.images2video`
+
+    Returns
+    -------
+    str or None
+        video name, None if there is no image or a segment cannot be encoded. The video stops before the first
+        missing image
+    """
+
+    with Timing() as dt:
+        _check_video_name(videoName)
+        base = os.path.splitext(os.path.basename(videoName))[0]
+        folder = os.path.join(os.path.dirname(videoName), "segments", base)
+        layoutName = os.path.join(folder, "segments.json")
+        os.makedirs(folder, exist_ok=True)
+
+        existing = _existing_images(imagePatern) if os.path.isdir(os.path.dirname(imagePatern) or ".") else set()
+        if len(existing) == 0:
+            logger.error(f"no image found with {imagePatern}, video not created")
+            return None
+        n_images = max(existing) + 1 if n_images is None else n_images
+
+        params = dict(
+            images=os.path.abspath(imagePatern),
+            fps=fps,
+            segment_size=segment_size,
+            crf=crf,
+            vcodec=vcodec,
+            pix_fmt=pix_fmt,
+        )
+        layout = read_layout(layoutName)
+        if layout.get("params", None) != params:
+            if len(layout) > 0:
+                logger.info("encoding parameters changed : all segments are encoded again")
+            layout = dict(params=params, segments=dict())
+
+        segments = []
+        n_encoded = 0
+        failed = False
+        for k, start in enumerate(range(0, n_images, segment_size)):
+            stop = min(start + segment_size, n_images)
+            # ffmpeg stops at the first missing image
+            n = 0
+            while start + n < stop and start + n in existing:
+                n += 1
+
+            segmentName = os.path.join(folder, f"{k:05d}.mp4")
+            if n > 0:
+                mtime = max(os.path.getmtime(imagePatern % i) for i in range(start, start + n))
+                previous = layout["segments"].get(str(k), None)
+                if (
+                    previous is None
+                    or previous["n"] != n
+                    or previous["mtime"] < mtime
+                    or not os.path.exists(segmentName)
+                ):
+                    res = _encode_segment(imagePatern, fps, start, n, segmentName, crf, vcodec, pix_fmt, ffmpeg_log)
+                    if res != 0:
+                        logger.error(f"segment {k} not encoded, ffmpeg error : video not created")
+                        layout["segments"].pop(str(k), None)
+                        failed = True
+                        break
+                    n_encoded += 1
+                    layout["segments"][str(k)] = dict(start=start, stop=start + n, n=n, mtime=mtime)
+                segments.append(segmentName)
+
+            if n < stop - start:
+                # next segments would skip images : the video stops before the first missing image
+                logger.warning(f"image {start + n} missing, the video stops at image {start + n}")
+                break
+
+        # segments of images which don't exist anymore are forgotten
+        indices = {str(k) for k in range(len(range(0, n_images, segment_size)))}
+        layout["segments"] = {k: v for k, v in layout["segments"].items() if k in indices}
+
+        tmp = f"{layoutName}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(layout, f, indent=1)
+        os.replace(tmp, layoutName)
+
+    if failed:
+        return None
+    if len(segments) == 0:
+        logger.error(f"first image of {imagePatern} missing, video not created")
+        return None
+    logger.info(f"{n_encoded}/{len(segments)} segments encoded (ffmpeg time : {dt})")
+    return concat_videos(segments, videoName, ffmpeg_log=ffmpeg_log)
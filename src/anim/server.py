@@ -0,0 +1,170 @@
+"""Keep a dask cluster with warm workers running between runs of `anim`.
+
+``anim serve`` starts a local cluster, whose workers import matplotlib, xarray and cartopy (if installed) once.
+The scheduler address is written in a state file, so ``anim script.py --server`` connects to it instead of starting
+a new cluster : the script is uploaded to the workers, and images are built right away.
+
+The state file is ``~/.cache/anim/server.json``, or the path in the ``ANIM_SERVER_STATE`` environment variable.
+Connections to the server are encrypted with a temporary TLS certificate (see :meth:`distributed.Security.temporary`),
+kept in the state file which only the user can read : other users of the machine cannot submit code to the workers.
+"""
+
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# imported by workers when they start, so the first image doesn't pay for them
+warm_modules = ("matplotlib.pyplot", "xarray", "zarr", "anim.anim", "cartopy.crs", "cartopy.feature")
+
+
+def state_file():
+    """path of the file where the address of the server is written"""
+    default = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "anim", "server.json")
+    return os.environ.get("ANIM_SERVER_STATE", default)
+
+
+def read_state(state=None):
+    """state of the server (address, pid, ...), None if no server was started"""
+    state = state_file() if state is None else state
+    try:
+        with open(state) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def warm_up():
+    """import heavy modules, and render a figure once to build matplotlib caches"""
+    for name in warm_modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            logger.debug(f"{name} not installed, not imported")
+
+    from anim.render import figure
+
+    figure(figsize=(1, 1)).canvas.draw()
+
+
+def dask_setup(worker):
+    """called by dask when a worker of the server starts (see the `preload` option of workers)"""
+    warm_up()
+
+
+def server_security(info):
+    """credentials of the client, from the state of the server"""
+    from dask.distributed import Security
+
+    tls = info["tls"]
+    return Security(
+        tls_ca_file=tls["ca"], tls_client_cert=tls["cert"], tls_client_key=tls["key"], require_encryption=True
+    )
+
+
+def write_state(state, info):
+    """write `info` in the state file, readable only by the user as it holds the credentials of the server"""
+    os.makedirs(os.path.dirname(os.path.abspath(state)), exist_ok=True)
+    tmp = f"{state}.{os.getpid()}"
+    with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+        json.dump(info, f)
+    os.replace(tmp, state)
+
+
+def server_client(state=None, timeout=5):
+    """dask client connected to the server started with ``anim serve``"""
+    from dask.distributed import Client
+
+    info = read_state(state)
+    if info is None:
+        raise RuntimeError("no anim server running : start one with `anim serve`")
+    if "tls" not in info:
+        raise RuntimeError(f"anim server at {info['address']} has no credentials : start it again with `anim serve`")
+    try:
+        client = Client(info["address"], timeout=timeout, security=server_security(info))
+    except OSError:
+        raise RuntimeError(f"anim server at {info['address']} is not reachable : start it again with `anim serve`")
+    logger.info(f"connected to anim server {info['address']}")
+    return client
+
+
+def serve(nprocess=0, threads=1, port=8786, state=None):
+    """start a local cluster with warm workers, and keep it running until stopped
+
+    Parameters
+    ----------
+    nprocess : int, optional
+        number of workers, by default 0 (all cpus but one)
+    threads : int, optional
+        number of threads by worker, by default 1
+    port : int, optional
+        port of the scheduler, on localhost. By default 8786, 0 for a random port
+    state : str, optional
+        file where the address of the server is written, by default :func:`state_file`
+    """
+    from dask.distributed import LocalCluster, Security
+
+    state = state_file() if state is None else state
+    info = read_state(state)
+    if info is not None:
+        try:
+            server_client(state, timeout=2).close()
+        except RuntimeError:
+            logger.info(f"removing the state of a stopped server ({info['address']})")
+        else:
+            raise RuntimeError(
+                f"an anim server is already running at {info['address']}, stop it with `anim serve --stop`"
+            )
+
+    n_workers = nprocess if nprocess > 0 else max(1, multiprocessing.cpu_count() - 1)
+    security = Security.temporary()
+    cluster = LocalCluster(
+        n_workers=n_workers,
+        threads_per_worker=threads,
+        processes=True,
+        host="127.0.0.1",
+        scheduler_port=port,
+        preload=[__name__],
+        security=security,
+    )
+
+    info = dict(
+        address=cluster.scheduler_address,
+        pid=os.getpid(),
+        n_workers=n_workers,
+        threads=threads,
+        tls=dict(ca=security.tls_ca_file, cert=security.tls_client_cert, key=security.tls_client_key),
+    )
+    write_state(state, info)
+    logger.info(f"anim server running at {info['address']} ({n_workers} workers), dashboard : {cluster.dashboard_link}")
+
+    # `kill` stops the server like ctrl+c
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        # `anim serve --stop` removes the state file
+        while read_state(state) == info and cluster.scheduler.status.name not in ("closing", "closed"):
+            time.sleep(0.5)
+        logger.info("anim server stopped")
+    except KeyboardInterrupt:
+        logger.info("stopping anim server..")
+    finally:
+        if read_state(state) == info:
+            os.remove(state)
+        cluster.close()
+
+
+def stop(state=None):
+    """stop the server started with ``anim serve``"""
+    state = state_file() if state is None else state
+    server_client(state).close()
+    # the server stops once its state file is removed
+    os.remove(state)
+    logger.info("anim server stopping")
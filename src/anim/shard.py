@@ -0,0 +1,144 @@
+"""Split an animation between machines which don't share a dask scheduler.
+
+Each machine builds a slice of the frames (``anim script.py --shard 2/4`` or ``--frames 1000:2000``), in a shared
+or a local work folder. Then ``anim merge script.py FOLDER ...`` gathers images of all shards in the work folder,
+checks all images are there, and encodes the video.
+"""
+
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas
+
+from anim.data import merge_stats
+from anim.store import FrameStore, store2video
+from anim.tools import image_patern, images2video
+
+logger = logging.getLogger(__name__)
+
+
+def parse_frames(frames):
+    """slice of frames from a string 'START:STOP', START or STOP can be omitted"""
+    try:
+        start, stop = frames.split(":")
+        return slice(int(start) if start else None, int(stop) if stop else None)
+    except ValueError:
+        raise ValueError(f"frames should be 'START:STOP', not '{frames}'")
+
+
+def shard_frames(shard, max_frames, stride=1):
+    """slice of frames built by shard 'k/N' (k from 1 to N), in contiguous blocks of images
+
+    Parameters
+    ----------
+    shard : str
+        'k/N'
+    max_frames : int
+        total number of frames
+    stride : int, optional
+        only frames multiple of `stride` are built, by default 1
+    """
+    try:
+        k, n = (int(v) for v in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"shard should be 'k/N', not '{shard}'")
+    if not 1 <= k <= n:
+        raise ValueError(f"shard {shard} : k should be between 1 and {n}")
+    if max_frames is None or max_frames <= 0:
+        raise ValueError("shards need the number of frames : please specify `max_frames`")
+
+    n_images = int(np.ceil(max_frames / stride))
+    block = int(np.ceil(n_images / n)) * stride
+    frames = slice(min((k - 1) * block, max_frames), min(k * block, max_frames))
+    logger.info(f"shard {shard} : frames {frames.start}:{frames.stop}")
+    return frames
+
+
+def _gather_images(folders, imageFolder, n_images):
+    """link (or copy) images of shards missing in `imageFolder`"""
+    os.makedirs(imageFolder, exist_ok=True)
+    name = image_patern(n_images)
+    for folder in folders:
+        n = 0
+        for i in range(n_images):
+            src, dst = os.path.join(folder, "imgs", name % i), os.path.join(imageFolder, name % i)
+            if os.path.exists(src) and not os.path.exists(dst):
+                try:
+                    os.link(src, dst)
+                except OSError:
+                    shutil.copy2(src, dst)
+                n += 1
+        logger.info(f"{n} images gathered from {folder}")
+    return [i for i in range(n_images) if not os.path.exists(os.path.join(imageFolder, name % i))]
+
+
+def _gather_stores(folders, store):
+    """copy images of shards frame stores missing in `store`"""
+    for folder in folders:
+        shard = FrameStore(os.path.join(folder, "frames"), store.n_images)
+        done = np.setdiff1d(shard.done, store.done)
+        for i in done:
+            store.write(i, shard[i])
+        logger.info(f"{done.size} images gathered from {shard.folder}")
+    return sorted(set(range(store.n_images)) - set(store.done))
+
+
+def _gather_stats(folders, workFolder):
+    """merge stats of shards, so next runs can order frames by cost"""
+    # stats files are replaced atomically by shards : they are never read partially written
+    filenames = [os.path.join(f, "stats.csv") for f in folders]
+    dfs = [pandas.read_csv(f) for f in filenames if os.path.exists(f)]
+    if len(dfs) > 0:
+        merge_stats(os.path.join(workFolder, "stats.csv"), pandas.concat(dfs))
+
+
+def merge(workFolder, fps, max_frames, folders=(), frame_store=False, no_convert=False, ffmpeg_log=False):
+    """gather images built by shards in `workFolder`, check all images are built, and encode the video
+
+    Parameters
+    ----------
+    workFolder : str
+        work folder of the animation, where the video is saved
+    fps : int
+        frames per seconds for the video
+    max_frames : int
+        total number of frames
+    folders : list, optional
+        work folders of shards. Empty if all shards used `workFolder`. By default ()
+    frame_store : bool, optional
+        shards saved images in a frame store (see :class:`anim.store.FrameStore`), by default False
+    no_convert : bool, optional
+        don't encode the video, by default False
+
+    Returns
+    -------
+    str or None
+        video name, None if some images are missing
+    """
+    if max_frames is None or max_frames <= 0:
+        raise ValueError("merge needs the number of frames : please specify `max_frames`")
+
+    workFolder = os.path.normpath(workFolder)
+    folders = [os.path.normpath(f) for f in folders if os.path.normpath(f) != workFolder]
+    videoName = os.path.join(workFolder, "video.mp4")
+
+    if frame_store:
+        store = FrameStore(os.path.join(workFolder, "frames"), max_frames)
+        missing = _gather_stores(folders, store)
+    else:
+        imageFolder = os.path.join(workFolder, "imgs")
+        missing = _gather_images(folders, imageFolder, max_frames)
+    _gather_stats(folders, workFolder)
+
+    if len(missing) > 0:
+        logger.error(f"{len(missing)}/{max_frames} images are missing (first ones : {missing[:10]}), video not created")
+        return None
+    logger.info(f"all {max_frames} images are built")
+
+    if no_convert:
+        return videoName
+    if frame_store:
+        return store2video(store, fps, videoName, ffmpeg_log=ffmpeg_log)
+    return images2video(os.path.join(imageFolder, image_patern(max_frames)), fps, videoName, ffmpeg_log=ffmpeg_log)
@@ -0,0 +1,115 @@
+"""Datasets read directly by workers.
+
+Instead of loading data of each frame in the driver, only a selector (a time indice or a `sel` dict) is sent to
+workers. Each worker opens the dataset once, and reads only the slice needed by its frame.
+"""
+
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+
+import xarray as xr
+
+logger = logging.getLogger(__name__)
+
+# datasets opened by this process (so once per worker), indexed by DataSource.key
+_pool = dict()
+_pool_lock = threading.Lock()
+
+
+@dataclass
+class DataSource:
+    """a zarr or netCDF dataset, opened lazily by each worker
+
+    Parameters
+    ----------
+    path : str
+        path of the zarr store or the netCDF file
+    dim : str, optional
+        dimension used when the selector is an int, by default "time"
+    engine : str, optional
+        engine used by `xarray.open_dataset`. By default "zarr" for folders and `.zarr` path,
+        else let xarray choose
+    open_kwargs : dict, optional
+        other options for `xarray.open_dataset`
+    """
+
+    path: str
+    dim: str = "time"
+    engine: str = None
+    open_kwargs: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.path = os.path.abspath(self.path)
+        if self.engine is None and (self.path.endswith(".zarr") or os.path.isdir(self.path)):
+            self.engine = "zarr"
+
+    @classmethod
+    def build(cls, source, dim="time"):
+        """build a DataSource from a path, or a dataset opened lazily from a file"""
+        if isinstance(source, DataSource):
+            return source
+
+        if isinstance(source, xr.Dataset):
+            path = source.encoding.get("source", None)
+            if path is None:
+                raise ValueError("the dataset was not opened from a file, it cannot be read by workers")
+            built = cls(path, dim=dim)
+            # workers open the file again : selections and open options of the dataset would be lost
+            if not _same_dataset(source, built.open()):
+                raise ValueError(
+                    f"the dataset differs from the file {path} (selection, subset of variables, open options, ...) : "
+                    "workers would read the whole file. Give a DataSource with `open_kwargs`, and select frames "
+                    "with `compute`"
+                )
+            return built
+
+        return cls(str(source), dim=dim)
+
+    @property
+    def key(self):
+        return (self.path, self.engine, repr(sorted(self.open_kwargs.items())))
+
+    def open(self):
+        """open the dataset, only once by process"""
+        with _pool_lock:
+            if self.key not in _pool:
+                logger.debug(f"opening {self.path}")
+                _pool[self.key] = xr.open_dataset(self.path, engine=self.engine, **self.open_kwargs)
+            return _pool[self.key]
+
+    @property
+    def size(self):
+        return self.open().sizes[self.dim]
+
+    def compute(self, start=0):
+        """yield a selector for each indice along `dim`, can be used as a `compute` function"""
+        yield from range(start, self.size)
+
+
+def _same_dataset(ds, opened):
+    """True if `ds` has the variables, shapes, dtypes and indexes of the file `opened`"""
+
+    def layout(ds):
+        return {name: (var.dims, var.shape, var.dtype) for name, var in ds.variables.items()}
+
+    if layout(ds) != layout(opened):
+        return False
+    return all(ds.indexes[name].equals(opened.indexes[name]) for name in ds.indexes)
+
+
+@dataclass
+class Selection:
+    """slice of a DataSource needed by one frame"""
+
+    source: DataSource
+    selector: int or dict
+
+    def load(self):
+        ds = self.source.open()
+        if isinstance(self.selector, dict):
+            ds = ds.sel(**self.selector)
+        else:
+            ds = ds.isel({self.source.dim: self.selector})
+        return ds.load()
@@ -0,0 +1,194 @@
+"""Store all images of an animation in a single memory-mapped file, instead of one png by image.
+
+The store is a folder with 3 files :
+    * `frames.json` : number of images and their shape
+    * `frames.raw` : (n_images, height, width, 4) uint8 array, memory-mapped by each worker
+    * `done.map` : one byte by image, set to 1 once the image is written
+
+The store is created by the first worker which renders an image, with the shape of this image.
+Workers write each image at its offset with `os.pwrite`, then its byte of `done.map`, so a stopped run can be resumed
+by checking `done.map`.
+The video is encoded by streaming images to ffmpeg (see :func:`store2video`).
+"""
+
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+
+import numpy as np
+
+from anim.tools import Timing, _check_video_name, file_lock, preview_step
+
+logger = logging.getLogger(__name__)
+
+
+class FrameStore:
+    """images of an animation in a memory-mapped file
+
+    Parameters
+    ----------
+    folder : str
+        folder of the store
+    n_images : int
+        number of images
+    """
+
+    def __init__(self, folder, n_images):
+        self.folder = folder
+        self.n_images = int(n_images)
+        self._frames = None
+        self._done = None
+        self._fds = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # memory maps and files are opened again by each worker
+        state = self.__dict__.copy()
+        state["_frames"], state["_done"], state["_fds"], state["_lock"] = None, None, None, None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def header(self):
+        return os.path.join(self.folder, "frames.json")
+
+    def exists(self):
+        return os.path.exists(self.header)
+
+    @property
+    def shape(self):
+        with open(self.header) as f:
+            header = json.load(f)
+        return (header["n_images"], header["height"], header["width"], 4)
+
+    def _create(self, height, width):
+        """create the store, only by the first worker. Others wait for it"""
+        os.makedirs(self.folder, exist_ok=True)
+        # the lock is released if the worker dies, so a crashed worker never blocks the others
+        with file_lock(os.path.join(self.folder, "frames")):
+            if not self.exists():
+                self._allocate(height, width)
+
+    def _allocate(self, height, width):
+        shape = (self.n_images, height, width, 4)
+        logger.debug(f"creating frame store {self.folder} {shape}")
+        np.memmap(os.path.join(self.folder, "frames.raw"), dtype=np.uint8, mode="w+", shape=shape).flush()
+        np.memmap(os.path.join(self.folder, "done.map"), dtype=np.uint8, mode="w+", shape=(self.n_images,)).flush()
+
+        # the header is written last : the store is usable once it exists
+        tmp = f"{self.header}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(dict(n_images=self.n_images, height=height, width=width), f)
+        os.replace(tmp, self.header)
+
+    def _open(self):
+        with self._lock:
+            if self._frames is None:
+                shape = self.shape
+                if shape[0] != self.n_images:
+                    raise ValueError(f"frame store {self.folder} has {shape[0]} images, not {self.n_images}")
+                frames, done = os.path.join(self.folder, "frames.raw"), os.path.join(self.folder, "done.map")
+                self._frames = np.memmap(frames, dtype=np.uint8, mode="r", shape=shape)
+                self._done = np.memmap(done, dtype=np.uint8, mode="r")
+                self._fds = os.open(frames, os.O_WRONLY), os.open(done, os.O_WRONLY)
+        return self._frames, self._done
+
+    def is_done(self, i):
+        if not self.exists():
+            return False
+        return bool(self._open()[1][i])
+
+    @property
+    def done(self):
+        """indices of images already written"""
+        if not self.exists():
+            return np.array([], dtype=int)
+        return np.flatnonzero(self._open()[1])
+
+    def write(self, i, img):
+        """write the RGBA image `i`"""
+        if not self.exists():
+            self._create(*img.shape[:2])
+
+        frames, done = self._open()
+        if img.shape != frames.shape[1:]:
+            raise ValueError(f"image {i} has shape {img.shape}, but images of the store have {frames.shape[1:]}")
+        # only the bytes of the image are written, other workers write their images at the same time
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+        os.pwrite(self._fds[0], img.data, i * img.nbytes)
+        os.pwrite(self._fds[1], b"\x01", i)
+
+    def __getitem__(self, i):
+        return np.asarray(self._open()[0][i])
+
+    def clear(self):
+        """delete all images"""
+        shutil.rmtree(self.folder, ignore_errors=True)
+        if self._fds is not None:
+            for fd in self._fds:
+                os.close(fd)
+        self._frames, self._done, self._fds = None, None, None
+
+
+def store2video(store, fps, videoName, crf=24, vcodec="libx264", pix_fmt="yuv420p", ffmpeg_log=False, frames=None):
+    """encode images of a :class:`FrameStore` into a mp4 video, streamed to ffmpeg as raw video
+
+    Images not written yet are skipped. `frames` are the indices of images encoded, by default all of them. Other
+    parameters are the same as :func:`anim.tools.images2video`.
+
+    Returns
+    -------
+    str or None
+        video name, None if there is no image or ffmpeg fails
+    """
+
+    with Timing() as dt:
+        _check_video_name(videoName)
+        os.makedirs(os.path.dirname(videoName) or ".", exist_ok=True)
+
+        frames = np.arange(store.n_images) if frames is None else np.asarray(frames)
+        done = np.intersect1d(frames, store.done)
+        if done.size == 0:
+            logger.error(f"no image in the frame store {store.folder}, video not created")
+            return None
+        if done.size < frames.size:
+            logger.warning(f"only {done.size}/{frames.size} images done, missing images are skipped")
+        _, height, width, _ = store.shape
+
+        cmd = ["ffmpeg"] + ([] if ffmpeg_log else ["-loglevel", "error"])
+        cmd += ["-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}", "-framerate", str(fps), "-i", "-"]
+        cmd += ["-c:v", vcodec, "-crf", str(crf), "-pix_fmt", pix_fmt, videoName, "-y"]
+        logger.info("ffmpeg command : \n%s", " ".join(cmd))
+
+        try:
+            process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        except FileNotFoundError:
+            res = -1
+        else:
+            try:
+                for i in done:
+                    process.stdin.write(store[i].tobytes())
+            except BrokenPipeError:
+                pass
+            process.stdin.close()
+            res = process.wait()
+
+    if res != 0:
+        logger.error("video not created, ffmpeg error. Please use -v DEBUG to have full ffmpeg debug output")
+        return None
+    logger.info(f"video {videoName} done! (ffmpeg time : {dt})")
+    return videoName
+
+
+def store_preview(store, fps, videoName, levels=6, ffmpeg_log=False):
+    """same as :func:`anim.tools.preview_video`, from images of a :class:`FrameStore`"""
+    n_images, step = preview_step(set(store.done.tolist()), store.n_images, levels)
+    if step is None:
+        return None
+    return store2video(store, fps / step, videoName, ffmpeg_log=ffmpeg_log, frames=np.arange(0, n_images, step))
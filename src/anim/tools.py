@@ -1,9 +1,15 @@
+import contextlib
+import fcntl
+import inspect
 import logging
 import os
+import queue
+import re
+import tempfile
+import threading
 import time
 
 import numpy as np
-import xarray as xr
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +42,34 @@ class Timing:
         return f"{self.dt*self.scale[self.unit]:.2f}{self.unit}"
 
 
+def rss():
+    """memory used by the current process (resident set size), in bytes"""
+    import psutil
+
+    return psutil.Process().memory_info().rss
+
+
+@contextlib.contextmanager
+def file_lock(filename):
+    """exclusive lock between processes on `filename`.lock, released if the process dies"""
+    with open(f"{filename}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def worker_address():
+    """address of the dask worker running the current task, None outside a worker"""
+    from distributed import get_worker
+
+    try:
+        return get_worker().address
+    except ValueError:
+        return None
+
+
 def image_patern(n_frames=None):
     """compute how many leading 0 is needed in the name
 
@@ -110,6 +144,143 @@ def images2video(imagePatern, fps, videoName, crf=24, vcodec="libx264", pix_fmt=
     return videoName
 
 
+def concat_videos(videos, videoName, ffmpeg_log=False):
+    """join mp4 videos with the ffmpeg concat demuxer, without encoding them again (stream copy)
+
+    Videos should have the same size and codec, for example videos encoded with :func:`images2video`.
+
+    Parameters
+    ----------
+    videos : list
+        names of videos, in order
+    videoName : str
+        name of the joined video
+    ffmpeg_log : bool
+        print all ffmpeg logs. If not specified, run `ffmpeg` with `-loglevel quiet`
+    """
+
+    with Timing() as dt:
+        _check_video_name(videoName)
+        os.makedirs(os.path.dirname(videoName) or ".", exist_ok=True)
+
+        # list of videos read by the concat demuxer
+        listName = f"{os.path.splitext(videoName)[0]}.txt"
+        with open(listName, "w") as f:
+            for video in videos:
+                path = os.path.abspath(video).replace("'", "'\\''")
+                f.write(f"file '{path}'\n")
+
+        if ffmpeg_log:
+            _cmd = "ffmpeg "
+        else:
+            _cmd = "ffmpeg -loglevel error "
+
+        cmd = f"{_cmd} -f concat -safe 0 -i {listName} -c copy {videoName} -y "
+        logger.info("ffmpeg command : \n%s", cmd)
+        res = os.system(cmd)
+
+    if res != 0:
+        logger.error("video not created, ffmpeg error. Please use -v DEBUG to have full ffmpeg debug output")
+    else:
+        logger.info(f"video {videoName} done! (ffmpeg time : {dt})")
+
+    return videoName
+
+
+def stratum(i, levels=6):
+    """level of image `i` in the coarse-to-fine order : images multiple of 2**levels come first (level `levels`),
+    then multiples of 2**(levels-1), ... and odd images last (level 0)
+    """
+    for level in range(levels, 0, -1):
+        if i % 2**level == 0:
+            return level
+    return 0
+
+
+def _existing_images(imagePatern):
+    """indices of images already saved following `imagePatern`"""
+    folder, name = os.path.split(imagePatern)
+    prefix, suffix = name.split("%", 1)
+    suffix = suffix[suffix.index("d") + 1 :]
+    regex = re.compile(f"^{re.escape(prefix)}(\\d+){re.escape(suffix)}$")
+
+    indices = set()
+    if not os.path.isdir(folder or "."):
+        # nothing saved yet, or images are saved in a frame store
+        return indices
+    for filename in os.listdir(folder or "."):
+        match = regex.match(filename)
+        if match is not None:
+            indices.add(int(match.group(1)))
+    return indices
+
+
+def preview_step(existing, n_images=None, levels=6):
+    """smallest step (1, 2, 4, ... 2**levels) for which all images `0, step, 2*step, ...` are in `existing`
+
+    Returns
+    -------
+    tuple
+        (n_images, step), step is None if not enough images are saved
+    """
+    if len(existing) == 0:
+        logger.warning("no image saved yet, no preview built")
+        return n_images, None
+    if n_images is None:
+        n_images = max(existing) + 1
+
+    for level in range(levels + 1):
+        step = 2**level
+        if all(i in existing for i in range(0, n_images, step)):
+            break
+    else:
+        logger.warning(f"not enough images saved ({len(existing)}/{n_images}), no preview built")
+        return n_images, None
+
+    logger.info(f"preview with 1 image every {step} ({len(existing)}/{n_images} images saved)")
+    return n_images, step
+
+
+def preview_video(imagePatern, fps, videoName, n_images=None, levels=6, ffmpeg_log=False):
+    """build a video from images already saved, even if some are missing
+
+    The smallest step `s` (1, 2, 4, ... 2**levels) for which all images `0, s, 2s, ...` exist is used, and the
+    video is encoded at `fps / s`. With images built in stratified order, a preview covering the whole
+    animation is available early, and gets finer while the other images are built.
+
+    Parameters
+    ----------
+    imagePatern : str
+        patern where to find images. For example '/tmp/img_%03d.png'
+    fps : int
+        frames per seconds of the full video
+    videoName : str
+        video name
+    n_images : int, optional
+        total number of images. By default, the last image saved
+    levels : int, optional
+        biggest step used is 2**levels. By default 6
+    ffmpeg_log : bool
+        print all ffmpeg logs
+
+    Returns
+    -------
+    str or None
+        return the video name, None if not enough images are saved
+    """
+
+    existing = _existing_images(imagePatern)
+    n_images, step = preview_step(existing, n_images, levels)
+    if step is None:
+        return None
+    with tempfile.TemporaryDirectory() as tmp:
+        # ffmpeg needs consecutive images
+        for j, i in enumerate(range(0, n_images, step)):
+            os.symlink(os.path.abspath(imagePatern % i), os.path.join(tmp, f"img_{j:07d}.png"))
+        images2video(os.path.join(tmp, "img_%07d.png"), fps / step, videoName, ffmpeg_log=ffmpeg_log)
+    return videoName
+
+
 def _check_video_name(videoName):
     name, ext = os.path.splitext(videoName)
     if ext != ".mp4":
@@ -191,11 +362,138 @@ def _sanitize_inputs(max_frames, compute):
             raise ValueError("`compute` need to be a function. Please check docstring to provide correct function")
 
     elif compute is None:
+        import xarray as xr
 
-        def custom_compute():
-            for _ in range(max_frames):
+        def custom_compute(start=0):
+            for _ in range(start, max_frames):
                 yield xr.Dataset()
 
         compute = custom_compute
 
-    return max_frames, iter(compute())
+    return max_frames, FrameIterator(compute)
+
+
+class FrameIterator:
+    """iterate over data yielded by `compute`, and jump to the frames needed
+
+    `compute` can support one of these protocols, so frames are skipped without computing their data :
+        * `compute(start=i)` yields data from frame `i`
+        * the iterator returned by `compute()` has a `skip(n)` method, which skips the next `n` frames
+
+    Otherwise, data of skipped frames are computed and dropped.
+
+    example :
+
+    def compute(start=0):
+        for i in range(start, 1000):
+            yield expensive_computation(i)
+    """
+
+    def __init__(self, compute):
+        self.compute = compute
+        try:
+            self.has_start = "start" in inspect.signature(compute).parameters
+        except (TypeError, ValueError):
+            self.has_start = False
+        self._start(0)
+
+    def _start(self, i):
+        self.iterator = iter(self.compute(start=i) if self.has_start else self.compute())
+        self.position = i if self.has_start else 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        data = next(self.iterator)
+        self.position += 1
+        return data
+
+    def seek(self, i):
+        """next data yielded will be the one of frame `i`"""
+        if i == self.position:
+            return
+
+        if i < self.position or (self.has_start and not hasattr(self.iterator, "skip")):
+            logger.debug(f"restarting compute at frame {i}")
+            self._start(i if self.has_start else 0)
+
+        n = i - self.position
+        if n > 0 and hasattr(self.iterator, "skip"):
+            logger.debug(f"skipping {n} frames")
+            self.iterator.skip(n)
+            self.position = i
+        while self.position < i:
+            next(self)
+
+
+class Prefetch:
+    """iterate over `iterator` in a background thread, keeping up to `size` items ready
+
+    Exceptions raised by `iterator` are raised again by `next`.
+
+    example :
+
+    with Prefetch(compute(), size=2) as frames:
+        for ds in frames:
+            send(ds)  # next frames are computed meanwhile
+    """
+
+    _end = object()
+
+    def __init__(self, iterator, size=2):
+        self.iterator = iterator
+        self.queue = queue.Queue(maxsize=max(1, size))
+        self.stopped = threading.Event()
+        self.finished = False
+        self.thread = threading.Thread(target=self._run, args=(iterator,), name="anim-prefetch", daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        # the consumer may stop before the end : don't block forever on a full queue
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, iterator):
+        try:
+            for item in iterator:
+                if not self._put((item, None)):
+                    return
+        except BaseException as error:
+            self._put((self._end, error))
+        else:
+            self._put((self._end, None))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.finished:
+            raise StopIteration
+        item, error = self.queue.get()
+        if item is self._end:
+            self.finished = True
+            if error is not None:
+                raise error
+            raise StopIteration
+        return item
+
+    def close(self):
+        """stop the background thread once its current item is done, and close `iterator`"""
+        self.stopped.set()
+        self.thread.join()
+        # `finally` blocks of a generator stopped before its end are run now, not when it is garbage collected
+        close = getattr(self.iterator, "close", None)
+        if close is not None:
+            close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
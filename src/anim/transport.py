@@ -0,0 +1,420 @@
+"""Send data yielded by `compute` to the workers.
+
+A transport is used by :func:`anim.anim.build_images` for each frame : :meth:`Transport.send` returns the object
+given to :func:`anim.anim.process` as `data` (a dataset, a zarr group, a dask future, ...),
+the keywords passed to `client.submit(...)` and the :class:`anim.data.Stats` of the transfer.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+import xarray as xr
+
+from anim.data import CodecSelector, Stats, dump_data
+from anim.keyframes import Keyframes, interp_keyframes
+from anim.source import DataSource, Selection
+from anim.tools import Timing
+
+logger = logging.getLogger(__name__)
+
+
+class Transport:
+    """send the full data of each frame, to any worker
+
+    Transports with `parallel = True` don't keep state between frames : :meth:`send` can be called from several
+    threads at once, so frames are serialized while next ones are computed.
+    """
+
+    parallel = False
+
+    def setup(self, client, max_frames):
+        """called once the dask client is built, before the first frame"""
+        pass
+
+    def send(self, client, i, ds):
+        return ds, dict(), Stats()
+
+
+class DumpTransport(Transport):
+    """send the full data of each frame, compressed in zarr if bigger than `max_size`
+
+    Parameters
+    ----------
+    max_size : int, optional
+        data bigger than max_size (in bytes) are compressed, by default 1e6
+    codec : str, anim.data.Codec or dict, optional
+        codec used for compression, or "auto" to select it with :class:`anim.data.CodecSelector`.
+        By default None
+    """
+
+    parallel = True
+
+    def __init__(self, max_size=1e6, codec=None):
+        self.max_size = max_size
+        self.codec = codec
+        self.codecSelector = CodecSelector() if codec == "auto" else None
+        self._lock = threading.Lock()
+
+    def send(self, client, i, ds):
+        if self.codecSelector is None:
+            codec = self.codec
+        else:
+            with self._lock:
+                codec = self.codecSelector.choose()
+        # compression releases the GIL : frames can be compressed by several threads
+        data, stats = dump_data(ds, max_size=self.max_size, codec=codec)
+        if self.codecSelector is not None:
+            with self._lock:
+                self.codecSelector.update(codec, stats)
+        return data, dict(), stats
+
+
+@dataclass
+class Delta:
+    """changes between the dataset of a frame and the previous one sent to the same worker
+
+    each change is either :
+        * ("full", variable) : the whole variable
+        * ("shift", n, values) : values shifted by n along first dimension, `values` are the n new last values
+        * ("rows", indices, values) : only rows `indices` along first dimension changed
+    unchanged variables are not listed
+    """
+
+    changes: dict = field(default_factory=dict)
+    attrs: dict = field(default_factory=dict)
+
+    @property
+    def nbytes(self):
+        return sum(change[-1].nbytes for change in self.changes.values())
+
+
+def _equal(a, b):
+    if a.dtype.kind in "fc":
+        return (a == b) | (np.isnan(a) & np.isnan(b))
+    return a == b
+
+
+def _find_shift(old, new, max_shift):
+    """find n such that new[:-n] == old[n:]"""
+    for n in range(1, min(max_shift, new.shape[0] - 1) + 1):
+        if _equal(old[n:], new[:-n]).all():
+            return n
+    return None
+
+
+def compute_delta(previous: xr.Dataset, ds: xr.Dataset, max_shift=8):
+    """compute changes needed to build `ds` from `previous`
+
+    Returns
+    -------
+    Delta or xarray.Dataset
+        the full dataset is returned if structure of datasets are too different
+    """
+
+    if (
+        not isinstance(previous, xr.Dataset)
+        or not isinstance(ds, xr.Dataset)
+        or set(previous.variables) != set(ds.variables)
+        or set(previous.coords) != set(ds.coords)
+    ):
+        return ds
+
+    delta = Delta(attrs=ds.attrs)
+    for name, var in ds.variables.items():
+        old = previous.variables[name]
+        if var.dims != old.dims or var.shape != old.shape or var.dtype != old.dtype or var.attrs != old.attrs:
+            delta.changes[name] = ("full", var)
+            continue
+
+        if var.ndim == 0:
+            if not _equal(old.values, var.values):
+                delta.changes[name] = ("full", var)
+            continue
+
+        # same shape and no value : nothing changed
+        if var.size == 0:
+            continue
+
+        old_values, values = old.values, var.values
+        unchanged = _equal(old_values, values).reshape(values.shape[0], -1).all(axis=1)
+        if unchanged.all():
+            continue
+
+        shift = _find_shift(old_values, values, max_shift)
+        if shift is not None:
+            delta.changes[name] = ("shift", shift, values[-shift:])
+            continue
+
+        indices = np.flatnonzero(~unchanged)
+        if indices.size < values.shape[0] / 2:
+            delta.changes[name] = ("rows", indices, values[indices])
+        else:
+            delta.changes[name] = ("full", var)
+    return delta
+
+
+def apply_delta(previous: xr.Dataset, delta: Delta or xr.Dataset):
+    """build the dataset of a frame from the previous one, on the worker"""
+
+    if not isinstance(delta, Delta):
+        return delta
+
+    data_vars, coords = dict(), dict()
+    for name, old in previous.variables.items():
+        change = delta.changes.get(name, None)
+        if change is None:
+            var = old
+        elif change[0] == "full":
+            var = change[1]
+        elif change[0] == "shift":
+            _, n, values = change
+            var = old.copy(data=np.concatenate([old.values[n:], values]))
+        else:
+            _, indices, values = change
+            new_values = old.values.copy()
+            new_values[indices] = values
+            var = old.copy(data=new_values)
+
+        if name in previous.coords:
+            coords[name] = var
+        else:
+            data_vars[name] = var
+
+    return xr.Dataset(data_vars, coords=coords, attrs=delta.attrs)
+
+
+class DeltaTransport(Transport):
+    """send only changes between consecutive frames
+
+    Frames are split in contiguous blocks, each block is rendered by the same worker. For each frame, only the
+    differences with the previous frame sent to this worker are transfered (see :func:`compute_delta`),
+    and the full dataset is rebuilt on the worker.
+    Usefull when each dataset is a sliding window over the previous one.
+
+    Parameters
+    ----------
+    block_size : int, optional
+        number of consecutive frames sent to the same worker. By default, frames are split
+        equally between workers if the number of frames is known, else 100
+    max_shift : int, optional
+        maximum shift along the first dimension searched between 2 frames, by default 8
+    """
+
+    def __init__(self, block_size=None, max_shift=8):
+        self.block_size = block_size
+        self.max_shift = max_shift
+
+    def setup(self, client, max_frames):
+        self.workers = sorted(client.scheduler_info()["workers"])
+        self.previous = dict()  # worker -> (dataset, future)
+
+        if self.block_size is None:
+            self.block_size = int(np.ceil(max_frames / len(self.workers))) if max_frames > 0 else 100
+        logger.info(f"delta transport : blocks of {self.block_size} frames by worker")
+
+    def send(self, client, i, ds):
+        worker = self.workers[(i // self.block_size) % len(self.workers)]
+        previous, previous_future = self.previous.get(worker, (None, None))
+
+        with Timing() as timing:
+            delta = compute_delta(previous, ds, self.max_shift)
+        stats = Stats(size_data_compressed=delta.nbytes, time_data_compress=timing.dt)
+
+        submit_kwargs = dict(workers=[worker], allow_other_workers=True)
+        future = client.submit(apply_delta, previous_future, delta, **submit_kwargs)
+        self.previous[worker] = (ds, future)
+        return future, submit_kwargs, stats
+
+
+def hash_variable(var: xr.Variable):
+    """hash of a variable content (dims, dtype, attrs and values)"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((var.dims, var.shape, str(var.dtype), var.attrs)).encode())
+    values = var.values
+    if values.dtype.kind == "O":
+        h.update(repr(values.tolist()).encode())
+    elif values.dtype.kind in "mM":
+        # datetime64 / timedelta64 cannot be exposed as a buffer
+        h.update(np.ascontiguousarray(values).view("i8").data)
+    else:
+        h.update(np.ascontiguousarray(values).data)
+    return h.hexdigest()
+
+
+def assemble_dataset(variables: dict, coord_names: list, attrs: dict):
+    """build the dataset of a frame from its variables, on the worker"""
+    data_vars = {k: v for k, v in variables.items() if k not in coord_names}
+    coords = {k: v for k, v in variables.items() if k in coord_names}
+    return xr.Dataset(data_vars, coords=coords, attrs=attrs)
+
+
+class ScatterCache:
+    """LRU of data scattered to the workers, released when their total size exceed `max_memory`
+
+    Parameters
+    ----------
+    max_memory : int
+        maximum size of data kept on workers, in bytes
+    min_items : int, optional
+        number of items always kept, even bigger than `max_memory`, by default 1
+    """
+
+    def __init__(self, max_memory, min_items=1):
+        self.max_memory = max_memory
+        self.min_items = min_items
+        self.items = OrderedDict()  # key -> (future, nbytes)
+        self.memory = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def nbytes(self, key):
+        return self.items[key][1]
+
+    def get(self, client, key, load):
+        """return (future, hit). `load()` returns the data to scatter when `key` is not cached"""
+        if key in self.items:
+            self.items.move_to_end(key)
+            return self.items[key][0], True
+
+        data = load()
+        [future] = client.scatter([data], hash=False)
+        self.items[key] = (future, data.nbytes)
+        self.memory += data.nbytes
+        while self.memory > self.max_memory and len(self.items) > self.min_items:
+            # dropping the future release the data from workers memory
+            _, (_, nbytes) = self.items.popitem(last=False)
+            self.memory -= nbytes
+        return future, False
+
+
+class CacheTransport(Transport):
+    """send each distinct variable only once
+
+    Each variable is hashed (see :func:`hash_variable`). Variables bigger than `min_size` are scattered once
+    to the workers and kept in their memory, next frames only send a reference to them.
+    The driver keeps a LRU of the scattered variables : when their total size exceed `max_memory`,
+    the least recently used are released from the workers.
+    Usefull when frames share the same coordinates or static variables.
+
+    Parameters
+    ----------
+    max_memory : int, optional
+        maximum size of variables kept on workers, in bytes. By default 1e9
+    min_size : int, optional
+        variables smaller than min_size are always sent with the frame. By default 1e4
+    """
+
+    def __init__(self, max_memory=1e9, min_size=1e4):
+        self.max_memory = max_memory
+        self.min_size = min_size
+
+    def setup(self, client, max_frames):
+        self.cache = ScatterCache(self.max_memory)  # hash of variables
+
+    def send(self, client, i, ds):
+        if not isinstance(ds, xr.Dataset):
+            return ds, dict(), Stats()
+
+        stats = Stats(size_data_compressed=0, cache_hits=0, cache_misses=0)
+        variables = dict()
+        with Timing() as timing:
+            for name, var in ds.variables.items():
+                if var.nbytes < self.min_size:
+                    variables[name] = var
+                    stats.size_data_compressed += var.nbytes
+                    continue
+
+                variables[name], hit = self.cache.get(client, hash_variable(var), lambda: var)
+                if hit:
+                    stats.cache_hits += 1
+                else:
+                    stats.cache_misses += 1
+                    stats.size_data_compressed += var.nbytes
+        stats.time_data_compress = timing.dt
+
+        future = client.submit(assemble_dataset, variables, list(ds.coords), ds.attrs)
+        return future, dict(), stats
+
+
+class SourceTransport(Transport):
+    """send only selectors : each worker reads the slice of its frame from the source
+
+    `compute` should yield selectors (an indice along `source.dim` or a dict given to `ds.sel(...)`)
+    instead of datasets.
+
+    Parameters
+    ----------
+    source : anim.source.DataSource
+        dataset read by workers
+    """
+
+    def __init__(self, source: DataSource):
+        self.source = source
+
+    def send(self, client, i, selector):
+        return Selection(self.source, selector), dict(), Stats()
+
+
+class KeyframeTransport(Transport):
+    """send each keyframe once, and interpolate the data of each frame on the workers
+
+    `compute` should yield the time of each frame (see :meth:`anim.keyframes.Keyframes.compute`). Keyframes are
+    scattered once and kept on workers, each frame only sends references to the keyframes bracketing its time.
+    The driver keeps a LRU of the scattered keyframes : when their total size exceed `max_memory`,
+    the least recently used are released from the workers.
+
+    Parameters
+    ----------
+    keyframes : anim.keyframes.Keyframes
+        keyframes of the animation
+    max_memory : int, optional
+        maximum size of keyframes kept on workers, in bytes. By default 1e9
+    """
+
+    def __init__(self, keyframes: Keyframes, max_memory=1e9):
+        self.keyframes = keyframes
+        self.max_memory = max_memory
+
+    def setup(self, client, max_frames):
+        # keyframes bracketing the time of a frame are always kept
+        self.cache = ScatterCache(self.max_memory, min_items=4)  # keyframe indice
+
+    def send(self, client, i, t):
+        stats = Stats(size_data_compressed=0, cache_hits=0, cache_misses=0)
+        futures = []
+        with Timing() as timing:
+            for k in self.keyframes.indices(t):
+                future, hit = self.cache.get(client, k, lambda: self.keyframes.keyframe(k))
+                futures.append(future)
+                if hit:
+                    stats.cache_hits += 1
+                else:
+                    stats.cache_misses += 1
+                    stats.size_data_compressed += self.cache.nbytes(k)
+        stats.time_data_compress = timing.dt
+
+        keyframes = self.keyframes
+        future = client.submit(interp_keyframes, futures, t, keyframes.dim, keyframes.method)
+        return future, dict(), stats
+
+
+transports = {"dump": DumpTransport, "delta": DeltaTransport, "cache": CacheTransport}
+
+
+def build_transport(transport=None, max_size=1e6, codec=None):
+    """build a transport from its name, or return it if already built"""
+
+    if isinstance(transport, Transport):
+        return transport
+
+    if transport is None or transport == "dump":
+        return DumpTransport(max_size=max_size, codec=codec)
+
+    if transport not in transports:
+        raise ValueError(f"transport should be one of {list(transports)}, not '{transport}'")
+    return transports[transport]()
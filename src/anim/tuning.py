@@ -0,0 +1,80 @@
+"""Choose the number of workers and threads from a calibration run."""
+
+import logging
+import multiprocessing
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def calibration_size(max_frames=None):
+    """number of images built for the calibration"""
+    n = max(4, 2 * (multiprocessing.cpu_count() - 1))
+    if max_frames is not None and max_frames > 0:
+        n = min(n, max_frames)
+    return n
+
+
+def choose_layout(df, n_cpu=None, memory_budget=None):
+    """choose the number of workers and threads maximising images/s within a memory budget
+
+    Each worker uses at most the peak memory measured during calibration, and each additional thread the memory
+    used by one image (`rss_after - rss_before`). If all cores cannot have their own worker because of memory, and figures are built without pyplot,
+    the remaining cores are used as threads inside workers.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        stats of the calibration images, as returned by :func:`anim.anim.build_images`
+    n_cpu : int, optional
+        number of cores available for workers, by default all cores - 1
+    memory_budget : float, optional
+        memory available for workers, in bytes. By default 80% of the available memory
+
+    Returns
+    -------
+    tuple(int, int)
+        number of workers, number of threads by worker. All cores and 1 thread if no image was measured
+    """
+
+    if n_cpu is None:
+        n_cpu = max(1, multiprocessing.cpu_count() - 1)
+    if memory_budget is None:
+        import psutil
+
+        memory_budget = 0.8 * psutil.virtual_memory().available
+
+    default = n_cpu, 1
+    if len(df) == 0 or df["building (s)"].isna().all() or df["rss_after (Mo)"].isna().all():
+        logger.warning(f"no image measured during calibration, default layout : {n_cpu} workers x 1 thread")
+        return default
+
+    dt = np.nanmean(df["building (s)"] + df["saving (s)"])
+    rss = np.nanmax(df["rss_after (Mo)"]) * 1e6
+    # each thread holds the figure it is building : memory used by one image
+    per_thread = max(0.0, np.nan_to_num(np.nanmax(df["rss_after (Mo)"] - df["rss_before (Mo)"]))) * 1e6
+    pyplot = np.nanmax(df["pyplot figure"]) > 0
+    logger.info(
+        f"calibration on {len(df)} images : {dt * 1e3:.0f}ms by image, {rss / 1e6:.0f}Mo by worker, "
+        f"{per_thread / 1e6:.0f}Mo by image"
+    )
+
+    n_workers = int(min(n_cpu, max(1, memory_budget // rss)))
+    threads = 1
+    if n_workers < n_cpu:
+        logger.info(f"memory budget ({memory_budget / 1e9:.1f}Go) allows only {n_workers} workers for {n_cpu} cores")
+        if pyplot:
+            logger.info("figures are built with pyplot, threads cannot be used to fill the remaining cores")
+        else:
+            threads = int(np.ceil(n_cpu / n_workers))
+            if per_thread > 0:
+                # threads added to a worker need memory for their own image
+                threads = int(min(threads, max(1, 1 + (memory_budget / n_workers - rss) // per_thread)))
+    else:
+        logger.info(f"enough memory ({memory_budget / 1e9:.1f}Go) for one worker by core")
+
+    logger.info(
+        f"chosen layout : {n_workers} workers x {threads} threads, at most {n_workers * threads / dt:.1f} images/s"
+    )
+    return n_workers, threads
@@ -0,0 +1,97 @@
+"""Build a few sample images again each time the script of an animation is saved.
+
+``anim script.py --watch`` polls the modification time of the script. When it changes, the script is executed
+again, and images of the sample frames (``--only``, by default the first, middle and last frames) are built in
+parallel by warm workers, in the `sample` folder of the work folder. A render still running when the script is
+saved again is cancelled.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def default_sample(max_frames):
+    """first, middle and last frames, or only the first one if the number of frames is unknown"""
+    if max_frames is None or max_frames <= 0:
+        return [0]
+    return sorted({0, max_frames // 2, max_frames - 1})
+
+
+class Render:
+    """sample images of one version of the script, built in a thread
+
+    Parameters
+    ----------
+    kwargs : dict
+        parameters of :func:`anim.anim.animate`
+    sample : list
+        frames to build
+    """
+
+    def __init__(self, kwargs, sample):
+        self.cancel = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(kwargs, sample), name="anim-watch", daemon=True)
+        self.thread.start()
+
+    def _run(self, kwargs, sample):
+        from anim.anim import animate
+
+        try:
+            animate(**kwargs, sample=sample, cancel=self.cancel)
+        except Exception:
+            logger.exception("sample images not built")
+
+    def running(self):
+        return self.thread.is_alive()
+
+    def stop(self):
+        self.cancel.set()
+
+
+def watch(pythonfile, load, client, sample=None, interval=0.05):
+    """build sample images each time `pythonfile` is saved, until interrupted
+
+    Parameters
+    ----------
+    pythonfile : str
+        script of the animation
+    load : callable
+        `load(pythonfile)` executes the script and returns parameters of :func:`anim.anim.animate`
+    client : dask.Client
+        client used by all renders, so workers stay warm
+    sample : list, optional
+        frames to build, by default :func:`default_sample`
+    interval : float, optional
+        seconds between checks of the modification time, by default 0.05
+    """
+    last = None
+    render = None
+    logger.info(f"watching {pythonfile}, ctrl+c to stop")
+    try:
+        while True:
+            mtime = os.stat(pythonfile).st_mtime_ns
+            if mtime != last:
+                last = mtime
+                if render is not None and render.running():
+                    logger.info("script modified : cancelling the previous render")
+                    render.stop()
+
+                try:
+                    kwargs = load(pythonfile)
+                except Exception as err:
+                    logger.error(f"{err}\nwaiting for the next modification..")
+                else:
+                    frames = default_sample(kwargs["max_frames"]) if not sample else sample
+                    logger.info(f"building sample images {frames}")
+                    render = Render({**kwargs, "client": client}, frames)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        logger.info("stop watching")
+    finally:
+        if render is not None:
+            render.stop()
+            render.thread.join()
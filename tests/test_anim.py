@@ -0,0 +1,182 @@
+import asyncio
+import os
+import threading
+import warnings
+
+import matplotlib.image
+import numpy as np
+import pytest
+import xarray as xr
+from dask.distributed import Client
+
+import anim
+import anim.anim
+import anim.segments
+from anim.anim import _sanitize_frames, animate, animate_async, build_images, process
+from anim.data import Progress
+
+
+def compute(start=0):
+    for i in range(start, 6):
+        yield xr.Dataset({"v": ("x", np.arange(3) + i)})
+
+
+def plot(i, ds):
+    fig, ax = anim.subplots(1, 1, figsize=(2, 1), dpi=100)
+    ax.plot(ds.v)
+    return fig
+
+
+@pytest.fixture(scope="module")
+def client():
+    with Client(processes=False, n_workers=1, threads_per_worker=1, dashboard_address=":0") as client:
+        yield client
+
+
+def images(folder):
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder))
+
+
+class Test_BuildImages:
+    def test_pipeline(self, tmp_path, client, monkeypatch):
+        submitted = []
+        submit = client.submit
+
+        def record(func, *args, **kwargs):
+            if func is process:
+                submitted.append(args[0])
+            return submit(func, *args, **kwargs)
+
+        monkeypatch.setattr(client, "submit", record)
+        # frames are serialized by a pool of threads, but submitted in order
+        _, df = build_images(
+            plot, str(tmp_path / "imgs"), compute=compute, client=client, prefetch=2, transport="dump", max_memory_ds=0
+        )
+        assert submitted == list(range(6))
+        assert len(images(tmp_path / "imgs")) == 6
+
+        # stats of the driver (compute, serialization) and of the workers are merged
+        columns = ["data_computation (ms)", "data_compressed (Mo)", "data_compress (ms)", "building (s)"]
+        assert len(df) == 6
+        assert df[columns].notna().all().all()
+
+    def test_worker_setup(self, tmp_path, client):
+        def gui_filter():
+            return any(f[1] is not None and "Matplotlib GUI" in f[1].pattern for f in warnings.filters)
+
+        build_images(plot, str(tmp_path / "imgs"), compute=compute, client=client)
+        # installed once by worker, not around each plot
+        assert all(client.run(gui_filter).values())
+
+
+class Test_Draft:
+    def test_folder(self, tmp_path, client):
+        animate(plot, str(tmp_path), 10, compute=compute, client=client, draft=2, draft_dpi=20, no_convert=True)
+        folder = tmp_path / "draft" / "2_20" / "imgs"
+        assert len(images(folder)) == 3
+        # figsize x draft_dpi
+        assert matplotlib.image.imread(images(folder)[0]).shape[:2] == (20, 40)
+        assert not (tmp_path / "imgs").exists()
+
+    def test_options(self, tmp_path, client):
+        # drafts with another stride or dpi don't reuse images of previous drafts
+        animate(plot, str(tmp_path), 10, compute=compute, client=client, draft=2, draft_dpi=20, no_convert=True)
+        animate(plot, str(tmp_path), 10, compute=compute, client=client, draft=3, draft_dpi=20, no_convert=True)
+        animate(plot, str(tmp_path), 10, compute=compute, client=client, draft=2, draft_dpi=30, no_convert=True)
+        assert len(images(tmp_path / "draft" / "3_20" / "imgs")) == 2
+        assert matplotlib.image.imread(images(tmp_path / "draft" / "2_30" / "imgs")[0]).shape[:2] == (30, 60)
+        assert matplotlib.image.imread(images(tmp_path / "draft" / "2_20" / "imgs")[0]).shape[:2] == (20, 40)
+
+
+class Test_Sample:
+    def test_frames_list(self):
+        assert _sanitize_frames([500, 0, 100, 0]) == (slice(0, 501), {0, 100, 500})
+        assert _sanitize_frames(slice(10, None)) == (slice(10, float("inf")), None)
+
+    def test_publish(self, tmp_path, client):
+        kwargs = dict(f_plot=plot, workFolder=str(tmp_path), fps=10, compute=compute, client=client)
+        animate(**kwargs, sample=[0, 1])
+        published = tmp_path / "sample" / "imgs"
+        first = images(published)
+        assert len(first) == 2
+
+        # a cancelled render leaves the previous sample untouched
+        cancel = threading.Event()
+        cancel.set()
+        animate(**kwargs, sample=[2], cancel=cancel)
+        assert images(published) == first
+        assert len(os.listdir(tmp_path / "sample")) == 2
+
+        animate(**kwargs, sample=[2], savefig_kwargs=dict(dpi=20))
+        (last,) = images(published)
+        assert matplotlib.image.imread(last).shape[:2] == (20, 40)
+        # previous samples are deleted
+        assert len(os.listdir(tmp_path / "sample")) == 2
+
+
+class Test_Video:
+    def test_segments_error(self, tmp_path, client, monkeypatch):
+        # ffmpeg error
+        monkeypatch.setattr(anim.segments, "_encode_segment", lambda *args: 1)
+        events = []
+        video = animate(plot, str(tmp_path), 10, compute=compute, client=client, segment_size=4, progress=events.append)
+        assert video is None
+        assert events[-1].stage == "done" and events[-1].result is None
+
+    def test_store_error(self, tmp_path, client, monkeypatch):
+        monkeypatch.setattr(anim.anim, "store2video", lambda *args, **kwargs: None)
+        assert animate(plot, str(tmp_path), 10, compute=compute, client=client, frame_store=True, max_frames=6) is None
+
+
+class Test_Async:
+    def test_animate_async(self, monkeypatch):
+        threads = set()
+
+        def animate(f_plot, workFolder, fps, progress=None, **kwargs):
+            threads.add(threading.current_thread().name)
+            progress(Progress("images", done=1, total=1))
+            progress(Progress("done", result=f"{workFolder}/video.mp4"))
+            return f"{workFolder}/video.mp4"
+
+        monkeypatch.setattr(anim.anim, "animate", animate)
+        events = []
+
+        async def main():
+            return await asyncio.gather(*(animate_async(None, folder, 24, progress=events.append) for folder in "ab"))
+
+        assert asyncio.run(main()) == ["a/video.mp4", "b/video.mp4"]
+        assert threading.main_thread().name not in threads
+        assert sorted((e.name, e.stage) for e in events) == [
+            ("a", "done"),
+            ("a", "images"),
+            ("b", "done"),
+            ("b", "images"),
+        ]
+
+    def test_error(self, monkeypatch):
+        def animate(*args, **kwargs):
+            raise KeyError("broken")
+
+        monkeypatch.setattr(anim.anim, "animate", animate)
+        with pytest.raises(KeyError):
+            asyncio.run(animate_async(None, "a", 24))
+
+    def test_cancel(self, monkeypatch):
+        cancels = []
+
+        def animate(*args, cancel=None, **kwargs):
+            cancels.append(cancel)
+            cancel.wait(5)
+
+        monkeypatch.setattr(anim.anim, "animate", animate)
+
+        async def main():
+            task = asyncio.create_task(animate_async(None, "a", 24))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(main())
+        # the animation is stopped
+        assert cancels[0].is_set()
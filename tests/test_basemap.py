@@ -0,0 +1,64 @@
+import importlib.util
+
+import numpy as np
+
+import anim
+from anim.basemap import BasemapCache
+
+
+def draw(ax):
+    # left half red, right half blue
+    ax.axvspan(-180, 0, color="r")
+    ax.axvspan(0, 180, color="b")
+
+
+class Test_BasemapCache:
+    def build(self, tmp_path):
+        extents = np.array([[-100, 100, -50, 50], [-10, 10, -5, 5]])
+        return BasemapCache.from_extents(
+            str(tmp_path), extents, shape=(50, 100), draw=draw, tile_size=64, projection=None
+        )
+
+    def test_pyramid(self, tmp_path):
+        basemap = self.build(tmp_path)
+        assert basemap.resolution == 5
+        assert basemap.region == (-100, 100, -50, 50)
+        assert basemap.n_tiles(0) == (16, 8)
+        assert basemap.n_tiles(basemap.levels - 1) == (1, 1)
+
+    def test_background(self, tmp_path):
+        basemap = self.build(tmp_path)
+        for extent in ([-100, 100, -50, 50], [-10, 10, -5, 5], [-30, 20, 0, 20]):
+            img = basemap.background(extent, (20, 40))
+            assert img.shape == (20, 40, 4)
+            x = np.linspace(extent[0], extent[1], 40, endpoint=False) + (extent[1] - extent[0]) / 80
+            left, right = x < -1, x > 1
+            assert (img[:, left, 0] > 200).all() and (img[:, left, 2] < 50).all()
+            assert (img[:, right, 2] > 200).all() and (img[:, right, 0] < 50).all()
+
+    def test_lazy_tiles(self, tmp_path):
+        basemap = self.build(tmp_path)
+        basemap.background([-10, 10, -5, 5], (50, 100))
+        # only the finest tiles covering the extent are rendered
+        assert len(list(tmp_path.glob("*/0_*.npy"))) == 4
+        assert len(list(tmp_path.glob("*/*.npy"))) == 4
+
+    def test_plot(self, tmp_path):
+        basemap = self.build(tmp_path)
+        fig, ax = anim.subplots(figsize=(2, 1), dpi=100)
+        basemap.plot(ax, (-10, 10, -5, 5))
+        assert ax.get_xlim() == (-10, 10)
+        assert len(ax.images) == 1
+
+    def test_key_draw(self, tmp_path):
+        def load(source):
+            (tmp_path / "script.py").write_text(source)
+            spec = importlib.util.spec_from_file_location("script", tmp_path / "script.py")
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            return BasemapCache(str(tmp_path), (-10, 10, -5, 5), 5, draw=module.draw, projection=None)
+
+        basemap = load("def draw(ax):\n    ax.axvspan(-180, 180, color='r')\n")
+        assert load("def draw(ax):\n    ax.axvspan(-180, 180, color='r')\n").folder == basemap.folder
+        # draw modified, with the same name : tiles are rendered again
+        assert load("def draw(ax):\n    ax.axvspan(-180, 180, color='g')\n").folder != basemap.folder
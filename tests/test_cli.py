@@ -0,0 +1,100 @@
+import pickle
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import anim.store
+from anim.cli import app, import_script
+from anim.store import FrameStore
+
+
+class Test_Imports:
+    def test_lazy_package(self):
+        """heavy modules should not be imported with `import anim`"""
+
+        code = "import sys, anim; print(','.join(m for m in ('dask', 'matplotlib', 'xarray', 'zarr', 'scipy') if m in sys.modules))"
+        res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        assert res.stdout.strip() == ""
+
+    def test_lazy_attributes(self):
+        import anim
+
+        assert callable(anim.animate)
+        assert callable(anim.video2gif)
+        assert "animate" in dir(anim)
+
+    def test_lazy_cli(self):
+        """`anim --help` should not pay heavy imports"""
+
+        code = (
+            "import sys, contextlib, anim.cli\n"
+            "sys.argv = ['anim', '--help']\n"
+            "with contextlib.redirect_stdout(None), contextlib.suppress(SystemExit):\n"
+            "    anim.cli.usage()\n"
+            "print(','.join(m for m in ('dask', 'matplotlib', 'xarray') if m in sys.modules))"
+        )
+        res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        assert res.stdout.strip() == ""
+
+
+class Test_ImportScript:
+    def test_pickle_by_reference(self, tmp_path):
+        script = tmp_path / "anim_test_script.py"
+        script.write_text("def plot(i, ds):\n    return i\n")
+        try:
+            module = import_script(str(script))
+            # workers import the script and find `plot` by its name
+            data = pickle.dumps(module.plot)
+            assert b"anim_test_script" in data and b"return" not in data
+            assert pickle.loads(data) is module.plot
+        finally:
+            sys.modules.pop("anim_test_script", None)
+
+    def test_shadow_imported(self, tmp_path):
+        script = tmp_path / "json.py"
+        script.write_text("")
+        with pytest.raises(RuntimeError, match="shadows"):
+            import_script(str(script))
+
+    def test_shadow_importable(self, tmp_path, monkeypatch):
+        # a module with the same name, not imported yet
+        (tmp_path / "lib").mkdir()
+        (tmp_path / "lib" / "anim_shadowed.py").write_text("")
+        monkeypatch.syspath_prepend(str(tmp_path / "lib"))
+        script = tmp_path / "anim_shadowed.py"
+        script.write_text("")
+        with pytest.raises(RuntimeError, match="shadows the module"):
+            import_script(str(script))
+        assert "anim_shadowed" not in sys.modules
+
+
+class Test_Preview:
+    @pytest.fixture
+    def script(self, tmp_path):
+        script = tmp_path / "anim_preview_script.py"
+        script.write_text(
+            f"ANIM_OUTPUT_FOLDER = {str(tmp_path / 'out')!r}\nANIM_FPS = 8\nANIM_MAX_FRAMES = 8\n\n"
+            "def plot(i, ds):\n    pass\n"
+        )
+        yield str(script)
+        sys.modules.pop("anim_preview_script", None)
+
+    def test_frame_store(self, script, tmp_path, monkeypatch):
+        encoded = []
+        monkeypatch.setattr(
+            anim.store, "store2video", lambda store, fps, *args, frames, **kwargs: encoded.append((fps, frames))
+        )
+        monkeypatch.setattr(sys, "argv", ["anim", script, "--preview", "--frame-store"])
+        # png images are never saved with the frame store
+        app()
+        assert encoded == []
+
+        store = FrameStore(str(tmp_path / "out" / "frames"), 8)
+        for i in (0, 2, 4, 6, 7):
+            store.write(i, np.zeros((2, 2, 4), dtype=np.uint8))
+        app()
+        ((fps, frames),) = encoded
+        assert fps == 4
+        np.testing.assert_array_equal(frames, [0, 2, 4, 6])
@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import xarray as xr
+
+from anim.anim import compute_cache_folder
+from anim.compute_cache import ComputeCache, compute_key
+from anim.tools import FrameIterator
+
+computed = []
+
+
+def compute(start=0):
+    for i in range(start, 5):
+        computed.append(i)
+        yield xr.Dataset({"v": ("x", np.arange(3) + i)})
+
+
+def compute_no_start():
+    for i in range(5):
+        computed.append(i)
+        yield xr.Dataset({"v": ("x", np.arange(3) + i)})
+
+
+def other_compute():
+    yield xr.Dataset()
+
+
+class Test_ComputeCache:
+    def test_key(self):
+        assert compute_key(compute) != compute_key(other_compute)
+        assert compute_key(compute) == compute_key(compute)
+
+    def test_cache(self, tmp_path):
+        computed.clear()
+        cache = ComputeCache(compute, str(tmp_path))
+        assert [int(ds.v[0]) for ds in cache()] == list(range(5))
+        assert computed == list(range(5))
+
+        computed.clear()
+        frames = FrameIterator(ComputeCache(compute, str(tmp_path)))
+        frames.seek(3)
+        xr.testing.assert_identical(next(frames), xr.Dataset({"v": ("x", np.arange(3) + 3)}))
+        assert computed == []
+
+    def test_end(self, tmp_path):
+        # without `start=`, finding the end of compute would compute all frames again
+        computed.clear()
+        assert len(list(ComputeCache(compute_no_start, str(tmp_path))())) == 5
+        assert computed == list(range(5))
+
+        computed.clear()
+        cache = ComputeCache(compute_no_start, str(tmp_path))
+        assert cache.n_frames == 5
+        assert [int(ds.v[0]) for ds in cache()] == list(range(5))
+        assert computed == []
+
+    def test_attrs(self, tmp_path):
+        # zarr only accepts json attributes
+        def compute_attrs(start=0):
+            for i in range(start, 2):
+                v = xr.Variable("x", np.arange(3), attrs=dict(bounds=np.arange(2)))
+                yield xr.Dataset({"v": v}, attrs=dict(time=np.datetime64("2020-01-01") + i, units="m"))
+
+        list(ComputeCache(compute_attrs, str(tmp_path))())
+        cache = ComputeCache(compute_attrs, str(tmp_path))
+        assert 1 in cache
+        ds = cache.load(1)
+        assert ds.attrs == dict(time=np.datetime64("2020-01-02"), units="m")
+        np.testing.assert_array_equal(ds.v.attrs["bounds"], np.arange(2))
+
+    def test_not_cached(self, tmp_path):
+        def compute_object(start=0):
+            yield xr.Dataset({"v": ("x", np.array([{}, None], dtype=object))})
+
+        cache = ComputeCache(compute_object, str(tmp_path))
+        assert len(list(cache())) == 1
+        assert 0 not in cache
+
+    def test_key_folder(self):
+        assert compute_cache_folder("out", False) is None
+        assert compute_cache_folder("out", True) == os.path.join("out", "compute_cache")
+        assert compute_cache_folder("out", "v2") == os.path.join("out", "compute_cache", "v2")
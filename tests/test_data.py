@@ -0,0 +1,133 @@
+import multiprocessing
+
+import numcodecs
+import numpy as np
+import pytest
+import xarray as xr
+import zarr
+
+from anim.anim import frame_priorities
+from anim.data import Codec, CodecSelector, RecyclingPolicy, Stats, StatStorage, dump_data, load_data, load_frame_costs
+
+
+class Test_Codec:
+    def test_parse(self):
+        codec = Codec.parse("zstd:3:noshuffle")
+        assert codec == Codec("zstd", 3, False)
+        assert str(codec) == "zstd:3:noshuffle"
+
+    def test_parse_none(self):
+        assert Codec.parse("none").compressor() is None
+
+    def test_wrong_name(self):
+        with pytest.raises(ValueError):
+            Codec.parse("gzip")
+
+    def test_compressor(self):
+        compressor = Codec.parse("lz4:1").compressor()
+        assert compressor == numcodecs.Blosc(cname="lz4", clevel=1, shuffle=numcodecs.Blosc.SHUFFLE)
+
+
+class Test_DumpData:
+    ds = xr.Dataset({"a": ("x", np.arange(1000.0)), "b": ("x", np.zeros(1000))})
+
+    def test_small_data(self):
+        data, stats = dump_data(self.ds, max_size=1e6)
+        assert data is self.ds
+        assert np.isnan(stats.size_data_compressed)
+
+    def test_codec_by_variable(self):
+        data, stats = dump_data(self.ds, max_size=0, codec={"a": "none", "b": "lz4"})
+        assert isinstance(data, zarr.hierarchy.Group)
+        assert data["a"].compressor is None
+        assert data["b"].compressor.cname == "lz4"
+
+        ds, _ = load_data(data)
+        xr.testing.assert_identical(ds, self.ds)
+
+
+class Test_CodecSelector:
+    def test_select(self):
+        selector = CodecSelector(candidates=("none", "lz4"), n_trials=1, bandwidth=1e6)
+
+        codec = selector.choose()
+        selector.update(codec, Stats(time_data_compress=0, size_data_compressed=1e6))
+        codec = selector.choose()
+        selector.update(codec, Stats(time_data_compress=0.1, size_data_compressed=1e5))
+
+        # none : 1s of transfer, lz4 : 0.1s + 0.1s
+        assert str(selector.choose()) == "lz4:5:shuffle"
+
+
+class Test_Stats:
+    def test_merge(self):
+        stats = Stats(img_name="a", img_building=1.0) | Stats(worker="tcp://w", img_saving=2.0)
+        assert stats.img_name == "a"
+        assert stats.worker == "tcp://w"
+        assert stats.img_building == 1.0
+        assert stats.img_saving == 2.0
+
+
+class Test_RecyclingPolicy:
+    def test_inactive(self):
+        assert not RecyclingPolicy()(Stats(worker="w", rss_after=1e12))
+
+    def test_max_frames(self):
+        policy = RecyclingPolicy(max_frames=2)
+        assert not policy(Stats(worker="w"))
+        assert not policy(Stats(worker="other"))
+        assert policy(Stats(worker="w"))
+
+        policy.reset("w")
+        assert not policy(Stats(worker="w"))
+
+    def test_max_memory(self):
+        policy = RecyclingPolicy(max_memory=1e9)
+        assert not policy(Stats(worker="w", rss_after=5e8))
+        assert policy(Stats(worker="w", rss_after=2e9))
+
+
+def save_stats(filename, frames):
+    for i in frames:
+        storage = StatStorage()
+        storage(Stats(img_name=str(i), frame=i, img_building=1.0))
+        storage.save(filename)
+
+
+class Test_FrameCosts:
+    def test_save_merge(self, tmp_path):
+        filename = str(tmp_path / "stats.csv")
+        storage = StatStorage()
+        storage(Stats(img_name="a", frame=0, img_building=1.0, img_saving=0.5))
+        storage(Stats(img_name="b", frame=1, img_building=2.0, img_saving=0.5))
+        storage(Stats(img_name="c", frame=2))  # not built
+        storage.save(filename)
+
+        storage = StatStorage()
+        storage(Stats(img_name="a", frame=0, img_building=3.0, img_saving=0.5))
+        storage.save(filename)
+
+        assert load_frame_costs(filename) == {0: 3.5, 1: 2.5}
+
+    def test_save_shards(self, tmp_path):
+        # shards save their stats in the same file at the same time
+        filename = str(tmp_path / "stats.csv")
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            pool.starmap(save_stats, [(filename, range(k, 40, 4)) for k in range(4)])
+        assert sorted(load_frame_costs(filename)) == list(range(40))
+
+    def test_priorities(self, tmp_path):
+        filename = str(tmp_path / "stats.csv")
+        assert frame_priorities(filename)(5) == 0
+
+        storage = StatStorage()
+        for i, cost in enumerate([1.0, 2.0, 4.0]):
+            storage(Stats(img_name=str(i), frame=i, img_building=cost))
+        storage.save(filename)
+
+        priorities = frame_priorities(filename)
+        assert priorities(2) > priorities(1) > priorities(0)
+        assert priorities(10) == priorities(1)  # never built : median cost
+        assert frame_priorities(filename, "sequential")(2) == 0
+        with pytest.raises(ValueError):
+            frame_priorities(filename, "random")
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from anim.keyframes import Keyframes, interp_keyframes
+
+
+def hourly(n=5):
+    time = np.datetime64("2020-01-01T00", "ns") + np.arange(n) * np.timedelta64(1, "h")
+    return xr.Dataset({"v": (("time", "x"), np.arange(n)[:, None] * np.ones((n, 3)))}, coords={"time": time})
+
+
+class Test_Keyframes:
+    def test_indices(self):
+        ds = hourly()
+        times = ds.time.values[0] + np.arange(0, 240, 20) * np.timedelta64(1, "m")
+        assert Keyframes(ds, times).indices(times[4]) == [1, 2]
+        assert Keyframes(ds, times).indices(ds.time.values[-1]) == [3, 4]
+        assert Keyframes(ds, times, method="cubic").indices(times[4]) == [0, 1, 2, 3]
+        assert Keyframes(ds, times, method="cubic").indices(times[0]) == [0, 1, 2]
+        with pytest.raises(ValueError):
+            Keyframes(ds, times, method="nearest")
+
+    def test_interp(self):
+        ds = hourly()
+        t = ds.time.values[1] + np.timedelta64(15, "m")
+        keyframes = Keyframes(ds, [t])
+        np.testing.assert_allclose(keyframes.interp(t).v, 1.25)
+        assert keyframes.interp(t).time.values == t
+        np.testing.assert_allclose(Keyframes(ds, [t], method="cubic").interp(t).v, 1.25)
+
+    def test_single_keyframe(self):
+        ds = hourly(1)
+        xr.testing.assert_identical(interp_keyframes([ds], ds.time.values[0]), ds.isel(time=0))
@@ -0,0 +1,46 @@
+import matplotlib.image
+import numpy as np
+
+import anim
+from anim.layers import has_static_layer, layer_key, save_layers
+
+
+def build_figure(i, xlim=(0, 10), seed=0, cmap="viridis"):
+    fig, ax = anim.subplots(1, 1, figsize=(4, 3), dpi=50)
+    anim.mark_static(ax.imshow(np.random.RandomState(seed).rand(20, 20), extent=(0, 10, 0, 10), cmap=cmap))
+    ax.plot([0, 10], [i, 10 - i], lw=3, alpha=0.6)
+    ax.set_title(f"frame {i}")
+    ax.set_xlim(*xlim)
+    return fig
+
+
+class Test_Layers:
+    def test_key(self):
+        assert has_static_layer(build_figure(0))
+        assert not has_static_layer(anim.figure())
+        assert layer_key(build_figure(0), 50) == layer_key(build_figure(1), 50)
+        assert layer_key(build_figure(0), 50) != layer_key(build_figure(0), 100)
+        assert layer_key(build_figure(0), 50) != layer_key(build_figure(0, xlim=(0, 5)), 50)
+
+    def test_key_content(self):
+        # same layout, but static artists draw something else
+        assert layer_key(build_figure(0), 50) != layer_key(build_figure(0, seed=1), 50)
+        assert layer_key(build_figure(0), 50) != layer_key(build_figure(0, cmap="gray"), 50)
+
+        def with_line(y):
+            fig = build_figure(0)
+            anim.mark_static(*fig.axes[0].plot([0, 10], [y, y]))
+            return fig
+
+        assert layer_key(with_line(1), 50) == layer_key(with_line(1), 50)
+        assert layer_key(with_line(1), 50) != layer_key(with_line(2), 50)
+
+    def test_same_image(self, tmp_path):
+        for i in range(2):
+            build_figure(i).savefig(tmp_path / "ref.png")
+            save_layers(build_figure(i), tmp_path / "layers.png", cache_folder=tmp_path / "cache")
+
+            ref = matplotlib.image.imread(tmp_path / "ref.png")
+            layers = matplotlib.image.imread(tmp_path / "layers.png")
+            np.testing.assert_allclose(ref, layers, atol=2 / 255)
+        assert len(list((tmp_path / "cache").iterdir())) == 1
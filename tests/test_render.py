@@ -0,0 +1,39 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib.pyplot as plt
+import numpy as np
+import xarray as xr
+
+import anim
+from anim.anim import process
+from anim.data import AnimationInfo
+from anim.render import is_pyplot_figure
+
+
+def plot(i, ds):
+    fig, ax = anim.subplots(1, 1, figsize=(2, 2), dpi=50)
+    ax.plot(np.arange(10) * i)
+    return fig
+
+
+class Test_Render:
+    def test_figure(self):
+        fig = anim.figure(figsize=(2, 2))
+        assert not is_pyplot_figure(fig)
+        assert len(plt.get_fignums()) == 0
+
+    def test_pyplot_figure(self):
+        fig = plt.figure()
+        assert is_pyplot_figure(fig)
+        plt.close(fig)
+
+    def test_process_threads(self, tmp_path):
+        info = AnimationInfo(imagePatern=os.path.join(tmp_path, "img_%02d.png"), threads=4)
+
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda i: process(i, xr.Dataset(), plot, info), range(8)))
+
+        assert all(os.path.exists(info.imagePatern % i) for i in range(8))
+        assert all(stats.img_saving > 0 for _, stats in results)
+        assert len(plt.get_fignums()) == 0
@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+import anim.anim
+import anim.scene
+from anim.scene import Scene, Timeline
+
+
+def plot_a(i, ds):
+    return "a"
+
+
+def plot_b(i, ds):
+    return "b"
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """fake `animate` : images and videos are empty files"""
+    calls = []
+
+    def animate(f_plot, workFolder, fps, force=False, only_convert=False, draft=False, **kwargs):
+        calls.append((os.path.basename(workFolder), "convert" if only_convert else "build", force))
+        if only_convert:
+            videoName = os.path.join(workFolder, "draft.mp4" if draft else "video.mp4")
+            open(videoName, "w").close()
+            return videoName
+        imgs = os.path.join(workFolder, "draft", f"{draft}_20", "imgs") if draft else os.path.join(workFolder, "imgs")
+        os.makedirs(imgs, exist_ok=True)
+        if force or not os.path.exists(os.path.join(imgs, "img_0.png")):
+            open(os.path.join(imgs, "img_0.png"), "w").close()
+
+    monkeypatch.setattr(anim.anim, "animate", animate)
+    monkeypatch.setattr(anim.scene, "concat_videos", lambda videos, videoName, **kwargs: videos)
+    return calls
+
+
+class Test_Timeline:
+    def test_key(self):
+        assert Scene("s", plot_a, 24).key() == Scene("s", plot_a, 24).key()
+        assert Scene("s", plot_a, 24).key() != Scene("s", plot_b, 24).key()
+        # fps only changes the video
+        assert Scene("s", plot_a, 24).key() == Scene("s", plot_a, 30).key()
+
+    def test_key_options(self):
+        scene = Scene("s", plot_a, 24, kwargs=dict(savefig_kwargs=dict(dpi=50)))
+        assert scene.key() != Scene("s", plot_a, 24).key()
+        assert scene.key() != Scene("s", plot_a, 24, kwargs=dict(source="data.zarr")).key()
+        # options of the timeline are overridden by the scene
+        assert scene.key(dict(savefig_kwargs=dict(dpi=100))) == scene.key()
+        assert Scene("s", plot_a, 24).key(dict(savefig_kwargs=dict(dpi=50))) == scene.key()
+        # options which don't change images
+        assert scene.key(dict(nprocess=4, draft=10, client=object())) == scene.key()
+
+    def test_duplicate(self, tmp_path):
+        timeline = Timeline(str(tmp_path))
+        timeline.add("intro", plot_a, 24)
+        with pytest.raises(ValueError):
+            timeline.add("intro", plot_b, 24)
+
+    def test_render(self, tmp_path, calls):
+        timeline = Timeline(str(tmp_path))
+        timeline.add("intro", plot_a, 24)
+        timeline.add("zoom", plot_a, 24)
+        videos = timeline.render(client=object())
+        assert videos == [str(tmp_path / "intro" / "video.mp4"), str(tmp_path / "zoom" / "video.mp4")]
+        assert [c[1] for c in calls] == ["build", "convert", "build", "convert"]
+
+        # nothing changed : videos of scenes are kept
+        calls.clear()
+        timeline.render(client=object())
+        assert calls == [("intro", "build", False), ("zoom", "build", False)]
+
+        # only the modified scene is built and encoded again
+        calls.clear()
+        timeline.scenes[1].plot = plot_b
+        os.utime(tmp_path / "zoom" / "video.mp4", (0, 0))
+        timeline.render(client=object())
+        assert calls == [("intro", "build", False), ("zoom", "build", True), ("zoom", "convert", False)]
+
+    def test_fps(self, tmp_path, calls):
+        timeline = Timeline(str(tmp_path))
+        timeline.add("intro", plot_a, 24)
+        timeline.render(client=object())
+
+        # images are kept, only the video is encoded again
+        calls.clear()
+        timeline.scenes[0].fps = 30
+        timeline.render(client=object())
+        assert calls == [("intro", "build", False), ("intro", "convert", False)]
+
+        calls.clear()
+        timeline.render(client=object())
+        assert calls == [("intro", "build", False)]
+
+    def test_draft(self, tmp_path, calls):
+        timeline = Timeline(str(tmp_path))
+        timeline.add("intro", plot_a, 24)
+        timeline.render(client=object())
+
+        # draft images don't make the video out of date, nor the draft up to date
+        timeline.render(client=object(), draft=2, force=True)
+        calls.clear()
+        timeline.render(client=object())
+        assert calls == [("intro", "build", False)]
+
+        # a draft encoded with a new fps doesn't mark the video as encoded with it
+        timeline.scenes[0].fps = 30
+        timeline.render(client=object(), draft=2)
+        calls.clear()
+        timeline.render(client=object())
+        assert calls == [("intro", "build", False), ("intro", "convert", False)]
+
+    def test_scene_options(self, tmp_path, calls):
+        # options given to `animate` by the timeline can be options of a scene
+        timeline = Timeline(str(tmp_path))
+        timeline.add("intro", plot_a, 24, force=True, no_convert=True)
+        timeline.render(client=object())
+        assert calls == [("intro", "build", True)]
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+import anim.segments
+from anim.segments import read_layout, segments2video
+
+
+@pytest.fixture
+def encoded(monkeypatch):
+    """fake ffmpeg : segments are empty files"""
+    encoded = []
+
+    def encode(imagePatern, fps, start, n, segmentName, *args):
+        encoded.append((start, n))
+        open(segmentName, "w").close()
+        return 0
+
+    monkeypatch.setattr(anim.segments, "_encode_segment", encode)
+    monkeypatch.setattr(anim.segments, "concat_videos", lambda segments, videoName, **kwargs: segments)
+    return encoded
+
+
+def touch(patern, indices, mtime):
+    for i in indices:
+        open(patern % i, "w").close()
+        os.utime(patern % i, (mtime, mtime))
+
+
+class Test_Segments:
+    def test_incremental(self, tmp_path, encoded):
+        patern = str(tmp_path / "img_%03d.png")
+        video = str(tmp_path / "video.mp4")
+        touch(patern, range(25), 1000)
+
+        segments = segments2video(patern, 10, video, segment_size=10)
+        assert len(segments) == 3
+        assert encoded == [(0, 10), (10, 10), (20, 5)]
+        layout = read_layout(str(tmp_path / "segments" / "video" / "segments.json"))
+        assert layout["segments"]["2"] == dict(start=20, stop=25, n=5, mtime=1000)
+
+        # only the segment of the modified image is encoded again
+        encoded.clear()
+        touch(patern, [13], 2000)
+        segments2video(patern, 10, video, segment_size=10)
+        assert encoded == [(10, 10)]
+
+        # new images at the end
+        encoded.clear()
+        touch(patern, range(25, 28), 1000)
+        segments2video(patern, 10, video, segment_size=10)
+        assert encoded == [(20, 8)]
+
+    def test_params(self, tmp_path, encoded):
+        patern = str(tmp_path / "img_%03d.png")
+        touch(patern, range(15), 1000)
+        segments2video(patern, 10, str(tmp_path / "video.mp4"), segment_size=10)
+        encoded.clear()
+        segments2video(patern, 24, str(tmp_path / "video.mp4"), segment_size=10)
+        assert encoded == [(0, 10), (10, 5)]
+
+    def test_no_image(self, tmp_path, encoded):
+        assert segments2video(str(tmp_path / "img_%03d.png"), 10, str(tmp_path / "video.mp4")) is None
+
+    def test_missing_image(self, tmp_path, encoded):
+        patern = str(tmp_path / "img_%03d.png")
+        touch(patern, [i for i in range(30) if i != 14], 1000)
+        # images after the missing one are not in the video
+        segments = segments2video(patern, 10, str(tmp_path / "video.mp4"), segment_size=10)
+        assert len(segments) == 2
+        assert encoded == [(0, 10), (10, 4)]
+
+    def test_ffmpeg_error(self, tmp_path, encoded, monkeypatch):
+        patern = str(tmp_path / "img_%03d.png")
+        touch(patern, range(25), 1000)
+        monkeypatch.setattr(anim.segments, "_encode_segment", lambda imagePatern, fps, start, *args: int(start == 10))
+        assert segments2video(patern, 10, str(tmp_path / "video.mp4"), segment_size=10) is None
+        layout = read_layout(str(tmp_path / "segments" / "video" / "segments.json"))
+        assert list(layout["segments"]) == ["0"]
@@ -0,0 +1,57 @@
+import asyncio
+import json
+import operator
+import os
+import threading
+import time
+
+import pytest
+from dask.distributed import Security
+from distributed.comm import connect
+
+from anim.server import read_state, serve, server_client, stop
+
+
+class Test_Server:
+    def test_no_server(self, tmp_path):
+        state = str(tmp_path / "server.json")
+        assert read_state(state) is None
+        with pytest.raises(RuntimeError, match="anim serve"):
+            server_client(state)
+
+    def test_read_state(self, tmp_path):
+        state = tmp_path / "server.json"
+        state.write_text(json.dumps(dict(address="tls://127.0.0.1:1", pid=1)))
+        assert read_state(str(state))["address"] == "tls://127.0.0.1:1"
+        with pytest.raises(RuntimeError, match="no credentials"):
+            server_client(str(state), timeout=0.5)
+
+        security = Security.temporary()
+        tls = dict(ca=security.tls_ca_file, cert=security.tls_client_cert, key=security.tls_client_key)
+        state.write_text(json.dumps(dict(address="tls://127.0.0.1:1", pid=1, tls=tls)))
+        with pytest.raises(RuntimeError, match="not reachable"):
+            server_client(str(state), timeout=0.5)
+
+    def test_serve(self, tmp_path):
+        state = str(tmp_path / "server.json")
+        server = threading.Thread(target=serve, kwargs=dict(nprocess=1, port=0, state=state), daemon=True)
+        server.start()
+        t0 = time.time()
+        while read_state(state) is None and time.time() - t0 < 60:
+            time.sleep(0.1)
+
+        info = read_state(state)
+        assert info["address"].startswith("tls://")
+        # credentials are only readable by the user
+        assert os.stat(state).st_mode & 0o777 == 0o600
+        # connections without the certificate are refused
+        with pytest.raises(OSError):
+            asyncio.run(connect(info["address"].replace("tls://", "tcp://"), timeout=2))
+
+        with server_client(state) as client:
+            assert client.submit(operator.add, 1, 2).result() == 3
+
+        stop(state)
+        server.join(30)
+        assert not server.is_alive()
+        assert read_state(state) is None
@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from anim.data import Stats, StatStorage, load_frame_costs
+from anim.shard import _gather_stats, merge, parse_frames, shard_frames
+from anim.store import FrameStore
+
+
+def save_stats(folder, frames, cost=1.0):
+    os.makedirs(folder, exist_ok=True)
+    storage = StatStorage()
+    for i in frames:
+        storage(Stats(img_name=str(i), frame=i, img_building=cost))
+    storage.save(os.path.join(folder, "stats.csv"))
+
+
+class Test_Shard:
+    def test_parse_frames(self):
+        assert parse_frames("10:20") == slice(10, 20)
+        assert parse_frames(":20") == slice(None, 20)
+        with pytest.raises(ValueError):
+            parse_frames("10")
+
+    def test_shard_frames(self):
+        assert [shard_frames(f"{k}/3", 10) for k in (1, 2, 3)] == [slice(0, 4), slice(4, 8), slice(8, 10)]
+        # blocks of whole images with a stride
+        assert shard_frames("2/2", 10, stride=4) == slice(8, 10)
+        with pytest.raises(ValueError):
+            shard_frames("0/3", 10)
+        with pytest.raises(ValueError):
+            shard_frames("1/3", None)
+
+
+class Test_Merge:
+    def test_images(self, tmp_path):
+        for folder, indices in (("a", range(0, 2)), ("b", range(2, 4))):
+            (tmp_path / folder / "imgs").mkdir(parents=True)
+            for i in indices:
+                (tmp_path / folder / "imgs" / f"img_{i:01d}.png").write_text(str(i))
+
+        work = str(tmp_path / "work")
+        assert merge(work, 10, 4, folders=[str(tmp_path / "a")], no_convert=True) is None
+        assert merge(work, 10, 4, folders=[str(tmp_path / "b")], no_convert=True) is not None
+        assert (tmp_path / "work" / "imgs" / "img_3.png").read_text() == "3"
+
+    def test_frame_store(self, tmp_path):
+        img = np.ones((2, 2, 4), dtype=np.uint8)
+        for folder, i in (("a", 0), ("b", 1)):
+            FrameStore(str(tmp_path / folder / "frames"), 2).write(i, img * i)
+
+        work = str(tmp_path / "work")
+        folders = [str(tmp_path / "a"), str(tmp_path / "b")]
+        assert merge(work, 10, 2, folders=folders, frame_store=True, no_convert=True) is not None
+        np.testing.assert_array_equal(FrameStore(str(tmp_path / "work" / "frames"), 2)[1], img)
+
+    def test_stats(self, tmp_path):
+        work, shard = str(tmp_path / "work"), str(tmp_path / "a")
+        save_stats(work, range(4))
+        save_stats(shard, [2, 3], cost=5.0)
+        _gather_stats([shard], work)
+        # stats of shards are more recent
+        assert load_frame_costs(os.path.join(work, "stats.csv")) == {0: 1, 1: 1, 2: 5, 3: 5}
+
+    def test_stats_concurrent(self, tmp_path):
+        # a shard still saving its stats in the work folder while they are merged
+        work = str(tmp_path / "work")
+        folders = [str(tmp_path / name) for name in "abc"]
+        for k, folder in enumerate(folders):
+            save_stats(folder, range(k, 30, 3))
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            gathered = pool.starmap_async(_gather_stats, [(folders, work)] * 3)
+            pool.starmap(save_stats, [(work, range(30 + k, 60, 3)) for k in range(3)])
+            gathered.get()
+        assert sorted(load_frame_costs(os.path.join(work, "stats.csv"))) == list(range(60))
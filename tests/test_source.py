@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from anim.data import load_data
+from anim.source import DataSource, Selection
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = str(tmp_path / "data.zarr")
+    ds = xr.Dataset({"z": (("time", "x"), np.arange(12.0).reshape(4, 3))}, coords={"time": np.arange(4) * 10})
+    ds.to_zarr(path)
+    return path
+
+
+class Test_DataSource:
+    def test_engine(self, store):
+        assert DataSource(store).engine == "zarr"
+
+    def test_build_from_dataset(self, store):
+        source = DataSource.build(xr.open_zarr(store), dim="time")
+        assert source.path == store
+        assert source.size == 4
+
+    def test_build_from_subset(self, store):
+        ds = xr.open_zarr(store)
+        # workers would read the whole file
+        for subset in (ds.isel(time=slice(2, None)), ds.sel(time=[30, 0, 10, 20]), ds[[]]):
+            with pytest.raises(ValueError, match="differs from the file"):
+                DataSource.build(subset)
+        with pytest.raises(ValueError, match="differs from the file"):
+            DataSource.build(xr.open_zarr(store, drop_variables=["z"]))
+
+    def test_build_from_memory(self):
+        with pytest.raises(ValueError):
+            DataSource.build(xr.Dataset())
+
+    def test_open_once(self, store):
+        source = DataSource(store)
+        assert source.open() is DataSource(store).open()
+
+    def test_compute(self, store):
+        assert list(DataSource(store).compute()) == [0, 1, 2, 3]
+
+
+class Test_Selection:
+    def test_indice(self, store):
+        ds, stats = load_data(Selection(DataSource(store), 2))
+        np.testing.assert_array_equal(ds.z.values, [6, 7, 8])
+        assert not np.isnan(stats.time_data_read)
+
+    def test_sel(self, store):
+        ds = Selection(DataSource(store), dict(time=30)).load()
+        np.testing.assert_array_equal(ds.z.values, [9, 10, 11])
@@ -0,0 +1,52 @@
+import multiprocessing
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from anim.store import FrameStore, store2video
+
+
+def write_images(store, indices):
+    for i in indices:
+        store.write(i, np.full((3, 5, 4), i, dtype=np.uint8))
+
+
+class Test_FrameStore:
+    def test_write(self, tmp_path):
+        store = FrameStore(str(tmp_path / "frames"), n_images=4)
+        assert not store.is_done(0)
+        assert store.done.size == 0
+
+        img = np.random.randint(0, 255, size=(3, 5, 4), dtype=np.uint8)
+        store.write(2, img)
+        assert store.shape == (4, 3, 5, 4)
+
+        # another worker
+        other = pickle.loads(pickle.dumps(store))
+        assert other.is_done(2) and not other.is_done(1)
+        np.testing.assert_array_equal(other[2], img)
+        other.write(0, img)
+        assert list(store.done) == [0, 2]
+
+        with pytest.raises(ValueError):
+            store.write(1, img[:2])
+
+        store.clear()
+        assert not store.exists()
+
+    def test_workers(self, tmp_path):
+        # a lock file left by a crashed worker doesn't block the store creation
+        os.makedirs(tmp_path / "frames")
+        (tmp_path / "frames" / "frames.lock").touch()
+        store = FrameStore(str(tmp_path / "frames"), n_images=40)
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            pool.starmap(write_images, [(store, range(k, 40, 4)) for k in range(4)])
+        assert list(store.done) == list(range(40))
+        for i in range(40):
+            assert (store[i] == i).all()
+
+    def test_empty_video(self, tmp_path):
+        store = FrameStore(str(tmp_path / "frames"), n_images=4)
+        assert store2video(store, 24, str(tmp_path / "video.mp4")) is None
@@ -0,0 +1,117 @@
+import pytest
+
+from anim.anim import frame_priorities
+from anim.tools import FrameIterator, Prefetch, _existing_images, preview_video, stratum
+
+
+class Test_Stratified:
+    def test_stratum(self):
+        assert [stratum(i, levels=3) for i in range(9)] == [3, 0, 1, 0, 2, 0, 1, 0, 3]
+
+    def test_priorities(self, tmp_path):
+        priorities = frame_priorities(str(tmp_path / "stats.csv"), "stratified", stride=2)
+        assert priorities(128) > priorities(64) > priorities(4) > priorities(2)
+
+
+class Test_Preview:
+    def test_existing_images(self, tmp_path):
+        for i in (0, 2, 10):
+            (tmp_path / f"img_{i:03d}.png").touch()
+        (tmp_path / "other.png").touch()
+        assert _existing_images(str(tmp_path / "img_%03d.png")) == {0, 2, 10}
+
+    def test_not_enough_images(self, tmp_path):
+        (tmp_path / "img_001.png").touch()
+        patern = str(tmp_path / "img_%03d.png")
+        assert preview_video(patern, 24, str(tmp_path / "preview.mp4"), n_images=100, levels=2) is None
+        assert preview_video(str(tmp_path / "empty_%03d.png"), 24, str(tmp_path / "preview.mp4")) is None
+
+
+class Test_FrameIterator:
+    def test_start(self):
+        computed = []
+
+        def compute(start=0):
+            for i in range(start, 10):
+                computed.append(i)
+                yield i
+
+        frames = FrameIterator(compute)
+        frames.seek(5)
+        assert next(frames) == 5
+        frames.seek(2)
+        assert next(frames) == 2
+        assert computed == [5, 2]
+
+    def test_skip(self):
+        computed = []
+
+        class Frames:
+            i = 0
+
+            def __iter__(self):
+                return self
+
+            def __next__(self):
+                computed.append(self.i)
+                self.i += 1
+                return self.i - 1
+
+            def skip(self, n):
+                self.i += n
+
+        frames = FrameIterator(Frames)
+        frames.seek(7)
+        assert next(frames) == 7
+        assert computed == [7]
+
+    def test_generator(self):
+        frames = FrameIterator(lambda: iter(range(10)))
+        frames.seek(3)
+        assert next(frames) == 3
+        frames.seek(1)
+        assert next(frames) == 1
+
+
+class Test_Prefetch:
+    def test_order(self):
+        with Prefetch(iter(range(20)), size=3) as frames:
+            assert list(frames) == list(range(20))
+            assert next(frames, None) is None
+
+    def test_error(self):
+        def compute():
+            yield 1
+            raise KeyError("broken")
+
+        with Prefetch(compute(), size=2) as frames:
+            assert next(frames) == 1
+            with pytest.raises(KeyError):
+                next(frames)
+
+    def test_bounded(self):
+        computed = []
+
+        def compute():
+            for i in range(100):
+                computed.append(i)
+                yield i
+
+        frames = Prefetch(compute(), size=2)
+        assert next(frames) == 0
+        frames.close()
+        # the thread stops once the queue is full : the whole generator is not consumed
+        assert len(computed) < 10
+
+    def test_close(self):
+        closed = []
+
+        def compute():
+            try:
+                yield from range(100)
+            finally:
+                closed.append(True)
+
+        with Prefetch(compute(), size=2) as frames:
+            assert next(frames) == 0
+        assert closed == [True]
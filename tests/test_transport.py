@@ -0,0 +1,117 @@
+import numpy as np
+import xarray as xr
+
+from anim.transport import CacheTransport, Delta, apply_delta, assemble_dataset, compute_delta, hash_variable
+
+
+def window(i, size=10):
+    x = np.sin(np.arange(i, i + size) / 3)
+    return xr.Dataset({"x": ("size", x), "static": ("other", np.arange(5))}, coords={"size": np.arange(size)})
+
+
+class FakeClient:
+    """scattered data are kept in `data`, tasks are run right away"""
+
+    def __init__(self):
+        self.data = dict()
+
+    def scatter(self, values, hash=True):
+        futures = [object() for _ in values]
+        self.data.update(zip(map(id, futures), values))
+        return futures
+
+    def submit(self, func, variables, *args):
+        variables = {k: self.data.get(id(v), v) for k, v in variables.items()}
+        return func(variables, *args)
+
+
+class Test_Delta:
+    def test_shift(self):
+        previous, ds = window(0), window(1)
+        delta = compute_delta(previous, ds)
+
+        assert isinstance(delta, Delta)
+        assert list(delta.changes) == ["x"]
+        assert delta.changes["x"][:2] == ("shift", 1)
+        xr.testing.assert_identical(apply_delta(previous, delta), ds)
+
+    def test_rows(self):
+        previous = window(0)
+        ds = previous.copy(deep=True)
+        ds["x"][3] = 42
+
+        delta = compute_delta(previous, ds)
+        assert delta.changes["x"][0] == "rows"
+        xr.testing.assert_identical(apply_delta(previous, delta), ds)
+
+    def test_nan(self):
+        previous = window(0)
+        previous["x"][:] = np.nan
+        delta = compute_delta(previous, previous.copy(deep=True))
+        assert delta.changes == dict()
+
+    def test_empty(self):
+        # no observation in this frame
+        previous = xr.Dataset({"x": (("obs", "y"), np.zeros((0, 5)))})
+        delta = compute_delta(previous, previous.copy(deep=True))
+        assert delta.changes == dict()
+        xr.testing.assert_identical(apply_delta(previous, delta), previous)
+
+    def test_structure_changed(self):
+        previous, ds = window(0), window(1, size=12)
+        delta = compute_delta(previous, ds)
+        assert delta.changes["x"][0] == "full"
+        xr.testing.assert_identical(apply_delta(previous, delta), ds)
+
+    def test_first_frame(self):
+        ds = window(0)
+        assert compute_delta(None, ds) is ds
+        assert apply_delta(None, ds) is ds
+
+
+class Test_Cache:
+    def test_hash(self):
+        ds = window(0)
+        assert hash_variable(ds["static"].variable) == hash_variable(window(1)["static"].variable)
+        assert hash_variable(ds["x"].variable) != hash_variable(window(1)["x"].variable)
+
+    def test_hash_attrs(self):
+        var = window(0)["x"].variable
+        other = var.copy()
+        other.attrs["units"] = "m"
+        assert hash_variable(var) != hash_variable(other)
+
+    def test_assemble(self):
+        ds = window(0)
+        xr.testing.assert_identical(assemble_dataset(dict(ds.variables), list(ds.coords), ds.attrs), ds)
+
+    def test_hash_datetime(self):
+        time = xr.Variable("time", np.arange("2020-01-01", "2020-01-11", dtype="datetime64[D]").astype("M8[ns]"))
+        assert hash_variable(time) == hash_variable(time.copy())
+        assert hash_variable(time) != hash_variable(time + np.timedelta64(1, "h"))
+        assert hash_variable(time - time[0]) != hash_variable(time - time[1])
+
+    def test_hits(self):
+        client, transport = FakeClient(), CacheTransport(min_size=0)
+        transport.setup(client, 10)
+        ds, _, stats = transport.send(client, 0, window(0))
+        xr.testing.assert_identical(ds, window(0))
+        assert (stats.cache_hits, stats.cache_misses) == (0, 3)
+
+        # only `x` changes
+        ds, _, stats = transport.send(client, 1, window(1))
+        xr.testing.assert_identical(ds, window(1))
+        assert (stats.cache_hits, stats.cache_misses) == (2, 1)
+
+    def test_eviction(self):
+        client = FakeClient()
+        size = sum(var.nbytes for var in window(0).variables.values())
+        transport = CacheTransport(max_memory=size, min_size=0)
+        transport.setup(client, 10)
+        transport.send(client, 0, window(0))
+        transport.send(client, 1, window(1))
+        # `x` of the first frame is the least recently used
+        assert transport.cache.memory <= size
+        assert len(transport.cache) == 3
+        _, _, stats = transport.send(client, 0, window(0))
+        assert (stats.cache_hits, stats.cache_misses) == (2, 1)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas
+
+from anim.anim import calibration_frames
+from anim.tuning import calibration_size, choose_layout
+
+
+def calibration(rss_mo, pyplot, image_mo=0):
+    return pandas.DataFrame(
+        {
+            "building (s)": [0.1, 0.2],
+            "saving (s)": [0.1, 0.1],
+            "rss_before (Mo)": [rss_mo - image_mo, rss_mo / 2 - image_mo],
+            "rss_after (Mo)": [rss_mo, rss_mo / 2],
+            "pyplot figure": [float(pyplot)] * 2,
+        }
+    )
+
+
+class Test_ChooseLayout:
+    def test_cpu_bound(self):
+        assert choose_layout(calibration(100, True), n_cpu=8, memory_budget=8e9) == (8, 1)
+
+    def test_memory_bound_pyplot(self):
+        assert choose_layout(calibration(2000, True), n_cpu=8, memory_budget=4e9) == (2, 1)
+
+    def test_memory_bound_threads(self):
+        assert choose_layout(calibration(2000, False), n_cpu=8, memory_budget=4e9) == (2, 4)
+
+    def test_memory_by_thread(self):
+        # 2 workers of 2Go, each thread needs 500Mo more : 2 threads fit in 2.5Go
+        assert choose_layout(calibration(2000, False, image_mo=500), n_cpu=8, memory_budget=5e9) == (2, 2)
+
+    def test_no_measurement(self):
+        # images already built : stats are empty
+        df = calibration(2000, False).map(lambda x: np.nan)
+        assert choose_layout(df, n_cpu=8, memory_budget=1e9) == (8, 1)
+
+    def test_not_enough_memory(self):
+        assert choose_layout(calibration(2000, True), n_cpu=8, memory_budget=1e9) == (1, 1)
+
+
+def test_calibration_size():
+    assert calibration_size(max_frames=2) == 2
+    assert calibration_size() >= 4
+
+
+def test_calibration_frames(tmp_path):
+    # images already built are not used for the calibration
+    for i in (0, 2):
+        (tmp_path / f"img_{i:02d}.png").touch()
+    assert calibration_frames(str(tmp_path), 20, 3) == [1, 3, 4]
+    assert calibration_frames(str(tmp_path), 20, 3, stride=2) == [2, 6, 8]
+    assert calibration_frames(str(tmp_path), 20, 3, frames=slice(3, 5)) == [3, 4]
+    assert calibration_frames(str(tmp_path), 20, 3, frames=slice(None, 3)) == [1]
@@ -0,0 +1,46 @@
+import os
+import threading
+import time
+
+import anim.anim
+from anim.watch import default_sample, watch
+
+
+class Test_Watch:
+    def test_default_sample(self):
+        assert default_sample(None) == [0]
+        assert default_sample(101) == [0, 50, 100]
+        assert default_sample(1) == [0]
+
+    def test_cancel(self, tmp_path, monkeypatch):
+        script = tmp_path / "script.py"
+        script.write_text("a = 1")
+        renders = []
+
+        def animate(**kwargs):
+            renders.append(kwargs)
+            kwargs["cancel"].wait(5)
+
+        monkeypatch.setattr(anim.anim, "animate", animate)
+
+        loads = []
+
+        def load(pythonfile):
+            loads.append(pythonfile)
+            if len(loads) == 3:
+                raise KeyboardInterrupt
+            return dict(max_frames=10)
+
+        def edit():
+            t = time.time_ns()
+            for i in range(2):
+                time.sleep(0.3)
+                os.utime(script, ns=(t, t + (i + 1) * 10**9))
+
+        threading.Thread(target=edit).start()
+        watch(str(script), load, client=None, interval=0.01)
+
+        assert len(renders) == 2
+        assert renders[0]["sample"] == [0, 5, 9]
+        # the first render is cancelled by the modification, the last one when watching stops
+        assert all(r["cancel"].is_set() for r in renders)